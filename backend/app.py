@@ -6,12 +6,11 @@ from flask_jwt_extended import JWTManager
 
 load_dotenv(Path(__file__).parent / '.env')  # explicit path
 
-from flask import Flask, render_template, request, jsonify, make_response, send_file
+from flask import Flask, render_template, request, jsonify, make_response, send_file, Response, stream_with_context
 import requests
 from message import send_email
 from flask_migrate import Migrate
 from flask_cors import CORS
-from weasyprint import HTML
 from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
 from db import db
@@ -22,11 +21,26 @@ from business import Businesses
 from invoices import InvoiceOperations
 from notifications import Notifications
 from notification_utils import create_user_notification
+from render_cache import create_render_cache_from_env, make_render_key
+from render_pool import RenderPool
+from invoice_totals import compute_totals, line_amount, to_decimal
+from logo_store import create_logo_store_from_env
+import pdf_renderer
+import preview_engine
+import url_fetcher
+import invoice_export
+import invoice_projection
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as RenderTimeoutError, CancelledError as RenderCancelledError
+from preview_sessions import PreviewSessionStore, PatchError, ResyncRequired
+from dashboard_rollups import register_rollup_maintenance
+from user_loader import load_user, register_user_cache_invalidation
+from event_stream import register_event_publishing
+from email_outbox import enqueue_email, format_outbox_response
 from io import BytesIO
-import tempfile
-from pdf2image import convert_from_bytes
-import ssl, certifi, os, logging
+import os, logging
 import uuid
+import copy
 from functools import lru_cache
 from supabase import create_client, Client
 import base64
@@ -36,6 +50,9 @@ from sib_api_v3_sdk.rest import ApiException
 from routes.dashboard import dashboard_bp
 from routes.paystack import paystack_bp
 from routes.billing import billing_bp
+from routes.search import search_bp
+from routes.events import events_bp
+from routes.emails import emails_bp
 
 logging.basicConfig(level=logging.DEBUG)
 
@@ -55,6 +72,9 @@ app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv(
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 db.init_app(app)
+register_rollup_maintenance()
+register_user_cache_invalidation()
+register_event_publishing()
 
 @app.teardown_appcontext
 def shutdown_session(exception=None):
@@ -105,6 +125,28 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.register_blueprint(dashboard_bp)
 app.register_blueprint(paystack_bp)
 app.register_blueprint(billing_bp)
+app.register_blueprint(search_bp)
+app.register_blueprint(events_bp)
+app.register_blueprint(emails_bp)
+
+# Rendered PDF cache shared by /generate-invoice requests in this worker
+render_cache = create_render_cache_from_env()
+
+# WeasyPrint runs in worker processes so web workers stay free for JSON routes
+render_pool = RenderPool(render_cache=render_cache)
+# Live editor previews; debouncing needs concurrent requests per worker (gthread)
+preview_sessions = PreviewSessionStore()
+
+# Merged-PDF exports render in a single worker, so they get a longer wait
+RENDER_EXPORT_TIMEOUT = float(os.getenv('RENDER_EXPORT_TIMEOUT', 300))
+
+# Logos are downloaded once per URL and handed to WeasyPrint as local files
+logo_store = create_logo_store_from_env()
+
+
+def invoice_template_path(template_name):
+    """Absolute path of a template in the app's template folder"""
+    return os.path.join(app.root_path, app.template_folder, template_name)
 
 @app.after_request
 def after_request(response):
@@ -124,13 +166,20 @@ def upload_logo():
 
     try:
         # Upload the file - this will raise an exception if it fails
+        logo_bytes = logo.read()
         supabase.storage.from_(os.environ['SUPABASE_BUCKET']).upload(
-            file_name, logo.read(), {"content-type": logo.content_type}
+            file_name, logo_bytes, {"content-type": logo.content_type}
         )
 
         # If upload succeeds, generate the public URL
         logo_url = f"{os.environ['SUPABASE_URL']}/storage/v1/object/public/{os.environ['SUPABASE_BUCKET']}/{file_name}"
 
+        # Seed the logo cache so the first render does not download it back
+        try:
+            logo_store.put(logo_url, logo_bytes, logo.content_type)
+        except OSError as e:
+            app.logger.warning(f"Failed to cache uploaded logo: {e}")
+
         return jsonify({'message': 'Logo uploaded successfully', 'logo_url': logo_url}), 200
 
     except Exception as e:
@@ -168,52 +217,29 @@ def parse_invoice_data(data):
         raise ValueError(f"Missing required fields: {', '.join(missing)}")
 
     items = data['items']
-    subtotal = 0
     items_with_subtotals = []
 
     for item in items:
-        qty = float(item.get('quantity', 0) or 0)
-        cost = float(item.get('unit_cost', 0) or 0)
-        sub = qty * cost
-        item['subtotal'] = sub
+        item['subtotal'] = float(line_amount(item))
         item['description'] = item.get('description', '')
         items_with_subtotals.append(item)
-        subtotal += sub
 
-    # Tax
     tax_percent = float(data.get('tax_percent', 0) or 0)
     tax_type = data.get('tax_type', 'percent')
     show_tax = data.get('show_tax', False)
 
-    if show_tax:
-        if tax_type == 'percent':
-            tax_amount = subtotal * (tax_percent / 100)
-        else:
-            tax_amount = tax_percent
-    else:
-        tax_amount = 0
-
-    # Discount
     discount_percent = float(data.get('discount_percent', 0) or 0)
     discount_type = data.get('discount_type', 'percent')
     show_discount = data.get('show_discount', False)
 
-    if show_discount:
-        if discount_type == 'percent':
-            discount_amount = subtotal * (discount_percent / 100)
-        else:
-            discount_amount = discount_percent
-    else:
-        discount_amount = 0
-
-    # Shipping
-    shipping_amount = float(data.get('shipping_amount', 0) or 0)
     show_shipping = data.get('show_shipping', False)
 
-    if not show_shipping:
-        shipping_amount = 0
-
-    total = subtotal + tax_amount - discount_amount + shipping_amount
+    totals = compute_totals(data).as_floats()
+    subtotal = totals['subtotal']
+    tax_amount = totals['tax_amount']
+    discount_amount = totals['discount_amount']
+    shipping_amount = totals['shipping_amount']
+    total = totals['total']
 
     invoice_number = data.get('invoice_number', f"INV-{datetime.now().strftime('%Y%m%d-%H%M%S')}")
     issued_date = format_date(data.get('issued_date'), datetime.now().strftime('%b %d, %Y'))
@@ -308,140 +334,391 @@ def parse_invoice_data(data):
 #         logging.exception("Error in preview_invoice")
 #         return jsonify({'error': str(e)}), 500
 
+INVOICE_TEMPLATE = 'invoice_template4.html'
+PREVIEW_JOB_PREFIX = 'preview-'  # preview PNG jobs and cache entries; their bytes are not a PDF
+
+
+def prepare_invoice_render(data, template_name=INVOICE_TEMPLATE):
+    """
+    Parse invoice JSON, resolve the logo and render the HTML for WeasyPrint.
+
+    Returns (template_data, html, cache_key).
+    """
+    template_data = parse_invoice_data(data)
+
+    # Point WeasyPrint at the cached copy of the logo instead of the remote URL
+    logo_digest = None
+    if template_data.get('logo_url'):
+        try:
+            logo = logo_store.get(template_data['logo_url'])
+            template_data['logo_url'] = logo.url
+            logo_digest = logo.digest
+        except Exception as e:
+            app.logger.warning(f"Failed to fetch logo: {e}")
+            # Keep original URL as fallback
+
+    # Identical invoices map to the same key, so repeat downloads skip WeasyPrint
+    cache_key = make_render_key(template_data, invoice_template_path(template_name), logo_digest)
+    html = render_template(template_name, **template_data)
+    return template_data, html, cache_key
+
+
+def pdf_response(pdf, filename):
+    """PDF download response with Safari-compatible headers"""
+    response = make_response(pdf)
+    response.headers['Content-Type'] = 'application/pdf'
+
+    # RFC 5987 encoding for UTF-8 filenames (Safari compatible)
+    from urllib.parse import quote
+    encoded_filename = quote(filename, safe='')
+    response.headers['Content-Disposition'] = f"attachment; filename=\"{filename}\"; filename*=UTF-8''{encoded_filename}"
+
+    # Safari-specific headers
+    response.headers['Cache-Control'] = 'no-cache, must-revalidate'
+    response.headers['Pragma'] = 'no-cache'
+    response.headers['Content-Length'] = len(pdf)
+    response.headers['Content-Transfer-Encoding'] = 'binary'
+    return response
+
+
+def render_timeout_response(job_id):
+    return jsonify({
+        'error': 'Rendering is taking longer than expected',
+        'job_id': job_id,
+        'status_url': f"/api/render-jobs/{job_id}"
+    }), 504
+
+
 @app.route('/preview-invoice', methods=['POST'])
 def preview_invoice():
-    temp_files = []  # Store temporary files to clean up later
+    """
+    POST /preview-invoice            -> PNG of the first page
+    POST /preview-invoice?format=html -> rendered invoice HTML, no PDF/PNG work;
+                                         cheap enough to show while the PNG renders
+    """
+    job_id = None
 
     try:
         data = request.get_json()
         app.logger.debug(f"[PREVIEW] Received data: {data}")
-        template_data = parse_invoice_data(data)
 
-        # Download and replace external logo URLs with local file paths
-        if 'logo_url' in template_data and template_data['logo_url']:
-            try:
-                logo_path = download_image_for_weasyprint(template_data['logo_url'])
-                temp_files.append(logo_path)
-                template_data['logo_url'] = logo_path
-                app.logger.debug(f"Downloaded logo to: {logo_path}")
-            except Exception as e:
-                app.logger.warning(f"Failed to download logo: {e}")
-                # Keep original URL as fallback
-
-        # Render HTML template into PDF (intermediate step)
-        html = render_template('invoice_template4.html', **template_data)
-
-        ssl_context = ssl.create_default_context(cafile=certifi.where())
-        pdf_io = BytesIO()
-        HTML(
-            string=html,
-            base_url=os.path.dirname(os.path.abspath(__file__))
-        ).write_pdf(pdf_io, ssl_context=ssl_context)
-        pdf_io.seek(0)
-
-        # ✅ Convert PDF (first page only) into image
-        images = convert_from_bytes(pdf_io.read(), dpi=150)
-        img_io = BytesIO()
-        images[0].save(img_io, format="PNG")
-        img_io.seek(0)
-
-        # ✅ Clean up temporary logo files
-        for temp_file in temp_files:
-            try:
-                os.unlink(temp_file)
-            except:
-                pass
+        if request.args.get('format') == 'html':
+            # Keep the public logo URL so the browser can load it
+            html = render_template(INVOICE_TEMPLATE, **parse_invoice_data(data))
+            response = make_response(html)
+            response.headers['Content-Type'] = 'text/html; charset=utf-8'
+            return response
+
+        template_data, html, cache_key = prepare_invoice_render(data)
+
+        # First page only, rasterized once on the pool; the PNG is cached like PDFs
+        job_id = f"{PREVIEW_JOB_PREFIX}{cache_key}"
+        png = render_cache.get(job_id)
+        if png is None:
+            png = render_pool.render(job_id, html, render=preview_engine.render_preview_png)
 
         # ✅ Return PNG instead of PDF
-        return send_file(
-            img_io,
-            mimetype='image/png',
-            as_attachment=False,
-            download_name="invoice_preview.png"
-        )
+        return preview_png_response(png)
 
+    except RenderTimeoutError:
+        return render_timeout_response(job_id)
     except Exception as e:
-        # Clean up temporary files even if error occurs
-        for temp_file in temp_files:
-            try:
-                os.unlink(temp_file)
-            except:
-                pass
         logging.exception("Error in preview_invoice")
         return jsonify({'error': str(e)}), 500
 
 
+def preview_png_response(png):
+    return send_file(
+        BytesIO(png),
+        mimetype='image/png',
+        as_attachment=False,
+        download_name="invoice_preview.png"
+    )
+
+
+def preview_superseded_response(session):
+    response = make_response('', 204)
+    response.headers['X-Preview-Superseded'] = 'true'
+    if session.revision is not None:
+        response.headers['X-Preview-Revision'] = str(session.revision)
+    return response
+
+
+@app.route('/api/preview-sessions/<session_id>', methods=['POST'])
+def update_preview_session(session_id):
+    """
+    POST /api/preview-sessions/<session_id>
+    Body: {"data": {...invoice...}, "revision": 1}
+       or {"patch": <RFC 7396 object | RFC 6902 array>, "base_revision": 1, "revision": 2}
+
+    200 image/png - preview of the latest revision (X-Preview-Revision)
+    204           - superseded by a newer update within the debounce window
+    409           - this worker does not hold base_revision; resend "data"
+    """
+    job_id = None
+    session = None
+
+    try:
+        body = request.get_json() or {}
+        if body.get('data') is None and body.get('patch') is None:
+            return jsonify({'success': False, 'error': "Either 'data' or 'patch' is required"}), 400
+
+        try:
+            session, generation = preview_sessions.update(
+                session_id,
+                data=body.get('data'),
+                patch=body.get('patch'),
+                revision=body.get('revision'),
+                base_revision=body.get('base_revision')
+            )
+        except ResyncRequired:
+            return jsonify({
+                'success': False,
+                'error': 'Preview session is out of sync, resend the full invoice',
+                'resync': True
+            }), 409
+        except PatchError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+
+        # Coalesce bursts: only the request carrying the latest edit renders
+        if not preview_sessions.wait_until_quiet(session, generation):
+            return preview_superseded_response(session)
+
+        # parse_invoice_data() edits items in place; the session's document must stay as the client sent it
+        data = copy.deepcopy(session.data)
+        data_hash = session.data_hash
+        png = session.png if session.rendered_hash == data_hash else None
+        cache_status = 'SESSION'
+
+        if png is None:
+            template_data, html, cache_key = prepare_invoice_render(data)
+
+            job_id = f"{PREVIEW_JOB_PREFIX}{cache_key}"
+            png = render_cache.get(job_id)
+            cache_status = 'HIT'
+            if png is None:
+                # A newer edit makes the previous render pointless
+                if session.job_id and session.job_id != job_id:
+                    render_pool.cancel(session.job_id)
+                session.job_id = job_id
+                png = render_pool.render(job_id, html, render=preview_engine.render_preview_png)
+                cache_status = 'MISS'
+
+            if preview_sessions.is_current(session, generation):
+                session.png, session.rendered_hash = png, data_hash
+
+        response = preview_png_response(png)
+        response.headers['X-Render-Cache'] = cache_status
+        if session.revision is not None:
+            response.headers['X-Preview-Revision'] = str(session.revision)
+        return response
+
+    except RenderCancelledError:
+        return preview_superseded_response(session)
+    except RenderTimeoutError:
+        return render_timeout_response(job_id)
+    except Exception as e:
+        logging.exception("Error in update_preview_session")
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/preview-sessions/<session_id>', methods=['DELETE'])
+def delete_preview_session(session_id):
+    """Drop a preview session when the editor closes"""
+    if not preview_sessions.discard(session_id):
+        return jsonify({'success': False, 'error': 'Preview session not found'}), 404
+    return jsonify({'success': True, 'message': 'Preview session closed'})
+
+
 @app.route('/generate-invoice', methods=['POST'])
 def generate_invoice():
-    temp_files = []
-    
+    cache_key = None
+
     try:
         data = request.get_json()
         app.logger.debug(f"[GENERATE] Received data: {data}")
         
-        template_data = parse_invoice_data(data)
-        
-        # Download and replace external image URLs with local file paths
-        if 'logo_url' in template_data and template_data['logo_url']:
-            try:
-                logo_path = download_image_for_weasyprint(template_data['logo_url'])
-                temp_files.append(logo_path)
-                template_data['logo_url'] = logo_path
-            except Exception as e:
-                app.logger.warning(f"Failed to download logo: {e}")
-        
-        # Render the HTML template with invoice data
-        html = render_template('invoice_template4.html', **template_data)
-        
-        # Create SSL context for WeasyPrint
-        ssl_context = ssl.create_default_context(cafile=certifi.where())
-        
-        # Generate PDF with WeasyPrint
-        pdf = HTML(
-            string=html,
-            base_url=os.path.dirname(os.path.abspath(__file__))
-        ).write_pdf(ssl_context=ssl_context)
-        
-        # Clean up temporary files
-        for temp_file in temp_files:
-            try:
-                os.unlink(temp_file)
-            except:
-                pass
-        
-        # Create response with Safari-compatible headers
-        response = make_response(pdf)
-        response.headers['Content-Type'] = 'application/pdf'
-        
-        # Safari requires specific content-disposition formatting
-        filename = f"invoice_{template_data['invoice_number']}.pdf"
-        
-        # RFC 5987 encoding for UTF-8 filenames (Safari compatible)
-        from urllib.parse import quote
-        encoded_filename = quote(filename, safe='')
-        response.headers['Content-Disposition'] = f"attachment; filename=\"{filename}\"; filename*=UTF-8''{encoded_filename}"
-        
-        # Safari-specific headers
-        response.headers['Cache-Control'] = 'no-cache, must-revalidate'
-        response.headers['Pragma'] = 'no-cache'
-        response.headers['Content-Length'] = len(pdf)
-        response.headers['Content-Transfer-Encoding'] = 'binary'
+        template_data, html, cache_key = prepare_invoice_render(data)
+
+        # Thin wrapper over the render pool: wait for the job with a timeout
+        pdf = render_cache.get(cache_key)
+        cache_hit = pdf is not None
+        if pdf is None:
+            pdf = render_pool.render(cache_key, html)
         
+        response = pdf_response(pdf, f"invoice_{template_data['invoice_number']}.pdf")
+        response.headers['X-Render-Cache'] = 'HIT' if cache_hit else 'MISS'
         return response
         
+    except RenderTimeoutError:
+        return render_timeout_response(cache_key)
     except Exception as e:
-        for temp_file in temp_files:
-            try:
-                os.unlink(temp_file)
-            except:
-                pass
         logging.exception("Error in generate_invoice")
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/render-cache/stats', methods=['GET'])
+def get_render_cache_stats():
+    """
+    Hit/miss counters and size of the PDF render cache for this worker, plus
+    the WeasyPrint resource cache of whichever pool worker answers
+    """
+    try:
+        resources = render_pool.call(url_fetcher.resource_cache_stats)
+    except Exception as e:
+        app.logger.warning(f"Could not read resource cache stats: {e}")
+        resources = None
+    return jsonify({'success': True, 'stats': render_cache.stats(), 'resources': resources})
+
+
+@app.route('/api/render-jobs', methods=['POST'])
+def create_render_job():
+    """
+    POST /api/render-jobs
+    Body: same invoice JSON as /generate-invoice.
+    Queues the PDF render and returns immediately with a job id.
+    """
+    try:
+        data = request.get_json()
+        template_data, html, cache_key = prepare_invoice_render(data)
+        filename = f"invoice_{template_data['invoice_number']}.pdf"
+
+        if render_cache.get(cache_key) is not None:
+            status = 'done'
+        else:
+            status = render_pool.submit(cache_key, html, filename=filename).status
+
+        return jsonify({
+            'success': True,
+            'job_id': cache_key,
+            'status': status,
+            'status_url': f"/api/render-jobs/{cache_key}",
+            'pdf_url': f"/api/render-jobs/{cache_key}/pdf"
+        }), 202
+
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        logging.exception("Error in create_render_job")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/render-jobs/<job_id>', methods=['GET'])
+def get_render_job(job_id):
+    """GET /api/render-jobs/<job_id> - queued | running | done | failed | cancelled"""
+    status = render_pool.status(job_id)
+    if status is None:
+        return jsonify({'success': False, 'error': 'Render job not found'}), 404
+    return jsonify({'success': True, 'job': status})
+
+
+@app.route('/api/render-jobs/<job_id>/pdf', methods=['GET'])
+def get_render_job_pdf(job_id):
+    """GET /api/render-jobs/<job_id>/pdf - the rendered PDF once the job is done"""
+    if job_id.startswith(PREVIEW_JOB_PREFIX):
+        # A preview job's result is a PNG; POST the preview again to get it from the cache
+        return jsonify({'success': False, 'error': 'Preview render jobs have no PDF'}), 404
+
+    pdf = render_pool.result(job_id)
+    if pdf is None:
+        status = render_pool.status(job_id)
+        if status is None:
+            return jsonify({'success': False, 'error': 'Render job not found'}), 404
+        return jsonify({'success': False, 'error': 'Render job not finished', 'job': status}), 409
+
+    job = render_pool.get(job_id)
+    filename = job.filename if job and job.filename else 'invoice.pdf'
+    return pdf_response(pdf, filename)
+
+
+def start_export_render(invoice):
+    """Future for one exported invoice's PDF, served from the render cache when possible"""
+    try:
+        # Copy: rendering edits items in place, and invoice.data is the session's identity-mapped value
+        _, html, cache_key = prepare_invoice_render(copy.deepcopy(invoice.data or {}))
+    except Exception as e:
+        future = Future()
+        future.set_exception(e)
+        return future
+
+    cached = render_cache.get(cache_key)
+    if cached is not None:
+        future = Future()
+        future.set_result(cached)
+        return future
+    # Not registered as a job or cached: one-off exports would evict hot entries
+    return render_pool.execute(pdf_renderer.render_pdf, html)
+
+
+@app.route('/api/invoices/export', methods=['POST'])
+def export_invoices():
+    """
+    POST /api/invoices/export
+    Body: {"invoice_ids": [...], "user_id": optional, "format": "zip" | "pdf"}
+       or {"user_id": ..., "status": ..., "date_from": ..., "date_to": ...,
+           "date_field": "issued_date" | "due_date" | "created_at", "format": ...}
+
+    zip: streamed as the PDFs finish rendering (at most EXPORT_MAX_INVOICES)
+    pdf: one merged PDF (at most EXPORT_MERGE_MAX invoices)
+    """
+    try:
+        criteria = invoice_export.parse_export_request(request.get_json())
+        invoice_ids = invoice_export.export_invoice_ids(invoice_export.export_query(criteria))
+
+        if not invoice_ids:
+            return jsonify({'success': False, 'error': 'No invoices match the export'}), 404
+
+        limit = invoice_export.EXPORT_MERGE_MAX if criteria['format'] == 'pdf' else invoice_export.EXPORT_MAX_INVOICES
+        if len(invoice_ids) > limit:
+            return jsonify({
+                'success': False,
+                'error': f"Too many invoices to export at once ({len(invoice_ids)}, max {limit})"
+            }), 400
+
+        stamp = datetime.utcnow().strftime('%Y%m%d-%H%M%S')
+
+        if criteria['format'] == 'pdf':
+            htmls = [prepare_invoice_render(copy.deepcopy(invoice.data or {}))[1]
+                     for invoice in invoice_export.iter_invoices(invoice_ids)]
+            pdf = render_pool.execute(pdf_renderer.render_merged_pdf, htmls).result(
+                timeout=RENDER_EXPORT_TIMEOUT
+            )
+            return pdf_response(pdf, f"invoices_{stamp}.pdf")
+
+        def generate():
+            used_names = set()
+            jobs = (
+                (invoice_export.export_filename(invoice, used_names), lambda invoice=invoice: start_export_render(invoice))
+                for invoice in invoice_export.iter_invoices(invoice_ids)
+            )
+            results = invoice_export.render_windowed(jobs, window=render_pool.max_workers * 2)
+            yield from invoice_export.stream_zip(results)
+
+        filename = f"invoices_{stamp}.zip"
+        response = Response(stream_with_context(generate()), mimetype='application/zip')
+        response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Export-Count'] = str(len(invoice_ids))
+        return response
+
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except RenderTimeoutError:
+        return jsonify({'success': False, 'error': 'Export is taking too long, try a ZIP export instead'}), 504
+    except Exception as e:
+        logging.exception("Error in export_invoices")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 @app.route('/api/send-invoice', methods=['POST'])
 def send_invoice():
-    """Send invoice email using external HTML template"""
+    """
+    Queue the invoice email, built from the external HTML template, for the
+    email worker; 202 with the outbox message id. Retries of this request
+    do not queue the email twice: an Idempotency-Key header is used when
+    sent, otherwise the same email to the same recipient is deduplicated
+    for EMAIL_DEDUP_WINDOW seconds.
+    """
     data = request.get_json()
 
     email = data.get('email')
@@ -456,8 +733,7 @@ def send_invoice():
     if not invoice_data:
         return jsonify({"success": False, "error": "Invoice data required"}), 400
 
-    print(f"📧 Sending invoice to: {email}")
-    print(f"Invoice: {invoice_data.get('data', {}).get('invoice_number', 'N/A')}")
+    logging.info(f"Sending invoice {invoice_data.get('data', {}).get('invoice_number', 'N/A')} to {email}")
 
     try:
         # Extract invoice details
@@ -488,18 +764,14 @@ def send_invoice():
         formatted_issued_date = format_date(issued_date)
         formatted_due_date = format_date(due_date)
 
-        # Calculate totals
-        subtotal = sum(item.get('quantity', 0) * item.get('unit_cost', 0) for item in items)
+        # Calculate totals (same rules as the PDF)
+        totals = compute_totals(invoice_details)
+        subtotal = totals.subtotal
 
-        # Calculate discount amount
-        discount_amount = 0
+        # Discount section
+        discount_amount = totals.discount_amount
         discount_section = ""
-        if invoice_details.get('show_discount') and invoice_details.get('discount_percent'):
-            if invoice_details.get('discount_type') == 'percent':
-                discount_amount = (subtotal * invoice_details.get('discount_percent')) / 100
-            else:
-                discount_amount = invoice_details.get('discount_percent', 0)
-
+        if discount_amount:
             discount_percent_display = f"({invoice_details.get('discount_percent')}%)" if invoice_details.get(
                 'discount_type') == 'percent' else ""
             discount_section = f"""
@@ -509,16 +781,10 @@ def send_invoice():
                 </div>
             """
 
-        # Calculate tax amount
-        tax_amount = 0
+        # Tax section
+        tax_amount = totals.tax_amount
         tax_section = ""
-        if invoice_details.get('show_tax') and invoice_details.get('tax_percent'):
-            amount_after_discount = subtotal - discount_amount
-            if invoice_details.get('tax_type') == 'percent':
-                tax_amount = (amount_after_discount * invoice_details.get('tax_percent')) / 100
-            else:
-                tax_amount = invoice_details.get('tax_percent', 0)
-
+        if tax_amount:
             tax_percent_display = f"({invoice_details.get('tax_percent')}%)" if invoice_details.get(
                 'tax_type') == 'percent' else ""
             tax_section = f"""
@@ -528,11 +794,10 @@ def send_invoice():
                 </div>
             """
 
-        # Calculate shipping amount
-        shipping_amount = 0
+        # Shipping section
+        shipping_amount = totals.shipping_amount
         shipping_section = ""
-        if invoice_details.get('show_shipping') and invoice_details.get('shipping_amount'):
-            shipping_amount = invoice_details.get('shipping_amount', 0)
+        if shipping_amount:
             shipping_section = f"""
                 <div class="calculation-row">
                     <span class="calculation-label">Shipping</span>
@@ -540,15 +805,14 @@ def send_invoice():
                 </div>
             """
 
-        # Calculate final total
-        total = subtotal - discount_amount + tax_amount + shipping_amount
+        total = totals.total
 
         # Build line items HTML as table rows
         line_items_html = ""
         for item in items:
             quantity = item.get('quantity', 0)
-            unit_cost = item.get('unit_cost', 0)
-            item_total = quantity * unit_cost
+            unit_cost = to_decimal(item.get('unit_cost'))
+            item_total = line_amount(item)
             item_name = item.get('name', 'Item')
 
             # Build item cell with optional description
@@ -588,7 +852,7 @@ def send_invoice():
             # Fallback to current directory
             template_path = Path('templates') / 'invoice_email.html'
 
-        print(f"📄 Loading template from: {template_path}")
+        app.logger.debug(f"Loading email template from {template_path}")
 
         if not template_path.exists():
             return jsonify({
@@ -618,7 +882,7 @@ def send_invoice():
         html_content = html_content.replace('{{TAX_SECTION}}', tax_section)
         html_content = html_content.replace('{{SHIPPING_SECTION}}', shipping_section)
 
-        # Send email via Brevo
+        # Queue the email for the Brevo worker (email_worker.py)
         payload = {
             "sender": {
                 "name": business_name,
@@ -629,75 +893,36 @@ def send_invoice():
             "htmlContent": html_content
         }
 
-        print(f"📤 Sending to Brevo API...")
-
-        res = requests.post(
-            'https://api.brevo.com/v3/smtp/email',
-            headers={
-                'accept': 'application/json',
-                'content-type': 'application/json',
-                'api-key': os.getenv('BREVO_API_KEY')
-            },
-            json=payload,
-            timeout=15
+        message, created = enqueue_email(
+            payload,
+            recipient=email,
+            invoice_id=invoice_data.get('id'),
+            user_id=invoice_data.get('user_id'),
+            idempotency_key=request.headers.get('Idempotency-Key') or data.get('idempotency_key')
         )
 
-        print(f"✅ Brevo Response: {res.status_code}")
+        logging.info(f"{'Queued' if created else 'Already queued'} email {message.id} ({message.status})")
 
-        if res.status_code == 201:
-            return jsonify({
-                "success": True,
-                "message": f"Invoice sent successfully to {email}",
-                "messageId": res.json().get('messageId')
-            })
-        else:
-            error_msg = res.json().get('message', 'Failed to send email')
-            print(f"❌ Brevo Error: {error_msg}")
-            return jsonify({
-                "success": False,
-                "error": error_msg
-            }), 400
+        return jsonify({
+            "success": True,
+            "message": f"Invoice queued for sending to {email}",
+            "messageId": str(message.id),
+            "email": format_outbox_response(message)
+        }), 202
 
     except FileNotFoundError as e:
-        print(f"❌ Template file not found: {e}")
+        logging.error(f"Email template not found: {e}")
         return jsonify({
             "success": False,
             "error": "Email template not found. Please check template file location."
         }), 500
     except Exception as e:
-        print(f"❌ Error: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logging.exception("Error in send_invoice")
         return jsonify({
             "success": False,
             "error": f"Server error: {str(e)}"
         }), 500
 
-def download_image_for_weasyprint(image_url):
-    """Download image from URL and return local file path"""
-    try:
-        # First try with proper SSL verification
-        response = requests.get(image_url, verify=True, timeout=30)
-        response.raise_for_status()
-
-    except requests.exceptions.SSLError:
-        # If SSL verification fails, try with certifi's certificates
-        response = requests.get(image_url, verify=certifi.where(), timeout=30)
-        response.raise_for_status()
-
-    except Exception:
-        # Final fallback: try without verification (use with caution)
-        response = requests.get(image_url, verify=False, timeout=30)
-        response.raise_for_status()
-
-    # Create temporary file
-    file_extension = os.path.splitext(image_url)[1] or '.png'
-    with tempfile.NamedTemporaryFile(delete=False, suffix=file_extension) as tmp_file:
-        tmp_file.write(response.content)
-        return tmp_file.name
-
-
-
 # @app.route('/api/users/profile', methods=['GET'])
 # def get_user_profile():
 #     return Users.get_user_profile()
@@ -756,7 +981,21 @@ def get_invoices():
     except ValueError:
         return jsonify({'success': False, 'error': 'Invalid UUID format for user_id'}), 400
 
+    # Cursor mode is served by the paginated listing
+    if request.args.get('cursor') is not None:
+        return InvoiceOperations.get_invoices_paginated()
+
     from models import Invoice
+
+    # ?fields= / ?fields=summary: selected columns only, `data` deferred
+    try:
+        fields = invoice_projection.parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    if fields:
+        query = invoice_projection.apply_projection(Invoice.query.filter_by(user_id=user_id), fields)
+        return jsonify({'success': True, 'invoices': invoice_projection.serialize_invoices(query.all(), fields)})
+
     invoices = Invoice.query.filter_by(user_id=user_id).all()
     # You may want to serialize your invoices appropriately:
     result = [
@@ -785,7 +1024,7 @@ def save_invoice():
     issued_date = data.get('issued_date')
     due_date = data.get('due_date')
     business_id = data.get('business_id')
-    status = data.get('status', 'draft'),
+    status = data.get('status', 'draft')
     currency = data.get('currency')
 
     # Validate required fields
@@ -811,6 +1050,7 @@ def save_invoice():
         business_id=business_id,
         currency=currency
     )
+    invoice.refresh_totals()
     db.session.add(invoice)
     db.session.commit()
     return jsonify({'success': True, 'invoice_id': str(invoice.id)})
@@ -1048,6 +1288,7 @@ def update_invoice(invoice_id):
         invoice.due_date = due_date
         invoice.status = status
         invoice.currency = currency
+        invoice.refresh_totals()
 
         # Update timestamp if the field exists in your model
         if hasattr(invoice, 'updated_at'):
@@ -1179,6 +1420,7 @@ def pay_invoice(invoice_id):
         invdata['paid_at'] = datetime.utcnow().isoformat()
         invoice.data = invdata
         invoice.status = 'paid'
+        invoice.refresh_totals()
         db.session.commit()
 
         # Return JSON for API clients; render a simple success page for browser/form submissions
@@ -1222,6 +1464,21 @@ def bulk_delete_invoices():
     return InvoiceOperations.bulk_delete_invoices()
 
 
+@app.route('/api/invoices/bulk/status', methods=['POST'])
+def bulk_update_invoice_status():
+    """
+    POST /api/invoices/bulk/status to move multiple invoices to one status
+
+    Request body:
+    {
+        "invoice_ids": ["uuid1", "uuid2", ...],
+        "status": "sent",
+        "user_id": "<uuid>" (optional for additional security)
+    }
+    """
+    return InvoiceOperations.bulk_update_status()
+
+
 # Add invoice statistics (NEW)
 @app.route('/api/invoices/statistics/<uuid:user_id>', methods=['GET'])
 def get_invoice_statistics(user_id):
@@ -1413,7 +1670,7 @@ def check_auth_status():
             }), 400
 
         # Check if user exists
-        user = User.query.filter_by(id=user_id).first()
+        user = load_user(user_id)
 
         if not user:
             return jsonify({
@@ -1466,7 +1723,7 @@ def update_profile():
                 'error': 'Invalid UUID format for user_id'
             }), 400
 
-        user = User.query.filter_by(id=user_id).first()
+        user = load_user(user_id)
         if not user:
             return jsonify({
                 'success': False,
@@ -1528,9 +1785,8 @@ def supabase_login():
 
         from models import User
 
-        # Try to find existing user by supabase_user_id (id) or google_id or email
-        user = User.query.filter(
-            (User.id == supabase_user_id) |
+        # Try to find existing user by supabase_user_id (id), then google_id or email
+        user = load_user(supabase_user_id) or User.query.filter(
             ((User.google_id == google_id) if google_id else False) |
             (User.email == email)
         ).first()
@@ -1713,9 +1969,7 @@ def delete_user():
 def get_user(user_id):
     """Fetch user details by user_id"""
     try:
-        from models import User
-
-        user = User.query.filter_by(id=user_id).first()
+        user = load_user(user_id)
         if not user:
             return jsonify({
                 'success': False,
@@ -1761,6 +2015,10 @@ def handle_notifications():
 def handle_unread_count():
     return Notifications.get_unread_count()
 
+@app.route('/api/notifications/unread-count/wait', methods=['GET'])
+def handle_wait_unread_count():
+    return Notifications.wait_for_unread_count()
+
 @app.route('/api/notifications/read-all', methods=['PUT'])
 def handle_mark_all_read():
     return Notifications.mark_all_as_read()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+"""
+Fill the denormalized totals columns on invoices from their `data` JSON.
+
+    python backfill_invoice_totals.py                 # rows with no total yet
+    python backfill_invoice_totals.py --all           # recompute every row
+    python backfill_invoice_totals.py --batch-size 1000
+"""
+import argparse
+import sys
+import os
+
+# Add the current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy.orm.attributes import flag_modified
+
+from db import db
+from models import Invoice
+
+# Import your app instance directly
+from app import app
+
+
+def backfill_invoice_totals(batch_size=500, recompute_all=False):
+    """Walk invoices in id order, one committed batch at a time"""
+
+    with app.app_context():
+        last_id = None
+        updated = 0
+
+        while True:
+            query = Invoice.query
+            if not recompute_all:
+                query = query.filter(Invoice.total.is_(None))
+            if last_id is not None:
+                query = query.filter(Invoice.id > last_id)
+            batch = query.order_by(Invoice.id).limit(batch_size).all()
+            if not batch:
+                break
+
+            try:
+                for invoice in batch:
+                    invoice.refresh_totals()
+                    # Write updated_at back unchanged so onupdate does not bump it
+                    flag_modified(invoice, 'updated_at')
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                print(f"❌ Error backfilling batch after {last_id}: {str(e)}")
+                return updated
+
+            updated += len(batch)
+            last_id = batch[-1].id
+            db.session.expunge_all()  # keep memory flat across batches
+            print(f"   ... {updated} invoices updated")
+
+        print(f"✅ Backfilled totals for {updated} invoices")
+        return updated
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Backfill invoice totals columns")
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--all', action='store_true', help="recompute rows that already have totals")
+    args = parser.parse_args()
+    backfill_invoice_totals(batch_size=args.batch_size, recompute_all=args.all)
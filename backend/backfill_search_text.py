@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""
+Fill invoices.search_text from each invoice's `data` JSON.
+
+Run once after migration f3a9d26c8b14 adds the column; until then invoices
+saved before it are only found by their invoice number. New and edited
+invoices get their search text from Invoice.refresh_totals().
+
+    python backfill_search_text.py                    # rows with no search text yet
+    python backfill_search_text.py --all              # recompute every row
+    python backfill_search_text.py --batch-size 1000
+"""
+import argparse
+import sys
+import os
+
+# Add the current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import bindparam, select, update
+
+from db import db
+from models import Invoice
+from search import search_text
+
+# Import your app instance directly
+from app import app
+
+
+def backfill_search_text(batch_size=500, recompute_all=False):
+    """Walk invoices in id order, one committed batch at a time"""
+
+    with app.app_context():
+        last_id = None
+        updated = 0
+
+        while True:
+            query = select(Invoice.id, Invoice.data)
+            if not recompute_all:
+                query = query.where(Invoice.search_text.is_(None))
+            if last_id is not None:
+                query = query.where(Invoice.id > last_id)
+            batch = db.session.execute(query.order_by(Invoice.id).limit(batch_size)).all()
+            if not batch:
+                break
+
+            rows = [{'row_id': row.id, 'text': search_text(row.data)} for row in batch]
+            try:
+                db.session.execute(
+                    update(Invoice.__table__)
+                    .where(Invoice.id == bindparam('row_id'))
+                    # Write updated_at back unchanged so onupdate does not bump it
+                    .values(search_text=bindparam('text'), updated_at=Invoice.updated_at),
+                    rows
+                )
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                print(f"❌ Error backfilling batch after {last_id}: {str(e)}")
+                return updated
+
+            updated += len(batch)
+            last_id = batch[-1].id
+            print(f"   ... {updated} invoices updated")
+
+        print(f"✅ Backfilled search text for {updated} invoices")
+        return updated
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Backfill invoice search text")
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--all', action='store_true', help="recompute rows that already have search text")
+    args = parser.parse_args()
+    backfill_search_text(batch_size=args.batch_size, recompute_all=args.all)
@@ -0,0 +1,196 @@
+# bulk_operations.py
+"""
+Set-based bulk writes.
+
+Bulk endpoints validate their id lists with parse_ids() and then write with
+one DELETE/UPDATE ... WHERE id = ANY(:ids) RETURNING statement per chunk of
+CHUNK_SIZE ids, instead of loading every row into the session and deleting
+it on its own. All chunks run in the caller's transaction; the caller
+commits.
+
+These statements bypass the ORM, so the after_flush hook that maintains the
+dashboard rollups never sees them: invoice writes must pass their RETURNING
+rows to invoice_rollup_changes() and on to record_rollup_changes().
+
+Other databases (SQLite test runs) get IN (...) instead of the uuid[]
+parameter; a status change reads its rows before updating them, since
+RETURNING cannot see the previous status there, and paid_date is stamped
+into `data` in Python rather than with jsonb_set.
+"""
+import uuid
+from datetime import datetime
+
+from sqlalchemy import JSON, any_, bindparam, case, cast, delete, func, literal, select, update
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB, UUID
+
+from db import db
+from models import Invoice
+from invoice_totals import to_cents
+from dashboard_rollups import invoice_currency_expr, normalize_currency
+
+CHUNK_SIZE = 1000
+
+
+def parse_ids(values, field, label):
+    """
+    Distinct UUIDs from a request list, in order. Raises ValueError with a
+    client-facing message when `values` is not a non-empty list of UUIDs.
+    """
+    if not isinstance(values, list) or not values:
+        raise ValueError(f'{field} must be a non-empty list')
+
+    ids = []
+    seen = set()
+    for value in values:
+        try:
+            parsed = uuid.UUID(value)
+        except (ValueError, TypeError, AttributeError):
+            raise ValueError(f'Invalid {label} ID format: {value}')
+        if parsed not in seen:
+            seen.add(parsed)
+            ids.append(parsed)
+    return ids
+
+
+def id_chunks(ids, size=CHUNK_SIZE):
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def _is_postgres():
+    return db.engine.dialect.name == 'postgresql'
+
+
+def id_in(column, ids):
+    """column = ANY(:ids), with the whole list bound as one uuid[] parameter"""
+    if not _is_postgres():
+        return column.in_(ids)
+    return column == any_(cast(literal([str(value) for value in ids], ARRAY(db.String)), ARRAY(UUID)))
+
+
+def select_rows(model, ids, columns, *criteria):
+    """`columns` of the rows among `ids` that match `criteria`"""
+    rows = []
+    for chunk in id_chunks(ids):
+        rows.extend(db.session.execute(
+            select(*columns).where(id_in(model.id, chunk), *criteria)
+        ).all())
+    return rows
+
+
+def delete_rows(model, ids, *criteria, returning=None):
+    """DELETE the rows among `ids` that match `criteria`; returns the RETURNING rows"""
+    rows = []
+    for chunk in id_chunks(ids):
+        stmt = delete(model.__table__).where(id_in(model.id, chunk), *criteria)
+        rows.extend(db.session.execute(stmt.returning(*(returning or (model.id,)))).all())
+    return rows
+
+
+# ─── Invoices ───────────────────────────────────────────────────────────────
+
+def invoice_number_expr():
+    return func.coalesce(Invoice.invoice_number, Invoice.data['invoice_number'].as_string())
+
+
+def invoice_returning():
+    """RETURNING columns that invoice_rollup_changes() needs"""
+    return (
+        Invoice.id,
+        Invoice.user_id,
+        invoice_number_expr().label('invoice_number'),
+        invoice_currency_expr().label('currency'),
+        Invoice.total,
+    )
+
+
+def change_invoice_status(ids, status, *criteria):
+    """
+    Move the invoices among `ids` that match `criteria` and are not already
+    in `status` to it, as UPDATE ... FROM (SELECT ... FOR UPDATE) RETURNING
+    so each row comes back with its previous status as `old_status`.
+    Marking invoices paid also stamps data.paid_date, as the single-invoice
+    status update does.
+    """
+    now = datetime.utcnow()
+    values = {'status': status, 'updated_at': now}
+    if not _is_postgres():
+        return _change_invoice_status_portable(ids, status, values, now, criteria)
+
+    if status == 'paid':
+        stamped = func.jsonb_set(cast(Invoice.data, JSONB), '{paid_date}', func.to_jsonb(cast(now.isoformat(), db.String)))
+        values['data'] = case(
+            (func.json_typeof(Invoice.data) == 'object', cast(stamped, JSON)),
+            else_=Invoice.data
+        )
+
+    rows = []
+    for chunk in id_chunks(ids):
+        previous = select(Invoice.id, Invoice.status).where(
+            id_in(Invoice.id, chunk), Invoice.status.is_distinct_from(status), *criteria
+        ).with_for_update().subquery('previous')
+        stmt = update(Invoice.__table__).where(Invoice.id == previous.c.id).values(**values)
+        rows.extend(db.session.execute(
+            stmt.returning(*invoice_returning(), previous.c.status.label('old_status'))
+        ).all())
+    return rows
+
+
+def _change_invoice_status_portable(ids, status, values, now, criteria):
+    """
+    change_invoice_status() for other databases: RETURNING cannot see the
+    previous status there, so the rows are read first, then updated.
+    """
+    rows = []
+    for chunk in id_chunks(ids):
+        changed = db.session.execute(
+            select(*invoice_returning(), Invoice.status.label('old_status'))
+            .where(id_in(Invoice.id, chunk), Invoice.status.is_distinct_from(status), *criteria)
+        ).all()
+        if not changed:
+            continue
+        changed_ids = [row.id for row in changed]
+        db.session.execute(update(Invoice.__table__).where(Invoice.id.in_(changed_ids)).values(**values))
+        if status == 'paid':
+            stamp_paid_date(changed_ids, now)
+        rows.extend(changed)
+    return rows
+
+
+def stamp_paid_date(ids, now):
+    """Set data.paid_date on the invoices among `ids` whose data is an object"""
+    stamped = []
+    for row in db.session.execute(select(Invoice.id, Invoice.data).where(Invoice.id.in_(ids))):
+        if isinstance(row.data, dict):
+            stamped.append({'row_id': row.id, 'stamped': {**row.data, 'paid_date': now.isoformat()}})
+    if stamped:
+        db.session.execute(
+            update(Invoice.__table__).where(Invoice.id == bindparam('row_id')).values(data=bindparam('stamped')),
+            stamped
+        )
+
+
+def invoice_rollup_changes(rows, new_status=None, old_status=None):
+    """
+    Dashboard rollup deltas for invoice rows that left their old status
+    (`old_status`, or each row's `old_status` when it is None), either for
+    `new_status` or, when that is None, deleted. Returns (deltas, rebuild)
+    for record_rollup_changes().
+    """
+    deltas = {}
+    rebuild = set()
+    for row in rows:
+        user_id = str(row.user_id)
+        if row.total is None:
+            rebuild.add(user_id)  # not backfilled; let the rebuild compute it
+            continue
+        currency = normalize_currency(row.currency)
+        cents = to_cents(row.total)
+        moves = [((row.old_status if old_status is None else old_status) or '', -1)]
+        if new_status is not None:
+            moves.append((new_status, 1))
+        for status, sign in moves:
+            delta = deltas.setdefault((user_id, currency, status), [0, 0])
+            delta[0] += sign
+            delta[1] += sign * cents
+    return deltas, rebuild
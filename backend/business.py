@@ -1,9 +1,14 @@
 from flask import request, jsonify
 from db import db
-from models import Business, User
+from models import Business, Invoice
 from datetime import datetime
+from sqlalchemy import func
 import uuid
 import logging
+from pagination import cursor_requested, keyset_page, cursor_pagination
+from user_loader import load_user
+from bulk_operations import parse_ids, select_rows, delete_rows
+from invoice_projection import LIST_FIELDS, parse_fields, apply_projection, serialize_invoices
 
 FREE_PLAN_BUSINESS_LIMIT = 1
 
@@ -12,7 +17,7 @@ class Businesses:
     """CRUD operations for Business model"""
 
     @staticmethod
-    def format_business_response(business, include_invoice_count=False):
+    def format_business_response(business, include_invoice_count=False, invoice_count=None):
         response_data = {
             'id': str(business.id),
             'user_id': str(business.user_id),
@@ -29,11 +34,22 @@ class Businesses:
         }
 
         if include_invoice_count:
-            invoice_count = len(business.invoices) if business.invoices else 0
+            if invoice_count is None:
+                invoice_count = Businesses.invoice_counts([business.id]).get(business.id, 0)
             response_data['invoice_count'] = invoice_count
 
         return response_data
 
+    @staticmethod
+    def invoice_counts(business_ids):
+        """{business_id: invoice count} in one grouped query, without loading invoices"""
+        if not business_ids:
+            return {}
+        rows = db.session.query(Invoice.business_id, func.count(Invoice.id)).filter(
+            Invoice.business_id.in_(business_ids)
+        ).group_by(Invoice.business_id).all()
+        return dict(rows)
+
     @staticmethod
     def validate_uuid(uuid_string):
         try:
@@ -79,7 +95,7 @@ class Businesses:
             user_id = data['user_id']
 
             # ── Plan enforcement ──────────────────────────────────────────────
-            user = User.query.get(user_id)
+            user = load_user(user_id)
             if not user:
                 return jsonify({'success': False, 'error': 'User not found'}), 404
 
@@ -138,7 +154,7 @@ class Businesses:
             if not Businesses.validate_uuid(user_id):
                 return jsonify({'success': False, 'error': 'Invalid user_id format'}), 400
 
-            user = User.query.get(user_id)
+            user = load_user(user_id)
             if not user:
                 return jsonify({'success': False, 'error': 'User not found'}), 404
 
@@ -161,11 +177,34 @@ class Businesses:
 
             query = query.order_by(Business.created_at.desc())
 
-            paginated = query.paginate(page=page, per_page=per_page, error_out=False)
+            if cursor_requested():
+                try:
+                    items, next_cursor = keyset_page(query, Business, request.args.get('cursor'), per_page)
+                except ValueError as e:
+                    return jsonify({'success': False, 'error': str(e)}), 400
+                pagination = cursor_pagination(query, next_cursor, per_page)
+                # Pro users have no limit, so only free users need the count
+                can_add_business = user.plan == 'pro' or \
+                    Business.query.filter_by(user_id=user_id).count() < FREE_PLAN_BUSINESS_LIMIT
+            else:
+                paginated = query.paginate(page=page, per_page=per_page, error_out=False)
+                items = paginated.items
+                pagination = {
+                    'page': page,
+                    'per_page': per_page,
+                    'total': paginated.total,
+                    'pages': paginated.pages,
+                    'has_prev': paginated.has_prev,
+                    'has_next': paginated.has_next
+                }
+                can_add_business = user.plan == 'pro' or paginated.total < FREE_PLAN_BUSINESS_LIMIT
 
+            invoice_counts = Businesses.invoice_counts([b.id for b in items])
             businesses = [
-                Businesses.format_business_response(b, include_invoice_count=True)
-                for b in paginated.items
+                Businesses.format_business_response(
+                    b, include_invoice_count=True, invoice_count=invoice_counts.get(b.id, 0)
+                )
+                for b in items
             ]
 
             return jsonify({
@@ -173,16 +212,9 @@ class Businesses:
                 'businesses': businesses,
                 # ── Expose plan info so the frontend knows the limit ──────────
                 'plan': user.plan,
-                'can_add_business': user.plan == 'pro' or paginated.total < FREE_PLAN_BUSINESS_LIMIT,
+                'can_add_business': can_add_business,
                 # ─────────────────────────────────────────────────────────────
-                'pagination': {
-                    'page': page,
-                    'per_page': per_page,
-                    'total': paginated.total,
-                    'pages': paginated.pages,
-                    'has_prev': paginated.has_prev,
-                    'has_next': paginated.has_next
-                }
+                'pagination': pagination
             })
 
         except Exception as e:
@@ -278,10 +310,11 @@ class Businesses:
             if not business:
                 return jsonify({'success': False, 'error': 'Business not found'}), 404
 
-            if business.invoices:
+            invoice_count = Businesses.invoice_counts([business.id]).get(business.id, 0)
+            if invoice_count:
                 return jsonify({
                     'success': False,
-                    'error': f'Cannot delete business. Business has {len(business.invoices)} associated invoices.'
+                    'error': f'Cannot delete business. Business has {invoice_count} associated invoices.'
                 }), 400
 
             db.session.delete(business)
@@ -304,25 +337,21 @@ class Businesses:
             if not business:
                 return jsonify({'success': False, 'error': 'Business not found'}), 404
 
-            invoices = []
-            for invoice in business.invoices:
-                amount = 0.0
-                if isinstance(invoice.data, dict):
-                    try:
-                        amount = float(invoice.data.get('total', 0))
-                    except (ValueError, TypeError):
-                        pass
-
-                invoices.append({
-                    'id': str(invoice.id),
-                    'invoice_number': invoice.data.get('invoice_number', '') if isinstance(invoice.data, dict) else '',
-                    'amount': amount,
-                    'currency': invoice.data.get('currency', 'USD') if isinstance(invoice.data, dict) else 'USD',
-                    'status': invoice.status,
-                    'issued_date': invoice.issued_date.isoformat() if invoice.issued_date else None,
-                    'due_date': invoice.due_date.isoformat() if invoice.due_date else None,
-                    'created_at': invoice.created_at.isoformat() if invoice.created_at else None
-                })
+            try:
+                fields = parse_fields(request.args.get('fields'))
+            except ValueError as e:
+                return jsonify({'success': False, 'error': str(e)}), 400
+
+            # Scalar columns only - `data` is never loaded for this list
+            query = apply_projection(
+                Invoice.query.filter_by(business_id=business.id).order_by(Invoice.created_at.desc()),
+                fields or LIST_FIELDS
+            )
+            invoices = serialize_invoices(query.all(), fields or LIST_FIELDS)
+            if not fields:
+                for invoice in invoices:
+                    invoice['invoice_number'] = invoice['invoice_number'] or ''
+                    invoice['amount'] = invoice.pop('total') or 0.0
 
             return jsonify({
                 'success': True,
@@ -346,28 +375,24 @@ class Businesses:
             if not data or 'business_ids' not in data:
                 return jsonify({'success': False, 'error': 'business_ids are required'}), 400
 
-            business_ids = data['business_ids']
-            if not isinstance(business_ids, list) or not business_ids:
-                return jsonify({'success': False, 'error': 'business_ids must be a non-empty list'}), 400
+            try:
+                business_ids = parse_ids(data['business_ids'], 'business_ids', 'business')
+            except ValueError as e:
+                return jsonify({'success': False, 'error': str(e)}), 400
 
-            for business_id in business_ids:
-                if not Businesses.validate_uuid(business_id):
-                    return jsonify({'success': False, 'error': f'Invalid business ID format: {business_id}'}), 400
+            # Id and name only, for the error listing
+            businesses = select_rows(Business, business_ids, (Business.id, Business.name))
 
-            businesses = Business.query.filter(Business.id.in_(business_ids)).all()
-
-            businesses_with_invoices = []
-            businesses_to_delete = []
-
-            for business in businesses:
-                if business.invoices:
-                    businesses_with_invoices.append({
-                        'id': str(business.id),
-                        'name': business.name,
-                        'invoice_count': len(business.invoices)
-                    })
-                else:
-                    businesses_to_delete.append(business)
+            # Check for businesses with invoices
+            invoice_counts = Businesses.invoice_counts([business.id for business in businesses])
+            businesses_with_invoices = [
+                {
+                    'id': str(business.id),
+                    'name': business.name,
+                    'invoice_count': invoice_counts[business.id]
+                }
+                for business in businesses if invoice_counts.get(business.id)
+            ]
 
             if businesses_with_invoices:
                 return jsonify({
@@ -376,10 +401,9 @@ class Businesses:
                     'businesses_with_invoices': businesses_with_invoices
                 }), 400
 
-            deleted_count = 0
-            for business in businesses_to_delete:
-                db.session.delete(business)
-                deleted_count += 1
+            # Delete all businesses without invoices, re-checked in the DELETE itself
+            has_invoices = db.exists().where(Invoice.business_id == Business.id)
+            deleted_count = len(delete_rows(Business, business_ids, ~has_invoices))
 
             db.session.commit()
 
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+"""
+Check the totals engine against invoices whose totals are known.
+
+Needs no database or app, so it can run in CI before anything is deployed.
+Exits non-zero if any invoice's totals differ from the expected ones.
+
+    python check_invoice_totals.py
+"""
+import sys
+import os
+from decimal import Decimal
+
+# Add the current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from invoice_totals import TotalsBatch, compute_totals
+
+
+def known_invoices():
+    """(description, data JSON, expected {field: amount})"""
+    return [
+        ("line items, percent tax and discount",
+         {'items': [{'quantity': 2, 'unit_cost': 50}, {'quantity': 1, 'unit_cost': '19.99'}],
+          'show_tax': True, 'tax_percent': 10, 'show_discount': True, 'discount_percent': 5},
+         {'subtotal': '119.99', 'tax_amount': '12.00', 'discount_amount': '6.00', 'total': '125.99'}),
+        ("lines are not rounded before they are summed",
+         {'items': [{'quantity': 3, 'unit_cost': '0.333'}, {'quantity': 1, 'unit_cost': '0.005'}]},
+         {'subtotal': '1.00', 'total': '1.00'}),
+        ("fixed discount larger than the rest is not clamped",
+         {'items': [{'quantity': 1, 'unit_cost': 5}], 'show_discount': True, 'discount_type': 'fixed',
+          'discount_percent': 10, 'show_shipping': True, 'shipping_amount': 1},
+         {'discount_amount': '10.00', 'shipping_amount': '1.00', 'total': '-4.00'}),
+        ("empty items list still gets shipping",
+         {'items': [], 'show_shipping': True, 'shipping_amount': 10},
+         {'subtotal': '0.00', 'shipping_amount': '10.00', 'total': '10.00'}),
+        ("empty items list ignores a client-sent total",
+         {'items': [], 'show_shipping': True, 'shipping_amount': 10, 'total': 99},
+         {'subtotal': '0.00', 'total': '10.00'}),
+        ("legacy row without items keeps its stored total",
+         {'total': '12.50', 'show_shipping': True, 'shipping_amount': 10},
+         {'subtotal': '12.50', 'shipping_amount': '0.00', 'total': '12.50'}),
+    ]
+
+
+def check_invoice_totals():
+    """Returns the number of invoices whose totals are wrong"""
+    cases = known_invoices()
+    batch = TotalsBatch(data for _, data, _ in cases)
+    failures = 0
+    for index, (description, data, expected) in enumerate(cases):
+        single = compute_totals(data).as_dict()
+        batched = batch.totals(index).as_dict()
+        wrong = {field: (single[field], batched[field]) for field, amount in expected.items()
+                 if not single[field] == batched[field] == Decimal(amount)}
+        if wrong:
+            failures += 1
+            details = ', '.join(f"{field} {single} / {batched} (expected {expected[field]})"
+                                for field, (single, batched) in wrong.items())
+            print(f"❌ {description}: {details}")
+        else:
+            print(f"✅ {description}")
+
+    if failures:
+        print(f"❌ {failures} invoices have wrong totals")
+    else:
+        print("✅ All invoice totals match")
+    return failures
+
+
+if __name__ == '__main__':
+    sys.exit(1 if check_invoice_totals() else 0)
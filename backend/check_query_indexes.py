@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+"""
+EXPLAIN every hot query and check it is served by the index meant for it.
+
+Sequential scans are disabled for the check so that small development
+databases, where a seq scan would win anyway, still show whether a usable
+index exists. Exits non-zero if any query misses its index, so it can run
+in CI against a migrated database.
+
+    python check_query_indexes.py
+"""
+import json
+import sys
+import os
+import uuid
+from datetime import date, datetime
+
+# Add the current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import func, select
+
+from db import db
+from models import Invoice, Client, Business, Notification, BillingTransaction, UserSubscription, EmailOutbox
+from search import SIMPLE, client_document, invoice_document
+
+# Import your app instance directly
+from app import app
+
+SAMPLE_ID = uuid.uuid4()
+
+
+def hot_queries():
+    """(description, statement, index that should serve it)"""
+    return [
+        ("invoices by user, newest first",
+         select(Invoice).filter_by(user_id=SAMPLE_ID).order_by(Invoice.created_at.desc()).limit(10),
+         'ix_invoices_user_id_created_at'),
+        ("invoices by user and status, newest first",
+         select(Invoice).filter_by(user_id=SAMPLE_ID, status='sent').order_by(Invoice.created_at.desc()).limit(10),
+         'ix_invoices_user_id_status_created_at'),
+        ("invoices by user, sorted by invoice number",
+         select(Invoice).filter_by(user_id=SAMPLE_ID)
+         .order_by(Invoice.invoice_number.desc()).limit(10),
+         'ix_invoices_user_id_invoice_number'),
+        ("invoices of a client",
+         select(Invoice).filter_by(client_id=SAMPLE_ID),
+         'ix_invoices_client_id'),
+        ("invoices of a business",
+         select(Invoice).filter_by(business_id=SAMPLE_ID),
+         'ix_invoices_business_id'),
+        ("sent invoices past due (overdue sweeper)",
+         select(Invoice.id).where(Invoice.status == 'sent', Invoice.due_date < date.today())
+         .order_by(Invoice.due_date).limit(1000),
+         'ix_invoices_status_due_date'),
+        ("client search, substring (get_clients ?search=)",
+         select(Client.id).where(Client.user_id == SAMPLE_ID, client_document().ilike('%acme%')),
+         'ix_clients_search_trgm'),
+        ("invoice search, full text (/api/search)",
+         select(Invoice.id).where(Invoice.user_id == SAMPLE_ID,
+                                  func.to_tsvector(SIMPLE, invoice_document())
+                                  .op('@@')(func.websearch_to_tsquery(SIMPLE, 'acme'))),
+         'ix_invoices_search_tsv'),
+        ("clients by user, newest first",
+         select(Client).filter_by(user_id=SAMPLE_ID).order_by(Client.created_at.desc()),
+         'ix_clients_user_id_created_at'),
+        ("businesses by user, newest first",
+         select(Business).filter_by(user_id=SAMPLE_ID).order_by(Business.created_at.desc()),
+         'ix_businesses_user_id_created_at'),
+        ("business by Paystack subaccount",
+         select(Business).filter_by(paystack_subaccount_code='ACCT_sample').limit(1),
+         'ix_businesses_paystack_subaccount_code'),
+        ("unread notification count",
+         select(func.count(Notification.id)).filter_by(user_id=SAMPLE_ID, is_read=False),
+         'ix_notifications_user_id_unread_created_at'),
+        ("notifications by user, newest first",
+         select(Notification).filter_by(user_id=SAMPLE_ID).order_by(Notification.created_at.desc()).limit(20),
+         'ix_notifications_user_id_created_at'),
+        ("read info notifications past retention (prune_notifications.py)",
+         select(Notification.id).where(Notification.type == 'info', Notification.is_read.is_(True),
+                                       Notification.created_at < datetime(2026, 1, 1)).limit(1000),
+         'ix_notifications_type_is_read_created_at'),
+        ("successful billing transactions by user",
+         select(BillingTransaction).filter_by(user_id=SAMPLE_ID, status='success')
+         .order_by(BillingTransaction.created_at.desc()),
+         'ix_billing_transactions_user_id_status_created_at'),
+        ("active subscription of a user",
+         select(UserSubscription).filter_by(user_id=SAMPLE_ID, status='active').limit(1),
+         'ix_user_subscriptions_user_id_status'),
+        ("due outbound emails (email_worker.py)",
+         select(EmailOutbox.id).where(EmailOutbox.status == 'queued', EmailOutbox.next_attempt_at <= datetime(2026, 1, 1))
+         .order_by(EmailOutbox.next_attempt_at).limit(20),
+         'ix_email_outbox_status_next_attempt_at'),
+        ("emails of an invoice, newest first",
+         select(EmailOutbox).filter_by(invoice_id=SAMPLE_ID).order_by(EmailOutbox.created_at.desc()).limit(20),
+         'ix_email_outbox_invoice_id_created_at'),
+    ]
+
+
+def plan_indexes(plan):
+    """Names of every index used anywhere in an EXPLAIN (FORMAT JSON) plan"""
+    names = set()
+    if plan.get('Index Name'):
+        names.add(plan['Index Name'])
+    for child in plan.get('Plans', []):
+        names |= plan_indexes(child)
+    return names
+
+
+def explain(connection, statement):
+    compiled = statement.compile(dialect=connection.dialect)
+    params = {key: str(value) if isinstance(value, uuid.UUID) else value
+              for key, value in compiled.params.items()}
+    result = connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", params).scalar()
+    plan = result if isinstance(result, list) else json.loads(result)
+    return plan[0]['Plan']
+
+
+def check_query_indexes():
+    """Returns the number of hot queries that do not use their index"""
+
+    with app.app_context():
+        failures = 0
+        with db.engine.connect() as connection:
+            connection.exec_driver_sql("SET enable_seqscan = off")
+            for description, statement, expected in hot_queries():
+                used = plan_indexes(explain(connection, statement))
+                if expected in used:
+                    print(f"✅ {description}: {expected}")
+                else:
+                    failures += 1
+                    print(f"❌ {description}: expected {expected}, plan uses {', '.join(sorted(used)) or 'no index'}")
+
+        if failures:
+            print(f"❌ {failures} hot queries are not using their index")
+        else:
+            print("✅ All hot queries use their index")
+        return failures
+
+
+if __name__ == '__main__':
+    sys.exit(1 if check_query_indexes() else 0)
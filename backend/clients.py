@@ -1,14 +1,29 @@
 from flask import request, jsonify
 from db import db
-from models import Client
+from models import Client, Invoice
 from datetime import datetime
+from sqlalchemy import func
 import uuid
 import logging
+from pagination import cursor_requested, keyset_page, cursor_pagination
+from search import client_document, contains_pattern
+from bulk_operations import parse_ids, select_rows, delete_rows
+from invoice_projection import LIST_FIELDS, parse_fields, apply_projection, serialize_invoices
 
 
 class Clients:
     """CRUD operations for Client model"""
 
+    @staticmethod
+    def invoice_counts(client_ids):
+        """{client_id: invoice count} in one grouped query, without loading invoices"""
+        if not client_ids:
+            return {}
+        rows = db.session.query(Invoice.client_id, func.count(Invoice.id)).filter(
+            Invoice.client_id.in_(client_ids)
+        ).group_by(Invoice.client_id).all()
+        return dict(rows)
+
     @staticmethod
     def validate_uuid(uuid_string):
         """Validate UUID format"""
@@ -117,31 +132,42 @@ class Clients:
             # Build query
             query = Client.query.filter_by(user_id=user_id)
 
-            # Apply search filter if provided
+            # Apply search filter if provided (served by the ix_clients_search_trgm index)
             if search:
-                search_term = f"%{search}%"
-                query = query.filter(
-                    db.or_(
-                        Client.name.ilike(search_term),
-                        Client.email.ilike(search_term),
-                        Client.phone.ilike(search_term)
-                    )
-                )
+                query = query.filter(client_document().ilike(contains_pattern(search), escape='\\'))
 
             # Order by created_at descending
             query = query.order_by(Client.created_at.desc())
 
-            # Paginate
-            paginated = query.paginate(
-                page=page,
-                per_page=per_page,
-                error_out=False
-            )
+            if cursor_requested():
+                try:
+                    items, next_cursor = keyset_page(query, Client, request.args.get('cursor'), per_page)
+                except ValueError as e:
+                    return jsonify({'success': False, 'error': str(e)}), 400
+                pagination = cursor_pagination(query, next_cursor, per_page)
+            else:
+                # Paginate
+                paginated = query.paginate(
+                    page=page,
+                    per_page=per_page,
+                    error_out=False
+                )
+                items = paginated.items
+                pagination = {
+                    'page': page,
+                    'per_page': per_page,
+                    'total': paginated.total,
+                    'pages': paginated.pages,
+                    'has_prev': paginated.has_prev,
+                    'has_next': paginated.has_next
+                }
+
+            # Invoice counts for the whole page in one grouped query
+            invoice_counts = Clients.invoice_counts([client.id for client in items])
 
             clients = []
-            for client in paginated.items:
-                # Count invoices for this client
-                invoice_count = len(client.invoices) if client.invoices else 0
+            for client in items:
+                invoice_count = invoice_counts.get(client.id, 0)
 
                 clients.append({
                     'id': str(client.id),
@@ -158,14 +184,7 @@ class Clients:
             return jsonify({
                 'success': True,
                 'clients': clients,
-                'pagination': {
-                    'page': page,
-                    'per_page': per_page,
-                    'total': paginated.total,
-                    'pages': paginated.pages,
-                    'has_prev': paginated.has_prev,
-                    'has_next': paginated.has_next
-                }
+                'pagination': pagination
             })
 
         except Exception as e:
@@ -184,7 +203,7 @@ class Clients:
                 return jsonify({'success': False, 'error': 'Client not found'}), 404
 
             # Count invoices for this client
-            invoice_count = len(client.invoices) if client.invoices else 0
+            invoice_count = Clients.invoice_counts([client.id]).get(client.id, 0)
 
             return jsonify({
                 'success': True,
@@ -252,7 +271,7 @@ class Clients:
             db.session.commit()
 
             # Count invoices for response
-            invoice_count = len(client.invoices) if client.invoices else 0
+            invoice_count = Clients.invoice_counts([client.id]).get(client.id, 0)
 
             return jsonify({
                 'success': True,
@@ -286,10 +305,11 @@ class Clients:
                 return jsonify({'success': False, 'error': 'Client not found'}), 404
 
             # Check if client has invoices
-            if client.invoices:
+            invoice_count = Clients.invoice_counts([client.id]).get(client.id, 0)
+            if invoice_count:
                 return jsonify({
                     'success': False,
-                    'error': f'Cannot delete client. Client has {len(client.invoices)} associated invoices.'
+                    'error': f'Cannot delete client. Client has {invoice_count} associated invoices.'
                 }), 400
 
             db.session.delete(client)
@@ -316,25 +336,21 @@ class Clients:
             if not client:
                 return jsonify({'success': False, 'error': 'Client not found'}), 404
 
-            invoices = []
-            for invoice in client.invoices:
-                amount = 0.0
-                if isinstance(invoice.data, dict):
-                    try:
-                        amount = float(invoice.data.get('total', 0))
-                    except (ValueError, TypeError):
-                        pass
-
-                invoices.append({
-                    'id': str(invoice.id),
-                    'invoice_number': invoice.data.get('invoice_number', '') if isinstance(invoice.data, dict) else '',
-                    'amount': amount,
-                    'currency': invoice.data.get('currency', 'USD') if isinstance(invoice.data, dict) else 'USD',
-                    'status': invoice.status,
-                    'issued_date': invoice.issued_date.isoformat() if invoice.issued_date else None,
-                    'due_date': invoice.due_date.isoformat() if invoice.due_date else None,
-                    'created_at': invoice.created_at.isoformat() if invoice.created_at else None
-                })
+            try:
+                fields = parse_fields(request.args.get('fields'))
+            except ValueError as e:
+                return jsonify({'success': False, 'error': str(e)}), 400
+
+            # Scalar columns only - `data` is never loaded for this list
+            query = apply_projection(
+                Invoice.query.filter_by(client_id=client.id).order_by(Invoice.created_at.desc()),
+                fields or LIST_FIELDS
+            )
+            invoices = serialize_invoices(query.all(), fields or LIST_FIELDS)
+            if not fields:
+                for invoice in invoices:
+                    invoice['invoice_number'] = invoice['invoice_number'] or ''
+                    invoice['amount'] = invoice.pop('total') or 0.0
 
             return jsonify({
                 'success': True,
@@ -359,31 +375,24 @@ class Clients:
             if not data or 'client_ids' not in data:
                 return jsonify({'success': False, 'error': 'client_ids are required'}), 400
 
-            client_ids = data['client_ids']
-            if not isinstance(client_ids, list) or not client_ids:
-                return jsonify({'success': False, 'error': 'client_ids must be a non-empty list'}), 400
-
-            # Validate all client IDs
-            for client_id in client_ids:
-                if not Clients.validate_uuid(client_id):
-                    return jsonify({'success': False, 'error': f'Invalid client ID format: {client_id}'}), 400
+            try:
+                client_ids = parse_ids(data['client_ids'], 'client_ids', 'client')
+            except ValueError as e:
+                return jsonify({'success': False, 'error': str(e)}), 400
 
-            # Get all clients
-            clients = Client.query.filter(Client.id.in_(client_ids)).all()
+            # Id and name only, for the error listing
+            clients = select_rows(Client, client_ids, (Client.id, Client.name))
 
             # Check for clients with invoices
-            clients_with_invoices = []
-            clients_to_delete = []
-
-            for client in clients:
-                if client.invoices:
-                    clients_with_invoices.append({
-                        'id': str(client.id),
-                        'name': client.name,
-                        'invoice_count': len(client.invoices)
-                    })
-                else:
-                    clients_to_delete.append(client)
+            invoice_counts = Clients.invoice_counts([client.id for client in clients])
+            clients_with_invoices = [
+                {
+                    'id': str(client.id),
+                    'name': client.name,
+                    'invoice_count': invoice_counts[client.id]
+                }
+                for client in clients if invoice_counts.get(client.id)
+            ]
 
             if clients_with_invoices:
                 return jsonify({
@@ -392,11 +401,9 @@ class Clients:
                     'clients_with_invoices': clients_with_invoices
                 }), 400
 
-            # Delete all clients without invoices
-            deleted_count = 0
-            for client in clients_to_delete:
-                db.session.delete(client)
-                deleted_count += 1
+            # Delete all clients without invoices, re-checked in the DELETE itself
+            has_invoices = db.exists().where(Invoice.client_id == Client.id)
+            deleted_count = len(delete_rows(Client, client_ids, ~has_invoices))
 
             db.session.commit()
 
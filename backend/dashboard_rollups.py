@@ -0,0 +1,385 @@
+# dashboard_rollups.py
+"""
+Per-user dashboard rollups.
+
+`user_dashboard_rollups` holds one row per (user, currency, status) with the
+invoice count and summed totals, so the dashboard and the statistics
+endpoint read a handful of rows instead of scanning a user's invoices.
+
+The rows are kept up to date incrementally: an `after_flush` hook turns
+every inserted, updated or deleted Invoice into (old, new) contributions
+and upserts the difference in the same transaction as the invoice change.
+A user's rows are (re)built from their invoices instead when
+    - the user has no rollup rows yet (never built, or built before they
+      had invoices), or
+    - an invoice's previous values were not loaded, so no delta can be
+      derived.
+Writes that bypass the ORM (bulk UPDATE/DELETE) must report their changes
+through record_rollup_changes(). rebuild_dashboard_rollups.py
+rebuilds everything for periodic reconciliation.
+
+PostgreSQL gets upserts and per-user advisory locks; other databases
+(SQLite test runs) get the same results from plain selects, inserts and
+updates, so saving an invoice works there too.
+"""
+import logging
+import uuid
+from datetime import datetime
+
+from sqlalchemy import event, func, case, select, delete, update, inspect
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import NO_VALUE
+
+from db import db
+from models import Invoice, UserDashboardRollup
+from invoice_totals import TotalsBatch, to_cents, from_cents, invoice_total
+
+UNPAID_STATUSES = ('sent', 'in progress', 'overdue')
+
+# Invoice attributes that decide which rollup row an invoice lands in, and with what amount
+_TRACKED = ('user_id', 'status', 'currency', 'data', 'total')
+
+rollups = UserDashboardRollup.__table__
+
+
+def normalize_currency(currency):
+    """Normalize currency codes"""
+    if not currency:
+        return 'USD'
+
+    currency = str(currency).upper().strip()
+
+    # Common currency symbols to codes
+    currency_map = {
+        '$': 'USD', 'US$': 'USD', 'USD$': 'USD',
+        '€': 'EUR', 'EURO': 'EUR',
+        '£': 'GBP', 'GB£': 'GBP',
+        '¥': 'JPY', 'JP¥': 'JPY',
+        '₦': 'NGN', 'NG₦': 'NGN',
+        'CAD$': 'CAD', 'CA$': 'CAD',
+        'AUD$': 'AUD', 'AU$': 'AUD'
+    }
+
+    return currency_map.get(currency, currency)
+
+
+def invoice_currency(data, column_currency=None):
+    """Currency of an invoice: data.currency.code, data.currency, then the column"""
+    currency = data.get('currency') if isinstance(data, dict) else None
+    if isinstance(currency, dict):
+        currency = currency.get('code')
+    elif not isinstance(currency, str):
+        currency = None
+    return normalize_currency(currency or column_currency)
+
+
+def invoice_currency_expr():
+    """invoice_currency() as SQL (not normalized)"""
+    currency = Invoice.data['currency']
+    if db.engine.dialect.name == 'postgresql':
+        is_string = func.json_typeof(currency) == 'string'
+    else:
+        is_string = func.json_type(Invoice.data, '$.currency') == 'text'
+    return func.coalesce(
+        Invoice.data[('currency', 'code')].as_string(),
+        case((is_string, currency.as_string()), else_=None),
+        Invoice.currency,
+        'USD'
+    )
+
+
+def _as_uuid(value):
+    return value if isinstance(value, uuid.UUID) else uuid.UUID(str(value))
+
+
+def _is_postgres(session):
+    return session.get_bind().dialect.name == 'postgresql'
+
+
+def _rollup_row(user_id, currency, status, count, cents, updated_at):
+    """Column values for one rollup row (or delta) of `count` invoices totalling `cents`"""
+    return {
+        'user_id': _as_uuid(user_id),
+        'currency': currency,
+        'status': status,
+        'invoice_count': count,
+        'total_amount': from_cents(cents),
+        'outstanding_amount': from_cents(cents if status in UNPAID_STATUSES else 0),
+        'overdue_amount': from_cents(cents if status == 'overdue' else 0),
+        'updated_at': updated_at,
+    }
+
+
+def invoice_groups(user_id, session=None):
+    """
+    {(currency, status): [count, total_cents]} for a user, from one
+    GROUP BY query over the invoices. Rows whose totals were never
+    backfilled are computed from their data.
+    """
+    session = session or db.session
+    user_id = _as_uuid(user_id)
+    if not _is_postgres(session):
+        return _invoice_groups_in_process(user_id, session)
+    currency = invoice_currency_expr()
+    rows = session.execute(
+        select(
+            currency,
+            Invoice.status,
+            func.count(Invoice.id),
+            func.sum(Invoice.total),
+            func.count(Invoice.total)
+        ).where(Invoice.user_id == user_id).group_by(currency, Invoice.status)
+    ).all()
+
+    groups = {}
+    missing_totals = False
+    for currency_code, status, count, total, totalled in rows:
+        group = groups.setdefault((normalize_currency(currency_code), status or ''), [0, 0])
+        group[0] += count
+        group[1] += to_cents(total)
+        missing_totals = missing_totals or totalled < count
+
+    if missing_totals:
+        rows = session.execute(
+            select(currency, Invoice.status, Invoice.data)
+            .where(Invoice.user_id == user_id, Invoice.total.is_(None))
+        ).all()
+        totals = TotalsBatch(row.data for row in rows).compute()
+        for i, (currency_code, status, _) in enumerate(rows):
+            groups[(normalize_currency(currency_code), status or '')][1] += totals.total[i]
+
+    return groups
+
+
+def _invoice_groups_in_process(user_id, session):
+    """invoice_groups() for other databases (SQLite test runs), which lack json_typeof"""
+    rows = session.execute(
+        select(Invoice.data, Invoice.currency, Invoice.status, Invoice.total).where(Invoice.user_id == user_id)
+    ).all()
+    groups = {}
+    for row in rows:
+        group = groups.setdefault((invoice_currency(row.data, row.currency), row.status or ''), [0, 0])
+        group[0] += 1
+        group[1] += to_cents(row.total) if row.total is not None else to_cents(invoice_total(row.data))
+    return groups
+
+
+def rollup_groups(user_id, session=None):
+    """
+    {(currency, status): [count, total_cents]} from the rollup table, or
+    None when the user has no rollup rows.
+    """
+    session = session or db.session
+    user_id = _as_uuid(user_id)
+    rows = session.execute(
+        select(rollups.c.currency, rollups.c.status, rollups.c.invoice_count, rollups.c.total_amount)
+        .where(rollups.c.user_id == user_id)
+    ).all()
+    if not rows:
+        return None
+    return {(currency, status): [count, to_cents(total)] for currency, status, count, total in rows}
+
+
+def user_groups(user_id, session=None):
+    """Rollup rows when they exist, otherwise the live grouped query"""
+    groups = rollup_groups(user_id, session)
+    return groups if groups is not None else invoice_groups(user_id, session)
+
+
+def _lock_user(session, user_id):
+    """Serialize rollup writes per user for the rest of the transaction"""
+    # Other databases (SQLite test runs) already serialize writers
+    if _is_postgres(session):
+        session.execute(select(func.pg_advisory_xact_lock(func.hashtext(str(user_id)))))
+
+
+def rebuild_user_rollups(user_id, session=None):
+    """Replace a user's rollup rows with freshly computed ones; caller commits"""
+    session = session or db.session
+    user_id = _as_uuid(user_id)
+    _lock_user(session, user_id)
+    groups = invoice_groups(user_id, session)
+
+    session.execute(delete(rollups).where(rollups.c.user_id == user_id))
+    now = datetime.utcnow()
+    rows = []
+    for (currency, status), (count, cents) in groups.items():
+        if count <= 0:
+            continue
+        rows.append(_rollup_row(user_id, currency, status, count, cents, now))
+    if rows:
+        session.execute(rollups.insert(), rows)
+    return len(rows)
+
+
+def apply_rollup_deltas(deltas, session=None):
+    """
+    Add {(user_id, currency, status): [count, total_cents]} deltas to the
+    rollup rows; rows that drop to zero invoices are removed.
+    """
+    session = session or db.session
+    now = datetime.utcnow()
+    values = []
+    for (user_id, currency, status), (count, cents) in deltas.items():
+        if count == 0 and cents == 0:
+            continue
+        values.append(_rollup_row(user_id, currency, status, count, cents, now))
+    if not values:
+        return
+
+    if _is_postgres(session):
+        _upsert_rollup_rows(values, session)
+    else:
+        _add_rollup_rows(values, session)
+    session.execute(delete(rollups).where(
+        rollups.c.user_id.in_({row['user_id'] for row in values}),
+        rollups.c.invoice_count <= 0
+    ))
+
+
+_SUMMED = ('invoice_count', 'total_amount', 'outstanding_amount', 'overdue_amount')
+
+
+def _upsert_rollup_rows(values, session):
+    stmt = pg_insert(rollups).values(values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[rollups.c.user_id, rollups.c.currency, rollups.c.status],
+        set_={
+            'invoice_count': rollups.c.invoice_count + stmt.excluded.invoice_count,
+            'total_amount': rollups.c.total_amount + stmt.excluded.total_amount,
+            'outstanding_amount': rollups.c.outstanding_amount + stmt.excluded.outstanding_amount,
+            'overdue_amount': rollups.c.overdue_amount + stmt.excluded.overdue_amount,
+            'updated_at': stmt.excluded.updated_at,
+        }
+    )
+    session.execute(stmt)
+
+
+def _add_rollup_rows(values, session):
+    """_upsert_rollup_rows() as select-then-update/insert, for other databases (SQLite test runs)"""
+    for row in values:
+        key = (rollups.c.user_id == row['user_id'], rollups.c.currency == row['currency'],
+               rollups.c.status == row['status'])
+        if session.execute(select(rollups.c.user_id).where(*key)).first() is None:
+            session.execute(rollups.insert().values(row))
+        else:
+            session.execute(update(rollups).where(*key).values(
+                updated_at=row['updated_at'],
+                **{column: rollups.c[column] + row[column] for column in _SUMMED}
+            ))
+
+
+def record_rollup_changes(deltas, rebuild=(), session=None):
+    """
+    Apply {(user_id, currency, status): [count, total_cents]} deltas (user
+    ids as strings) for invoice changes already written in this
+    transaction. Users in
+    `rebuild`, and users without rollup rows yet, are rebuilt instead.
+    """
+    session = session or db.session
+    rebuild = {str(_as_uuid(user_id)) for user_id in rebuild}
+    users = {user_id for user_id, _, _ in deltas} | rebuild
+    if not users:
+        return
+
+    for user_id in sorted(users):
+        _lock_user(session, user_id)
+    built = {
+        str(user_id) for user_id in session.execute(
+            select(rollups.c.user_id).where(rollups.c.user_id.in_([_as_uuid(u) for u in users])).distinct()
+        ).scalars()
+    }
+
+    # A full build already sees the changes, so their deltas are dropped
+    rebuild |= users - built
+    for user_id in rebuild:
+        rebuild_user_rollups(user_id, session)
+    apply_rollup_deltas(
+        {key: delta for key, delta in deltas.items() if key[0] not in rebuild},
+        session
+    )
+
+
+# ─── Incremental maintenance ────────────────────────────────────────────────
+
+def _contribution(values):
+    """(user_id, currency, status, total_cents) of one invoice state"""
+    total = values['total']
+    cents = to_cents(total) if total is not None else to_cents(invoice_total(values['data']))
+    return (
+        str(_as_uuid(values['user_id'])),
+        invoice_currency(values['data'], values['currency']),
+        values['status'] or '',
+        cents,
+    )
+
+
+def _previous_values(invoice):
+    """Committed values of the tracked attributes, or None if any was never loaded"""
+    state = inspect(invoice)
+    values = {}
+    for key in _TRACKED:
+        history = state.attrs[key].history
+        if history.deleted:
+            values[key] = history.deleted[0]
+        elif history.unchanged:
+            values[key] = history.unchanged[0]
+        else:
+            return None
+    return values
+
+
+def _current_values(invoice):
+    return {key: getattr(invoice, key) for key in _TRACKED}
+
+
+def _tracked_changes(invoice):
+    state = inspect(invoice)
+    return any(state.attrs[key].history.has_changes() for key in _TRACKED)
+
+
+def _maintain_rollups(session, flush_context):
+    deltas = {}
+    rebuild = set()
+
+    def add(values, sign):
+        user_id, currency, status, cents = _contribution(values)
+        delta = deltas.setdefault((user_id, currency, status), [0, 0])
+        delta[0] += sign
+        delta[1] += sign * cents
+
+    for invoice in session.new:
+        if isinstance(invoice, Invoice):
+            add(_current_values(invoice), 1)
+
+    for invoice in session.dirty:
+        if isinstance(invoice, Invoice) and _tracked_changes(invoice):
+            previous = _previous_values(invoice)
+            if previous is None:
+                rebuild.add(invoice.user_id)
+                continue
+            add(previous, -1)
+            add(_current_values(invoice), 1)
+
+    for invoice in session.deleted:
+        if isinstance(invoice, Invoice):
+            previous = _previous_values(invoice)
+            user_id = inspect(invoice).attrs.user_id.loaded_value
+            if previous is not None:
+                add(previous, -1)
+            elif user_id is not NO_VALUE:
+                rebuild.add(user_id)
+            else:
+                logging.warning(
+                    f"Deleted invoice {inspect(invoice).identity} was never loaded; "
+                    "dashboard rollups drift until the next rebuild"
+                )
+
+    record_rollup_changes(deltas, rebuild, session)
+
+
+def register_rollup_maintenance():
+    """Install the after_flush hook that keeps user_dashboard_rollups current"""
+    if not event.contains(Session, 'after_flush', _maintain_rollups):
+        event.listen(Session, 'after_flush', _maintain_rollups)
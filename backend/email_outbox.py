@@ -0,0 +1,265 @@
+# email_outbox.py
+"""
+Durable outbound email.
+
+POST /api/send-invoice builds the Brevo request body and enqueue_email()s it
+into the email_outbox table, answering 202 with the outbox row's id; the
+worker (email_worker.py) sends it. Nothing waits on Brevo inside a request.
+
+Each row moves queued -> sending -> sent | failed:
+    - claim_batch() takes due rows with FOR UPDATE SKIP LOCKED, so several
+      workers can run, and leases them for EMAIL_LEASE seconds. A worker
+      that dies mid-send leaves its rows to be claimed again after that.
+    - 2xx is sent. 429, 5xx and network errors are retried after
+      EMAIL_BACKOFF_BASE * 2^(attempt-1) seconds (capped at
+      EMAIL_BACKOFF_MAX, with jitter) until EMAIL_MAX_ATTEMPTS; any other
+      4xx fails at once. The sender is notified when a send fails for good.
+    - Every row has a unique idempotency key, so a retried POST does not
+      queue a second email. It is derived from the request's Idempotency-Key
+      header and the sender's user id; without a header, from the invoice,
+      recipient and exact email content, so the same email posted twice
+      within EMAIL_DEDUP_WINDOW seconds is queued once. Keys are scoped to
+      the user: another user's key never matches. The key is passed to Brevo
+      as the idempotencyKey header so a send retried after a lost response
+      is not delivered twice.
+
+EMAIL_API_URL points the worker at another endpoint, e.g. a local fake
+server in tests; BREVO_API_KEY is sent as its api-key header.
+"""
+import hashlib
+import json
+import logging
+import os
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import requests
+from sqlalchemy import or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from db import db
+from models import EmailOutbox
+from notification_utils import create_notification
+
+EMAIL_API_URL = os.getenv('EMAIL_API_URL', 'https://api.brevo.com/v3/smtp/email')
+EMAIL_SEND_TIMEOUT = float(os.getenv('EMAIL_SEND_TIMEOUT', '15'))
+EMAIL_MAX_ATTEMPTS = int(os.getenv('EMAIL_MAX_ATTEMPTS', '6'))
+EMAIL_BACKOFF_BASE = float(os.getenv('EMAIL_BACKOFF_BASE', '30'))
+EMAIL_BACKOFF_MAX = float(os.getenv('EMAIL_BACKOFF_MAX', '3600'))
+EMAIL_LEASE = float(os.getenv('EMAIL_LEASE', '120'))
+EMAIL_CLAIM_BATCH = int(os.getenv('EMAIL_CLAIM_BATCH', '20'))
+EMAIL_DEDUP_WINDOW = int(os.getenv('EMAIL_DEDUP_WINDOW', '600'))
+
+outbox = EmailOutbox.__table__
+
+
+def _as_uuid(value):
+    try:
+        return uuid.UUID(str(value)) if value else None
+    except ValueError:
+        return None
+
+
+def format_outbox_response(message):
+    """Client-facing fields of an outbox row (no payload)"""
+    return {
+        'id': str(message.id),
+        'invoice_id': str(message.invoice_id) if message.invoice_id else None,
+        'recipient': message.recipient,
+        'status': message.status,
+        'attempts': message.attempts,
+        'last_error': message.last_error,
+        'provider_message_id': message.provider_message_id,
+        'next_attempt_at': message.next_attempt_at.isoformat() if message.status == 'queued' else None,
+        'created_at': message.created_at.isoformat() if message.created_at else None,
+        'sent_at': message.sent_at.isoformat() if message.sent_at else None,
+    }
+
+
+def outbox_key(payload, recipient, invoice_id=None, user_id=None, idempotency_key=None, now=None):
+    """
+    Stored idempotency key of a send: the client's key scoped to the user,
+    or, without one, a digest of what is being sent and to whom, bucketed
+    by EMAIL_DEDUP_WINDOW so a deliberate resend later is queued again.
+    """
+    if idempotency_key:
+        parts = ('client', user_id, idempotency_key)
+    else:
+        bucket = int((now or time.time()) // EMAIL_DEDUP_WINDOW)
+        content = json.dumps(payload, sort_keys=True, default=str)
+        parts = ('derived', user_id, invoice_id, recipient.lower(), content, bucket)
+    return hashlib.sha256('\x1f'.join('' if part is None else str(part) for part in parts).encode()).hexdigest()
+
+
+def _find_by_key(key, user_id):
+    return EmailOutbox.query.filter_by(idempotency_key=key, user_id=user_id).first()
+
+
+def enqueue_email(payload, recipient, invoice_id=None, user_id=None, idempotency_key=None):
+    """
+    Queue one email and commit. Returns (row, created); an existing row of
+    the same user with the same idempotency key (see outbox_key) is
+    returned as is, with created False.
+    """
+    user_id = _as_uuid(user_id)
+    key = outbox_key(payload, recipient, _as_uuid(invoice_id), user_id, idempotency_key)
+    existing = _find_by_key(key, user_id)
+    if existing is not None:
+        return existing, False
+
+    payload = dict(payload)
+    payload['headers'] = {**payload.get('headers', {}), 'idempotencyKey': key}
+    message = EmailOutbox(
+        idempotency_key=key,
+        recipient=recipient,
+        payload=payload,
+        invoice_id=_as_uuid(invoice_id),
+        user_id=user_id,
+        status='queued',
+        attempts=0,
+        next_attempt_at=datetime.utcnow(),
+    )
+    db.session.add(message)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # The same key raced in from another request
+        db.session.rollback()
+        return _find_by_key(key, user_id), False
+    return message, True
+
+
+def invoice_email_status(invoice_id, user_id, limit=20):
+    """Sends of one invoice by one user, newest first"""
+    return (EmailOutbox.query
+            .filter_by(invoice_id=invoice_id, user_id=user_id)
+            .order_by(EmailOutbox.created_at.desc())
+            .limit(limit)
+            .all())
+
+
+# ─── Worker ─────────────────────────────────────────────────────────────────
+
+def backoff(attempts):
+    """Seconds before retry number `attempts` (1-based), with up to 10% jitter"""
+    delay = min(EMAIL_BACKOFF_BASE * 2 ** (attempts - 1), EMAIL_BACKOFF_MAX)
+    return delay * random.uniform(0.9, 1.0)
+
+
+def claim_batch(limit=EMAIL_CLAIM_BATCH, now=None):
+    """
+    Lease up to `limit` due messages to this worker and commit. Due means
+    queued and past next_attempt_at, or sending with an expired lease.
+    Returns the claimed rows (id, payload, attempts, ...).
+    """
+    now = now or datetime.utcnow()
+    due = select(EmailOutbox.id).where(
+        or_(EmailOutbox.status == 'queued', EmailOutbox.status == 'sending'),
+        EmailOutbox.next_attempt_at <= now
+    ).order_by(EmailOutbox.next_attempt_at).limit(limit).with_for_update(skip_locked=True)
+
+    rows = db.session.execute(
+        update(outbox)
+        .where(EmailOutbox.id.in_(due.scalar_subquery()))
+        .values(status='sending', attempts=EmailOutbox.attempts + 1,
+                next_attempt_at=now + timedelta(seconds=EMAIL_LEASE), updated_at=now)
+        .returning(EmailOutbox.id, EmailOutbox.user_id, EmailOutbox.invoice_id, EmailOutbox.recipient,
+                   EmailOutbox.payload, EmailOutbox.attempts)
+    ).all()
+    db.session.commit()
+    return rows
+
+
+def deliver(payload, url=None, timeout=EMAIL_SEND_TIMEOUT):
+    """
+    POST one message to the provider. Returns (outcome, detail):
+    ('sent', provider message id), ('retry', error) or ('failed', error).
+    """
+    try:
+        res = requests.post(
+            url or EMAIL_API_URL,
+            headers={
+                'accept': 'application/json',
+                'content-type': 'application/json',
+                'api-key': os.getenv('BREVO_API_KEY')
+            },
+            json=payload,
+            timeout=timeout
+        )
+    except requests.RequestException as e:
+        return 'retry', f"{type(e).__name__}: {str(e)}"
+
+    try:
+        body = res.json()
+    except ValueError:
+        body = {}
+    if not isinstance(body, dict):
+        body = {}
+
+    if 200 <= res.status_code < 300:
+        return 'sent', body.get('messageId')
+    error = f"{res.status_code}: {body.get('message') or res.text[:500] or res.reason}"
+    if res.status_code == 429 or res.status_code >= 500:
+        return 'retry', error
+    return 'failed', error
+
+
+def record_result(row, outcome, detail, now=None):
+    """
+    Store one send's outcome and commit; returns the row's new status, or
+    None if the lease expired and another worker has claimed the row since.
+    """
+    now = now or datetime.utcnow()
+    if outcome == 'sent':
+        values = {'status': 'sent', 'provider_message_id': detail, 'sent_at': now, 'last_error': None}
+    elif outcome == 'retry' and row.attempts < EMAIL_MAX_ATTEMPTS:
+        values = {'status': 'queued', 'last_error': detail,
+                  'next_attempt_at': now + timedelta(seconds=backoff(row.attempts))}
+    else:
+        values = {'status': 'failed', 'last_error': detail}
+
+    # Only while this worker still holds the lease
+    result = db.session.execute(
+        update(outbox)
+        .where(EmailOutbox.id == row.id, EmailOutbox.status == 'sending', EmailOutbox.attempts == row.attempts)
+        .values(updated_at=now, **values)
+    )
+    db.session.commit()
+    if not result.rowcount:
+        return None
+
+    if values['status'] == 'failed' and row.user_id:
+        create_notification(
+            user_id=str(row.user_id),
+            title='Invoice Email Failed',
+            message=f"Could not send email to {row.recipient}: {detail}",
+            type='error',
+            related_entity_type='invoice' if row.invoice_id else None,
+            related_entity_id=str(row.invoice_id) if row.invoice_id else None
+        )
+    return values['status']
+
+
+def process_batch(limit=EMAIL_CLAIM_BATCH, url=None):
+    """Claim and send one batch; returns {status: count}"""
+    counts = {}
+    for row in claim_batch(limit):
+        if row.attempts > EMAIL_MAX_ATTEMPTS:
+            # Its last attempt's worker died mid-send
+            outcome, detail = 'failed', 'Gave up after the last attempt did not finish'
+        else:
+            outcome, detail = deliver(row.payload, url=url)
+        try:
+            status = record_result(row, outcome, detail)
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Error recording email {row.id} as {outcome}: {str(e)}")
+            continue
+        if status is None:
+            continue
+        if outcome != 'sent':
+            logging.warning(f"Email {row.id} to {row.recipient} attempt {row.attempts}: {detail}")
+        counts[status] = counts.get(status, 0) + 1
+    return counts
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+"""
+Send queued emails from the email_outbox table (see email_outbox.py).
+
+Each pass claims up to --batch-size due messages, sends them one by one and
+records each outcome; it keeps claiming until nothing is due. Several
+workers can run side by side.
+
+    python email_worker.py --once               # drain what is due, then exit
+    python email_worker.py --interval 5         # keep polling every 5 seconds
+    EMAIL_API_URL=http://localhost:8025/v3/smtp/email python email_worker.py --once
+"""
+import argparse
+import sys
+import os
+import time
+
+# Add the current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from db import db
+from email_outbox import EMAIL_CLAIM_BATCH, process_batch
+
+# Import your app instance directly
+from app import app
+
+
+def send_queued_emails(batch_size=EMAIL_CLAIM_BATCH):
+    """Send everything that is due; returns {status: count}"""
+
+    with app.app_context():
+        totals = {}
+        while True:
+            try:
+                counts = process_batch(batch_size)
+            except Exception as e:
+                db.session.rollback()
+                print(f"❌ Error sending queued emails: {str(e)}")
+                return totals
+
+            for status, count in counts.items():
+                totals[status] = totals.get(status, 0) + count
+            if sum(counts.values()) < batch_size:
+                break
+
+        if totals:
+            print(f"✅ Emails: {', '.join(f'{count} {status}' for status, count in sorted(totals.items()))}")
+        return totals
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Send queued emails with retries")
+    parser.add_argument('--batch-size', type=int, default=EMAIL_CLAIM_BATCH)
+    parser.add_argument('--interval', type=float, default=5, help="seconds between polls")
+    parser.add_argument('--once', action='store_true', help="drain what is due and exit")
+    args = parser.parse_args()
+
+    while True:
+        send_queued_emails(batch_size=args.batch_size)
+        if args.once:
+            break
+        time.sleep(args.interval)
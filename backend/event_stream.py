@@ -0,0 +1,391 @@
+# event_stream.py
+"""
+Server-sent events for the dashboard.
+
+    GET /api/events/stream?user_id=...      (routes/events.py)
+
+Events are published per user, after the write that caused them commits:
+    notification           a notification was created (the writer's batch,
+                           POST /api/notifications, the overdue sweeper)
+    invoice.status         an invoice moved from one status to another
+Each carries an id (publish time in nanoseconds), and a reconnecting
+client's Last-Event-ID is answered from a short per-user replay buffer
+(EVENTS_REPLAY_WINDOW seconds, default 120). When the events it missed
+cannot be replayed the stream sends `resync` and the client refetches.
+
+Invoice status changes made through the session are picked up by an
+after_flush hook and published by an after_commit hook. Core-level writes
+(bulk status changes, the sweeper) must call publish_events() themselves
+after committing.
+
+Fan-out (EVENTS_BACKEND):
+    memory (default)  each process delivers its own events to its own
+                      streams. Fine for a single worker.
+    postgres          publishing runs pg_notify(EVENTS_CHANNEL, ...) and a
+                      LISTEN connection in every process that serves streams
+                      delivers them, so an event reaches the client whichever
+                      gunicorn worker (or process, e.g. the sweeper) made it.
+
+An idle stream only waits on its queue, so it costs a greenlet when the app
+runs under gevent (the `events` process in the Procfile). Under the gthread
+web workers every stream holds a thread instead, so at most
+EVENTS_MAX_THREAD_STREAMS streams are served there and the rest get 503.
+"""
+import json
+import logging
+import os
+import queue
+import select
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import event, func, inspect, select as sql_select
+from sqlalchemy.orm import Session
+
+from db import db
+from models import Invoice
+
+EVENTS_BACKEND = os.getenv('EVENTS_BACKEND', 'memory').lower()
+EVENTS_CHANNEL = os.getenv('EVENTS_CHANNEL', 'envoyce_events')
+EVENTS_HEARTBEAT = float(os.getenv('EVENTS_HEARTBEAT', '15'))
+EVENTS_QUEUE_SIZE = int(os.getenv('EVENTS_QUEUE_SIZE', '100'))
+EVENTS_REPLAY_WINDOW = float(os.getenv('EVENTS_REPLAY_WINDOW', '120'))
+EVENTS_MAX_THREAD_STREAMS = int(os.getenv('EVENTS_MAX_THREAD_STREAMS', '2'))
+
+# NOTIFY payloads must stay under 8000 bytes
+MAX_PAYLOAD = 7900
+
+
+def serving_with_gevent():
+    """True when gevent has patched this process (gunicorn --worker-class gevent)"""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('socket')
+
+
+def make_event(user_id, event_type, data):
+    return {'id': str(time.time_ns()), 'user_id': str(user_id), 'type': event_type, 'data': data}
+
+
+def notification_event(notification):
+    """A `notification` event from a Notification or a row dict of its columns"""
+    get = notification.get if isinstance(notification, dict) else lambda key: getattr(notification, key, None)
+    related_id = get('related_entity_id')
+    created_at = get('created_at')
+    return make_event(get('user_id'), 'notification', {
+        'id': str(get('id')),
+        'title': get('title'),
+        'message': get('message'),
+        'type': get('type') or 'info',
+        'related_entity_type': get('related_entity_type'),
+        'related_entity_id': str(related_id) if related_id else None,
+        'created_at': created_at.isoformat() if created_at else None,
+    })
+
+
+def invoice_status_event(user_id, invoice_id, invoice_number, previous_status, status):
+    return make_event(user_id, 'invoice.status', {
+        'invoice_id': str(invoice_id),
+        'invoice_number': invoice_number,
+        'previous_status': previous_status,
+        'status': status,
+    })
+
+
+# ─── In-process broker ──────────────────────────────────────────────────────
+
+class Subscription:
+    """One open stream's queue of events"""
+
+    def __init__(self, user_id, size=EVENTS_QUEUE_SIZE):
+        self.user_id = user_id
+        self.queue = queue.Queue(size)
+        self.overflowed = False
+
+    def put(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            # A stream this far behind is told to resync rather than fed a gap
+            self.overflowed = True
+
+    def get(self, timeout):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class EventBroker:
+    """Per-user subscriber queues plus a short replay buffer of recent events"""
+
+    def __init__(self, replay_window=EVENTS_REPLAY_WINDOW):
+        self.replay_window = replay_window
+        self.started = time.time_ns()
+        self._subscribers = {}  # user_id -> set of Subscription
+        self._recent = {}  # user_id -> deque of (received_at, event)
+        self._next_prune = 0.0
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        subscription = Subscription(str(user_id))
+        with self._lock:
+            self._subscribers.setdefault(subscription.user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def dispatch(self, item):
+        """Deliver one event to this process's streams for its user"""
+        now = time.monotonic()
+        with self._lock:
+            recent = self._recent.setdefault(item['user_id'], deque())
+            recent.append((now, item))
+            self._prune(now)
+            subscribers = list(self._subscribers.get(item['user_id'], ()))
+        for subscription in subscribers:
+            subscription.put(item)
+
+    def replay(self, user_id, last_id):
+        """
+        Events for `user_id` published after `last_id`, oldest first, or None
+        when some of them may already have left the buffer.
+        """
+        try:
+            last_id = int(last_id)
+        except (TypeError, ValueError):
+            return None
+        with self._lock:
+            self._prune(time.monotonic())
+            recent = list(self._recent.get(str(user_id), ()))
+        # The buffer holds everything since this process started, back to the
+        # replay window; anything older may have been missed
+        horizon = time.time_ns() - int(self.replay_window * 1e9)
+        if last_id < self.started or last_id < horizon:
+            return None
+        return [item for _, item in recent if int(item['id']) > last_id]
+
+    def _prune(self, now):
+        # Called with the lock held
+        if now < self._next_prune:
+            return
+        self._next_prune = now + 1
+        cutoff = now - self.replay_window
+        for user_id in list(self._recent):
+            recent = self._recent[user_id]
+            while recent and recent[0][0] < cutoff:
+                recent.popleft()
+            if not recent:
+                del self._recent[user_id]
+
+
+broker = EventBroker()
+
+
+# ─── PostgreSQL LISTEN/NOTIFY ───────────────────────────────────────────────
+
+class PostgresListener:
+    """A LISTEN connection, outside the pool, that dispatches every NOTIFY to the broker"""
+
+    def __init__(self, channel=EVENTS_CHANNEL, poll_interval=EVENTS_HEARTBEAT):
+        self.channel = channel
+        self.poll_interval = poll_interval
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self, engine):
+        with self._lock:
+            # A forked worker does not inherit the parent's thread
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, args=(engine,), name='event-listener', daemon=True)
+            self._thread.start()
+
+    def _run(self, engine):
+        while True:
+            try:
+                self._listen(engine)
+            except Exception as e:
+                logging.error(f"Event listener connection lost, reconnecting: {str(e)}")
+                time.sleep(5)
+
+    def _listen(self, engine):
+        pooled = engine.raw_connection()
+        pooled.detach()  # held for good; keep it out of the pool's size
+        connection = pooled.driver_connection
+        try:
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                cursor.execute(f'LISTEN "{self.channel}"')
+            logging.info(f"Listening for events on {self.channel}")
+            while True:
+                select.select([connection], [], [], self.poll_interval)
+                connection.poll()
+                while connection.notifies:
+                    notify = connection.notifies.pop(0)
+                    try:
+                        broker.dispatch(json.loads(notify.payload))
+                    except (ValueError, KeyError) as e:
+                        logging.warning(f"Ignoring malformed event payload: {str(e)}")
+        finally:
+            pooled.close()
+
+
+listener = PostgresListener()
+
+
+# ─── Publishing ─────────────────────────────────────────────────────────────
+
+def _payload(item):
+    payload = json.dumps(item, default=str)
+    if len(payload) > MAX_PAYLOAD:
+        # Too big to NOTIFY; the client refetches what it needs
+        payload = json.dumps({**item, 'data': {'truncated': True}})
+    return payload
+
+
+def publish_events(events, engine=None):
+    """Publish committed events; `engine` defaults to db.engine (needs an app context)"""
+    events = [item for item in events if item]
+    if not events:
+        return
+    if EVENTS_BACKEND != 'postgres':
+        for item in events:
+            broker.dispatch(item)
+        return
+    try:
+        with (engine or db.engine).connect() as connection:
+            for item in events:
+                connection.execute(sql_select(func.pg_notify(EVENTS_CHANNEL, _payload(item))))
+            connection.commit()
+    except Exception as e:
+        logging.error(f"Error publishing {len(events)} events: {str(e)}")
+
+
+def ensure_listening():
+    """Start this process's LISTEN connection if events arrive through PostgreSQL (needs an app context)"""
+    if EVENTS_BACKEND == 'postgres':
+        listener.ensure_started(db.engine)
+
+
+def subscribe(user_id):
+    return broker.subscribe(user_id)
+
+
+def unsubscribe(subscription):
+    broker.unsubscribe(subscription)
+
+
+# ─── Invoice status transitions made through the session ────────────────────
+
+def _note_invoice_transitions(session, flush_context):
+    pending = None
+    for invoice in session.dirty:
+        if not isinstance(invoice, Invoice):
+            continue
+        history = inspect(invoice).attrs.status.history
+        if not history.has_changes():
+            continue
+        previous = history.deleted[0] if history.deleted else None
+        if previous == invoice.status:
+            continue
+        if pending is None:
+            pending = session.info.setdefault('pending_events', [])
+        pending.append(invoice_status_event(
+            invoice.user_id, invoice.id, invoice.invoice_number, previous, invoice.status
+        ))
+
+
+def _publish_pending_events(session):
+    events = session.info.pop('pending_events', None)
+    if events:
+        publish_events(events)
+
+
+def _forget_pending_events(session, previous_transaction):
+    session.info.pop('pending_events', None)
+
+
+def register_event_publishing():
+    """Install the session hooks that publish invoice status transitions"""
+    if not event.contains(Session, 'after_flush', _note_invoice_transitions):
+        event.listen(Session, 'after_flush', _note_invoice_transitions)
+        event.listen(Session, 'after_commit', _publish_pending_events)
+        event.listen(Session, 'after_soft_rollback', _forget_pending_events)
+
+
+# ─── Streaming ──────────────────────────────────────────────────────────────
+
+_thread_streams = threading.BoundedSemaphore(EVENTS_MAX_THREAD_STREAMS) if EVENTS_MAX_THREAD_STREAMS > 0 else None
+
+
+def acquire_stream_slot():
+    """
+    Reserve a slot for one stream; False when this worker has none left.
+    Unlimited under gevent. Release with release_stream_slot().
+    """
+    if serving_with_gevent():
+        return True
+    return _thread_streams is not None and _thread_streams.acquire(blocking=False)
+
+
+def release_stream_slot():
+    if not serving_with_gevent():
+        _thread_streams.release()
+
+
+def format_sse(item=None, event_type=None, data=None, event_id=None):
+    """One SSE message: an event dict, or an explicit type/data"""
+    if item is not None:
+        event_type, data, event_id = item['type'], item['data'], item['id']
+    lines = []
+    if event_id:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event_type}')
+    lines.append(f'data: {json.dumps(data, default=str)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+def stream(user_id, last_event_id=None, heartbeat=EVENTS_HEARTBEAT):
+    """
+    Generator of SSE text for one client; unsubscribes when the client goes
+    away. Needs no app context, so the request's context (and its database
+    session) can end before the stream starts.
+    """
+    subscription = subscribe(user_id)
+    try:
+        yield f'retry: {int(heartbeat * 1000)}\n\n'
+        replayed = 0
+        if last_event_id:
+            missed = broker.replay(user_id, last_event_id)
+            if missed is None:
+                yield format_sse(event_type='resync', data={})
+            else:
+                for item in missed:
+                    replayed = int(item['id'])
+                    yield format_sse(item)
+        else:
+            yield format_sse(event_type='ready', data={'user_id': str(user_id)})
+
+        while True:
+            item = subscription.get(heartbeat)
+            if subscription.overflowed:
+                subscription.overflowed = False
+                yield format_sse(event_type='resync', data={})
+            if item is None:
+                yield ': keepalive\n\n'
+            elif int(item['id']) > replayed:  # the replay may already have sent it
+                yield format_sse(item)
+    finally:
+        unsubscribe(subscription)
@@ -0,0 +1,24 @@
+# gunicorn.conf.py
+"""
+Gunicorn settings, picked up automatically when gunicorn starts in this
+directory (see Procfile).
+
+Each web worker starts its render pool right after loading the app so the
+pool processes parse template CSS and initialise fonts before the first
+request. Set RENDER_WARMUP=0 to skip this.
+
+The `events` process runs gevent workers for /api/events/stream only (route
+it there at the proxy, with EVENTS_BACKEND=postgres so the web workers'
+events reach it). It renders nothing, so it skips the warm-up.
+"""
+import os
+
+
+def post_worker_init(worker):
+    if os.getenv('RENDER_WARMUP', '1') == '0' or 'gevent' in worker.cfg.worker_class_str:
+        return
+    try:
+        from app import render_pool
+        render_pool.warm_up()
+    except Exception as e:
+        worker.log.warning(f"Render pool warm-up failed: {e}")
@@ -0,0 +1,190 @@
+# invoice_export.py
+"""
+Batch export of invoice PDFs.
+
+Invoices are selected by id list or by filter, rendered on the render pool
+with a bounded number of renders in flight, and written out as they finish
+- either into a ZIP built incrementally over a generator, or merged into
+one PDF (capped, since WeasyPrint has to hold every page to merge them).
+Only the invoice ids, one batch of rows and `window` rendered PDFs are
+held in memory at any point.
+"""
+import os
+import zipfile
+from collections import deque
+from datetime import datetime
+
+from models import Invoice
+from invoices import InvoiceOperations
+
+EXPORT_MAX_INVOICES = int(os.getenv('EXPORT_MAX_INVOICES', 5000))
+EXPORT_MERGE_MAX = int(os.getenv('EXPORT_MERGE_MAX', 200))
+EXPORT_BATCH_SIZE = 50
+EXPORT_DATE_FIELDS = ('issued_date', 'due_date', 'created_at')
+
+
+def _parse_date(value, name):
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid {name}, expected an ISO date")
+
+
+def parse_export_request(body):
+    """
+    Validate the export body:
+        {"invoice_ids": [...], "user_id": optional, "format": "zip" | "pdf"}
+     or {"user_id": ..., "status": optional, "date_from": optional,
+         "date_to": optional, "date_field": "issued_date", "format": ...}
+    Raises ValueError with a user-facing message.
+    """
+    if not body:
+        raise ValueError('No data provided')
+
+    export_format = (body.get('format') or 'zip').lower()
+    if export_format not in ('zip', 'pdf'):
+        raise ValueError("format must be 'zip' or 'pdf'")
+
+    user_id = body.get('user_id')
+    if user_id and not InvoiceOperations.validate_uuid(user_id):
+        raise ValueError('Invalid user ID format')
+
+    criteria = {'format': export_format, 'user_id': user_id}
+
+    invoice_ids = body.get('invoice_ids')
+    if invoice_ids is not None:
+        if not isinstance(invoice_ids, list) or not invoice_ids:
+            raise ValueError('invoice_ids must be a non-empty list')
+        for invoice_id in invoice_ids:
+            if not InvoiceOperations.validate_uuid(invoice_id):
+                raise ValueError(f'Invalid invoice ID format: {invoice_id}')
+        criteria['invoice_ids'] = invoice_ids
+        return criteria
+
+    if not user_id:
+        raise ValueError('Either invoice_ids or user_id is required')
+
+    status = body.get('status')
+    if status and not InvoiceOperations.validate_status(status):
+        raise ValueError('Invalid status filter')
+
+    date_field = body.get('date_field', 'issued_date')
+    if date_field not in EXPORT_DATE_FIELDS:
+        raise ValueError(f"date_field must be one of: {', '.join(EXPORT_DATE_FIELDS)}")
+
+    criteria.update({
+        'status': status.lower() if status else None,
+        'date_field': date_field,
+        'date_from': _parse_date(body['date_from'], 'date_from') if body.get('date_from') else None,
+        'date_to': _parse_date(body['date_to'], 'date_to') if body.get('date_to') else None,
+    })
+    return criteria
+
+
+def export_query(criteria):
+    """Invoice query for the parsed criteria, oldest first"""
+    query = Invoice.query
+    if criteria.get('user_id'):
+        query = query.filter(Invoice.user_id == criteria['user_id'])
+
+    if criteria.get('invoice_ids'):
+        query = query.filter(Invoice.id.in_(criteria['invoice_ids']))
+    else:
+        if criteria.get('status'):
+            query = query.filter(Invoice.status == criteria['status'])
+        column = getattr(Invoice, criteria['date_field'])
+        if criteria.get('date_from'):
+            query = query.filter(column >= criteria['date_from'])
+        if criteria.get('date_to'):
+            query = query.filter(column <= criteria['date_to'])
+
+    return query.order_by(Invoice.issued_date.asc(), Invoice.created_at.asc(), Invoice.id.asc())
+
+
+def export_invoice_ids(query):
+    return [invoice_id for (invoice_id,) in query.with_entities(Invoice.id)]
+
+
+def iter_invoices(invoice_ids, batch_size=EXPORT_BATCH_SIZE):
+    """Load invoices a batch at a time, in the order of `invoice_ids`"""
+    for start in range(0, len(invoice_ids), batch_size):
+        chunk = invoice_ids[start:start + batch_size]
+        by_id = {invoice.id: invoice for invoice in Invoice.query.filter(Invoice.id.in_(chunk))}
+        for invoice_id in chunk:
+            if invoice_id in by_id:
+                yield by_id[invoice_id]
+
+
+def export_filename(invoice, used):
+    """invoice_<number>.pdf, made unique within one export"""
+    number = invoice.data.get('invoice_number') if isinstance(invoice.data, dict) else None
+    base = f"invoice_{number or invoice.id}"
+    base = ''.join(c if c.isalnum() or c in '-_.' else '_' for c in str(base))
+    name = f"{base}.pdf"
+    suffix = 2
+    while name in used:
+        name = f"{base}_{suffix}.pdf"
+        suffix += 1
+    used.add(name)
+    return name
+
+
+def render_windowed(jobs, window):
+    """
+    Keep at most `window` renders in flight. `jobs` yields (name, start)
+    where start() returns a future; yields (name, pdf_bytes, error) in job
+    order as results come back.
+    """
+    in_flight = deque()
+    for name, start in jobs:
+        in_flight.append((name, start()))
+        if len(in_flight) >= window:
+            yield _collect(*in_flight.popleft())
+    while in_flight:
+        yield _collect(*in_flight.popleft())
+
+
+def _collect(name, future):
+    try:
+        return name, future.result(), None
+    except Exception as e:
+        return name, None, str(e)
+
+
+class _ChunkBuffer:
+    """Write-only sink for ZipFile; drained after every member"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_zip(results):
+    """
+    Build a ZIP from (name, pdf_bytes, error) tuples, yielding bytes as each
+    member is written. Failed renders are listed in export_errors.txt.
+    """
+    buffer = _ChunkBuffer()
+    errors = []
+    # The sink cannot seek, so ZipFile writes data descriptors after each member
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+        for name, pdf, error in results:
+            if error is not None:
+                errors.append(f"{name}: {error}")
+                continue
+            archive.writestr(name, pdf)
+            yield buffer.drain()
+        if errors:
+            archive.writestr('export_errors.txt', '\n'.join(errors) + '\n')
+    yield buffer.drain()
@@ -0,0 +1,130 @@
+# invoice_projection.py
+"""
+Column projections for invoice list endpoints.
+
+List endpoints accept `?fields=` with a comma separated subset of FIELDS,
+or `?fields=summary` for SUMMARY_FIELDS. Only the columns behind the
+requested fields are selected; `data` stays deferred unless asked for, and
+the two values the lists need from it (recipient and currency) are
+extracted in SQL.
+
+    GET /api/invoices?user_id=...&fields=summary
+    GET /api/invoices?user_id=...&fields=id,invoice_number,total,status
+"""
+from sqlalchemy.orm import load_only, with_expression
+
+from db import db
+from models import Invoice
+from invoice_totals import invoice_total
+from dashboard_rollups import invoice_currency_expr, normalize_currency
+
+SUMMARY_FIELDS = (
+    'id', 'client_id', 'business_id', 'invoice_number', 'client_name', 'status',
+    'currency', 'total', 'issued_date', 'due_date', 'created_at', 'updated_at',
+)
+
+# Shape of the client and business invoice lists
+LIST_FIELDS = (
+    'id', 'invoice_number', 'total', 'currency', 'status', 'issued_date', 'due_date', 'created_at',
+)
+
+# field -> columns it needs loaded
+FIELDS = {
+    'id': ('id',),
+    'user_id': ('user_id',),
+    'client_id': ('client_id',),
+    'business_id': ('business_id',),
+    'invoice_number': ('invoice_number',),
+    'client_name': (),            # data->>'to', see apply_projection
+    'status': ('status',),
+    'currency': (),               # invoice_currency_expr()
+    'subtotal': ('subtotal',),
+    'tax_amount': ('tax_amount',),
+    'discount_amount': ('discount_amount',),
+    'shipping_amount': ('shipping_amount',),
+    'total': ('total',),
+    'issued_date': ('issued_date',),
+    'due_date': ('due_date',),
+    'created_at': ('created_at',),
+    'updated_at': ('updated_at',),
+    'data': ('data',),
+}
+
+_MONEY_FIELDS = ('subtotal', 'tax_amount', 'discount_amount', 'shipping_amount', 'total')
+_DATE_FIELDS = ('issued_date', 'due_date', 'created_at', 'updated_at')
+_ID_FIELDS = ('id', 'user_id', 'client_id', 'business_id')
+
+
+def parse_fields(value):
+    """Field list from a `fields` argument; raises ValueError on unknown fields"""
+    if value is None:
+        return None
+    if value.strip().lower() == 'summary':
+        return list(SUMMARY_FIELDS)
+
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(FIELDS)}, or 'summary'")
+    return fields or list(SUMMARY_FIELDS)
+
+
+def apply_projection(query, fields):
+    """
+    Load only what `fields` need. id and created_at are always loaded for
+    paging, total to spot rows whose totals were never backfilled.
+    """
+    columns = {'id', 'created_at', 'total'}
+    for field in fields:
+        columns.update(FIELDS[field])
+
+    query = query.options(load_only(*(getattr(Invoice, column) for column in sorted(columns))))
+    if 'client_name' in fields:
+        query = query.options(with_expression(Invoice.recipient, Invoice.data['to'].as_string()))
+    if 'currency' in fields:
+        query = query.options(with_expression(Invoice.data_currency, invoice_currency_expr()))
+    return query
+
+
+def _legacy_data(invoices, fields):
+    """
+    `data` of rows written before the denormalized columns existed (total
+    is NULL), from one extra query, when total or invoice_number is wanted
+    """
+    if 'total' not in fields and 'invoice_number' not in fields:
+        return {}
+    legacy = [invoice.id for invoice in invoices if invoice.total is None]
+    if not legacy:
+        return {}
+    rows = db.session.query(Invoice.id, Invoice.data).filter(Invoice.id.in_(legacy))
+    return {invoice_id: data if isinstance(data, dict) else {} for invoice_id, data in rows}
+
+
+def serialize_invoices(invoices, fields):
+    """Dicts with just `fields`, for invoices loaded through apply_projection()"""
+    legacy = _legacy_data(invoices, fields)
+    result = []
+    for invoice in invoices:
+        row = {}
+        for field in fields:
+            if invoice.id in legacy and field == 'total':
+                row[field] = float(invoice_total(legacy[invoice.id]))
+            elif invoice.id in legacy and field == 'invoice_number':
+                row[field] = legacy[invoice.id].get('invoice_number')
+            elif field == 'client_name':
+                row[field] = invoice.recipient.split('\n')[0] if invoice.recipient else None
+            elif field == 'currency':
+                row[field] = normalize_currency(invoice.data_currency)
+            elif field in _MONEY_FIELDS:
+                value = getattr(invoice, field)
+                row[field] = float(value) if value is not None else None
+            elif field in _DATE_FIELDS:
+                value = getattr(invoice, field)
+                row[field] = value.isoformat() if value else None
+            elif field in _ID_FIELDS:
+                value = getattr(invoice, field)
+                row[field] = str(value) if value else None
+            else:
+                row[field] = getattr(invoice, field)
+        result.append(row)
+    return result
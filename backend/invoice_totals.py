@@ -0,0 +1,202 @@
+# invoice_totals.py
+"""
+The one place invoice totals are computed.
+
+Rules (the same ones the invoice editor and the PDF use):
+    line amount = quantity x unit_cost
+    subtotal    = sum of line amounts
+    tax         = subtotal x tax_percent / 100, or a fixed amount   (if show_tax)
+    discount    = subtotal x discount_percent / 100, or a fixed amount
+                                                                  (if show_discount)
+    shipping    = shipping_amount                                 (if show_shipping)
+    total       = subtotal + tax - discount + shipping
+
+Like getTotal() in the editor, nothing is rounded along the way and the
+total is not clamped: a discount larger than the rest gives a negative
+total. Each reported amount is rounded half-up to cents from the exact
+values, so the rounded parts can differ from the rounded total by a cent.
+Tax and discount are both taken on the subtotal, so their order does not
+matter.
+
+Two APIs share that arithmetic:
+    compute_totals(data)      -> InvoiceTotals of Decimals for one invoice
+    TotalsBatch(datas)        -> the same numbers for many invoices, held in
+                                 integer-cent array columns that can be summed
+                                 and grouped without touching items again
+"""
+from array import array
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+CENT = Decimal('0.01')
+ZERO = Decimal('0')
+RATE_SCALE = 10 ** 6   # percentages are kept as millionths of a percent
+MICROS_PER_CENT = 10 ** 4   # exact subtotals are kept in millionths of a unit
+
+
+def to_decimal(value, default=ZERO):
+    """Lenient Decimal conversion: None, '' and garbage become `default`"""
+    if value is None or value == '' or isinstance(value, bool):
+        return default
+    try:
+        result = Decimal(str(value).strip())
+    except (InvalidOperation, ValueError):
+        return default
+    return result if result.is_finite() else default
+
+
+def to_cents(value):
+    return int(to_decimal(value).quantize(CENT, rounding=ROUND_HALF_UP) * 100)
+
+
+def from_cents(cents):
+    return (Decimal(cents) / 100).quantize(CENT)
+
+
+def _rate(value):
+    return int((to_decimal(value) * RATE_SCALE).to_integral_value(rounding=ROUND_HALF_UP))
+
+
+def _div_round(numerator, denominator):
+    """Integer division rounding half away from zero, like ROUND_HALF_UP"""
+    sign = -1 if numerator < 0 else 1
+    return sign * ((abs(numerator) * 2 + denominator) // (2 * denominator))
+
+
+def line_amount(item):
+    """quantity x unit_cost of one line item, unrounded"""
+    if not isinstance(item, dict):
+        return ZERO
+    return to_decimal(item.get('quantity')) * to_decimal(item.get('unit_cost'))
+
+
+class InvoiceTotals:
+    """Totals of one invoice, as Decimals rounded to cents"""
+
+    FIELDS = ('subtotal', 'tax_amount', 'discount_amount', 'shipping_amount', 'total')
+
+    def __init__(self, subtotal, tax_amount, discount_amount, shipping_amount, total):
+        self.subtotal = subtotal
+        self.tax_amount = tax_amount
+        self.discount_amount = discount_amount
+        self.shipping_amount = shipping_amount
+        self.total = total
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def as_floats(self):
+        return {field: float(getattr(self, field)) for field in self.FIELDS}
+
+    def __repr__(self):
+        return f"InvoiceTotals({', '.join(f'{k}={v}' for k, v in self.as_dict().items())})"
+
+
+class TotalsBatch:
+    """
+    Totals for many invoices at once. Inputs are read into integer-cent
+    (and scaled-rate) array columns in one pass over the invoices; the
+    totals are then derived column by column.
+    """
+
+    def __init__(self, datas=()):
+        self.subtotal_micros = array('q')  # unrounded, for tax, discount and total
+        self.subtotal = array('q')
+        self.tax_rate = array('q')       # millionths of a percent
+        self.tax_fixed = array('q')      # cents
+        self.discount_rate = array('q')
+        self.discount_fixed = array('q')
+        self.shipping_amount = array('q')
+        self.tax_amount = array('q')
+        self.discount_amount = array('q')
+        self.total = array('q')
+        self._computed = 0
+
+        for data in datas:
+            self.add(data)
+
+    def add(self, data):
+        """Append one invoice's `data` JSON; returns its row index"""
+        data = data if isinstance(data, dict) else {}
+        items = data.get('items')
+
+        if not isinstance(items, list):
+            # Legacy rows without an items list only ever stored the total.
+            # An empty list is a real invoice with no lines: tax, discount
+            # and shipping still apply to its zero subtotal.
+            self.subtotal.append(to_cents(data.get('total')))
+            self.subtotal_micros.append(self.subtotal[-1] * MICROS_PER_CENT)
+            for column in (self.tax_rate, self.tax_fixed, self.discount_rate,
+                           self.discount_fixed, self.shipping_amount):
+                column.append(0)
+            return len(self.subtotal) - 1
+
+        subtotal = sum((line_amount(item) for item in items), ZERO)
+        self.subtotal_micros.append(int((subtotal * 100 * MICROS_PER_CENT).to_integral_value(rounding=ROUND_HALF_UP)))
+        self.subtotal.append(to_cents(subtotal))
+
+        for prefix, value_key in (('tax', 'tax_percent'), ('discount', 'discount_percent')):
+            rate = fixed = 0
+            if data.get(f'show_{prefix}'):
+                if data.get(f'{prefix}_type', 'percent') == 'percent':
+                    rate = _rate(data.get(value_key))
+                else:
+                    fixed = to_cents(data.get(value_key))
+            getattr(self, f'{prefix}_rate').append(rate)
+            getattr(self, f'{prefix}_fixed').append(fixed)
+
+        self.shipping_amount.append(to_cents(data.get('shipping_amount')) if data.get('show_shipping') else 0)
+        return len(self.subtotal) - 1
+
+    def compute(self):
+        """Derive tax, discount and total for rows added since the last call"""
+        divisor = 100 * RATE_SCALE * MICROS_PER_CENT
+        for i in range(self._computed, len(self.subtotal)):
+            # In millionths of a unit x RATE_SCALE x 100, rounded to cents only at the end
+            subtotal = self.subtotal_micros[i]
+            tax = subtotal * self.tax_rate[i]
+            discount = subtotal * self.discount_rate[i]
+            fixed = self.tax_fixed[i] - self.discount_fixed[i] + self.shipping_amount[i]
+            self.tax_amount.append(_div_round(tax, divisor) + self.tax_fixed[i])
+            self.discount_amount.append(_div_round(discount, divisor) + self.discount_fixed[i])
+            self.total.append(_div_round(subtotal * 100 * RATE_SCALE + tax - discount, divisor) + fixed)
+        self._computed = len(self.subtotal)
+        return self
+
+    def __len__(self):
+        return len(self.subtotal)
+
+    def totals(self, index):
+        """InvoiceTotals for one row"""
+        self.compute()
+        return InvoiceTotals(*(from_cents(getattr(self, field)[index]) for field in InvoiceTotals.FIELDS))
+
+    def total_float(self, index):
+        """Grand total of one row as a float, for JSON responses"""
+        self.compute()
+        return self.total[index] / 100
+
+    def sum(self, column='total', mask=None):
+        """Decimal sum of a column, optionally only rows where mask[i] is true"""
+        self.compute()
+        values = getattr(self, column)
+        if mask is None:
+            return from_cents(sum(values))
+        return from_cents(sum(value for value, keep in zip(values, mask) if keep))
+
+    def sum_by(self, keys, column='total'):
+        """{key: Decimal sum} grouping rows by keys[i]"""
+        self.compute()
+        sums = {}
+        for key, value in zip(keys, getattr(self, column)):
+            sums[key] = sums.get(key, 0) + value
+        return {key: from_cents(cents) for key, cents in sums.items()}
+
+
+def compute_totals(data):
+    """Totals of one invoice's `data` JSON"""
+    return TotalsBatch([data]).totals(0)
+
+
+def invoice_total(data):
+    """Grand total of one invoice as a Decimal"""
+    return compute_totals(data).total
@@ -5,6 +5,13 @@ from datetime import datetime
 import uuid
 import logging
 from sqlalchemy import asc, desc, func
+from pagination import cursor_requested, keyset_page, cursor_pagination
+from invoice_projection import parse_fields, apply_projection, serialize_invoices
+from invoice_totals import from_cents
+from dashboard_rollups import user_groups, record_rollup_changes
+from bulk_operations import (parse_ids, select_rows, delete_rows, change_invoice_status,
+                             invoice_number_expr, invoice_returning, invoice_rollup_changes)
+from event_stream import invoice_status_event, publish_events
 
 
 class InvoiceOperations:
@@ -154,35 +161,32 @@ class InvoiceOperations:
 
     @staticmethod
     def bulk_delete_invoices():
-        """Delete multiple invoices at once"""
+        """Delete multiple invoices at once, a chunk of ids per DELETE ... RETURNING"""
         try:
             data = request.get_json()
             if not data or 'invoice_ids' not in data:
                 return jsonify({'success': False, 'error': 'invoice_ids are required'}), 400
 
-            invoice_ids = data['invoice_ids']
             user_id = data.get('user_id')
 
-            if not isinstance(invoice_ids, list) or not invoice_ids:
-                return jsonify({'success': False, 'error': 'invoice_ids must be a non-empty list'}), 400
+            try:
+                invoice_ids = parse_ids(data['invoice_ids'], 'invoice_ids', 'invoice')
+            except ValueError as e:
+                return jsonify({'success': False, 'error': str(e)}), 400
 
             # Validate user_id if provided
             if user_id and not InvoiceOperations.validate_uuid(user_id):
                 return jsonify({'success': False, 'error': 'Invalid user ID format'}), 400
 
-            # Validate all invoice IDs
-            for invoice_id in invoice_ids:
-                if not InvoiceOperations.validate_uuid(invoice_id):
-                    return jsonify({'success': False, 'error': f'Invalid invoice ID format: {invoice_id}'}), 400
+            # Optional user filtering
+            criteria = [Invoice.user_id == uuid.UUID(user_id)] if user_id else []
 
-            # Get all invoices with optional user filtering
-            if user_id:
-                invoices = Invoice.query.filter(
-                    Invoice.id.in_(invoice_ids),
-                    Invoice.user_id == user_id
-                ).all()
-            else:
-                invoices = Invoice.query.filter(Invoice.id.in_(invoice_ids)).all()
+            # Id, status and number only - `data` is not loaded
+            invoices = select_rows(
+                Invoice, invoice_ids,
+                (Invoice.id, Invoice.status, invoice_number_expr().label('invoice_number')),
+                *criteria
+            )
 
             if len(invoices) != len(invoice_ids):
                 return jsonify({
@@ -191,21 +195,14 @@ class InvoiceOperations:
                 }), 404
 
             # Check for paid invoices (optional business rule)
-            paid_invoices = []
-            invoices_to_delete = []
-
-            for invoice in invoices:
-                if invoice.status == 'paid':
-                    invoice_number = 'N/A'
-                    if isinstance(invoice.data, dict):
-                        invoice_number = invoice.data.get('invoice_number', 'N/A')
-                    paid_invoices.append({
-                        'id': str(invoice.id),
-                        'invoice_number': invoice_number,
-                        'status': invoice.status
-                    })
-                else:
-                    invoices_to_delete.append(invoice)
+            paid_invoices = [
+                {
+                    'id': str(invoice.id),
+                    'invoice_number': invoice.invoice_number or 'N/A',
+                    'status': invoice.status
+                }
+                for invoice in invoices if invoice.status == 'paid'
+            ]
 
             if paid_invoices:
                 return jsonify({
@@ -214,21 +211,18 @@ class InvoiceOperations:
                     'paid_invoices': paid_invoices
                 }), 400
 
-            # Delete all non-paid invoices
-            deleted_count = 0
-            deleted_numbers = []
-
-            for invoice in invoices_to_delete:
-                invoice_number = 'N/A'
-                if isinstance(invoice.data, dict):
-                    invoice_number = invoice.data.get('invoice_number', 'N/A')
-                deleted_numbers.append(invoice_number)
-
-                db.session.delete(invoice)
-                deleted_count += 1
+            # Delete all non-paid invoices (re-checked in the DELETE in case one was paid meanwhile)
+            deleted = delete_rows(
+                Invoice, invoice_ids, Invoice.status.is_distinct_from('paid'), *criteria,
+                returning=(*invoice_returning(), Invoice.status.label('old_status'))
+            )
+            record_rollup_changes(*invoice_rollup_changes(deleted))
 
             db.session.commit()
 
+            deleted_count = len(deleted)
+            deleted_numbers = [invoice.invoice_number or 'N/A' for invoice in deleted]
+
             user_info = f" by user {user_id}" if user_id else ""
             logging.info(f"Bulk deleted {deleted_count} invoices{user_info}: {deleted_numbers}")
 
@@ -244,11 +238,79 @@ class InvoiceOperations:
             logging.error(f"Error bulk deleting invoices: {str(e)}", exc_info=True)
             return jsonify({'success': False, 'error': 'Failed to delete invoices'}), 500
 
+    @staticmethod
+    def bulk_update_status():
+        """Move multiple invoices to one status, a chunk of ids per UPDATE ... RETURNING"""
+        try:
+            data = request.get_json()
+            if not data or 'invoice_ids' not in data:
+                return jsonify({'success': False, 'error': 'invoice_ids are required'}), 400
+
+            new_status = data.get('status')
+            user_id = data.get('user_id')
+
+            if not new_status:
+                return jsonify({'success': False, 'error': 'Status is required'}), 400
+
+            if not InvoiceOperations.validate_status(new_status):
+                return jsonify({
+                    'success': False,
+                    'error': f'Invalid status. Must be one of: {", ".join(InvoiceOperations.VALID_STATUSES)}'
+                }), 400
+
+            try:
+                invoice_ids = parse_ids(data['invoice_ids'], 'invoice_ids', 'invoice')
+            except ValueError as e:
+                return jsonify({'success': False, 'error': str(e)}), 400
+
+            if user_id and not InvoiceOperations.validate_uuid(user_id):
+                return jsonify({'success': False, 'error': 'Invalid user ID format'}), 400
+
+            criteria = [Invoice.user_id == uuid.UUID(user_id)] if user_id else []
+            new_status = new_status.lower()
+
+            found = select_rows(Invoice, invoice_ids, (Invoice.id,), *criteria)
+            if len(found) != len(invoice_ids):
+                return jsonify({
+                    'success': False,
+                    'error': 'Some invoices were not found or you do not have permission to update them'
+                }), 404
+
+            # Invoices already in new_status are left alone
+            updated = change_invoice_status(invoice_ids, new_status, *criteria)
+            record_rollup_changes(*invoice_rollup_changes(updated, new_status))
+
+            db.session.commit()
+            publish_events([
+                invoice_status_event(row.user_id, row.id, row.invoice_number, row.old_status, new_status)
+                for row in updated
+            ])
+
+            user_info = f" by user {user_id}" if user_id else ""
+            logging.info(f"Bulk moved {len(updated)} invoices to '{new_status}'{user_info}")
+
+            return jsonify({
+                'success': True,
+                'message': f'Successfully updated {len(updated)} invoices to {new_status}',
+                'status': new_status,
+                'updated_count': len(updated),
+                'unchanged_count': len(invoice_ids) - len(updated),
+                'updated_invoices': [str(invoice.id) for invoice in updated]
+            })
+
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Error bulk updating invoice status: {str(e)}", exc_info=True)
+            return jsonify({'success': False, 'error': 'Failed to update invoices'}), 500
+
     @staticmethod
     def get_invoices_paginated():
         """
         GET /api/invoices?user_id=<uuid>&page=<int>&per_page=<int>
                       &sort_by=<field>&sort_order=<asc|desc>&status=<status>
+        GET /api/invoices?user_id=<uuid>&cursor=<cursor>&per_page=<int>
+                      &sort_order=<asc|desc>&status=<status>&count=<none|exact|estimate>
+        Either form takes &fields=<field,...|summary> to return only those fields.
         """
         try:
             # 1. Parse request args
@@ -265,8 +327,15 @@ class InvoiceOperations:
             if not InvoiceOperations.validate_uuid(user_id):
                 return jsonify({'success': False, 'error': 'Invalid user ID format'}), 400
 
+            try:
+                fields = parse_fields(request.args.get('fields'))
+            except ValueError as e:
+                return jsonify({'success': False, 'error': str(e)}), 400
+
             # 3. Base query for this user
             query = Invoice.query.filter_by(user_id=user_id)
+            if fields:
+                query = apply_projection(query, fields)
 
             # 4. Optional status filter
             if status_filter:
@@ -279,41 +348,31 @@ class InvoiceOperations:
             if sort_by not in allowed_sort_fields:
                 sort_by = 'created_at'  # fallback
 
-            if sort_by == 'invoice_number':
-                # Extract invoice_number from JSON data column.
-                # Uses JSON path: data->>'invoice_number' (PostgreSQL) or JSON_EXTRACT (MySQL)
-                # Adjust to your DB dialect if needed. This works for PostgreSQL and SQLite with JSON1.
-                order_column = Invoice.data['invoice_number'].astext
-            else:
-                order_column = getattr(Invoice, sort_by)
+            # invoice_number is the column kept in step with data by refresh_totals(),
+            # served by ix_invoices_user_id_invoice_number
+            order_column = getattr(Invoice, sort_by)
 
             if sort_order.lower() == 'asc':
                 query = query.order_by(asc(order_column))
             else:
                 query = query.order_by(desc(order_column))
 
-            # 6. Paginate
-            paginated = query.paginate(page=page, per_page=per_page, error_out=False)
-
-            # 7. Build response data
-            invoices_data = []
-            for inv in paginated.items:
-                # Convert invoice to dict (using your existing method if available)
-                # Otherwise manually build:
-                inv_dict = {
-                    'id': str(inv.id),
-                    'user_id': str(inv.user_id),
-                    'status': inv.status,
-                    'created_at': inv.created_at.isoformat() if hasattr(inv, 'created_at') and inv.created_at else None,
-                    'updated_at': inv.updated_at.isoformat() if hasattr(inv, 'updated_at') and inv.updated_at else None,
-                    'data': inv.data,   # includes invoice_number, items, totals, etc.
-                }
-                invoices_data.append(inv_dict)
-
-            return jsonify({
-                'success': True,
-                'data': invoices_data,
-                'pagination': {
+            # 6. Paginate - keyset on (created_at, id) in cursor mode
+            if cursor_requested():
+                if sort_by != 'created_at':
+                    return jsonify({'success': False, 'error': 'Cursor pagination only supports sort_by=created_at'}), 400
+                try:
+                    items, next_cursor = keyset_page(
+                        query, Invoice, request.args.get('cursor'), per_page,
+                        descending=sort_order.lower() != 'asc'
+                    )
+                except ValueError as e:
+                    return jsonify({'success': False, 'error': str(e)}), 400
+                pagination = cursor_pagination(query, next_cursor, per_page)
+            else:
+                paginated = query.paginate(page=page, per_page=per_page, error_out=False)
+                items = paginated.items
+                pagination = {
                     'page': paginated.page,
                     'per_page': paginated.per_page,
                     'total_items': paginated.total,
@@ -321,6 +380,29 @@ class InvoiceOperations:
                     'has_prev': paginated.has_prev,
                     'has_next': paginated.has_next,
                 }
+
+            # 7. Build response data
+            if fields:
+                invoices_data = serialize_invoices(items, fields)
+            else:
+                invoices_data = []
+                for inv in items:
+                    # Convert invoice to dict (using your existing method if available)
+                    # Otherwise manually build:
+                    inv_dict = {
+                        'id': str(inv.id),
+                        'user_id': str(inv.user_id),
+                        'status': inv.status,
+                        'created_at': inv.created_at.isoformat() if hasattr(inv, 'created_at') and inv.created_at else None,
+                        'updated_at': inv.updated_at.isoformat() if hasattr(inv, 'updated_at') and inv.updated_at else None,
+                        'data': inv.data,   # includes invoice_number, items, totals, etc.
+                    }
+                    invoices_data.append(inv_dict)
+
+            return jsonify({
+                'success': True,
+                'data': invoices_data,
+                'pagination': pagination
             })
 
         except Exception as e:
@@ -334,12 +416,9 @@ class InvoiceOperations:
             if not InvoiceOperations.validate_uuid(user_id):
                 return jsonify({'success': False, 'error': 'Invalid user ID format'}), 400
 
-            # Get all invoices for the user
-            invoices = Invoice.query.filter_by(user_id=user_id).all()
-
             # Calculate statistics
             stats = {
-                'total_invoices': len(invoices),
+                'total_invoices': 0,
                 'draft': 0,
                 'sent': 0,
                 'paid': 0,
@@ -350,42 +429,22 @@ class InvoiceOperations:
                 'outstanding_amount': 0.0
             }
 
-            for invoice in invoices:
-                # Count by status
-                status = invoice.status.lower()
+            # One row per currency and status, from the dashboard rollups
+            total_cents = paid_cents = outstanding_cents = 0
+            for (_, status), (count, cents) in user_groups(user_id).items():
+                status = status.lower()
+                stats['total_invoices'] += count
                 if status in stats:
-                    stats[status] += 1
-
-                # Calculate amounts based on your existing data structure
-                try:
-                    amount = 0.0
-                    if isinstance(invoice.data, dict):
-                        # Try to get total from data, fallback to calculating from items
-                        amount = float(invoice.data.get('total', 0))
-                        if amount == 0 and 'items' in invoice.data:
-                            # Calculate from items like in your parse_invoice_data function
-                            items = invoice.data.get('items', [])
-                            subtotal = sum(
-                                float(item.get('quantity', 0)) * float(item.get('unit_cost', 0))
-                                for item in items
-                            )
-
-                            # Add tax, shipping, subtract discount (simplified)
-                            tax_amount = float(invoice.data.get('tax_amount', 0))
-                            shipping_amount = float(invoice.data.get('shipping_amount', 0))
-                            discount_amount = float(invoice.data.get('discount_amount', 0))
-
-                            amount = subtotal + tax_amount + shipping_amount - discount_amount
-
-                    stats['total_amount'] += amount
-
-                    if status == 'paid':
-                        stats['paid_amount'] += amount
-                    elif status in ['sent', 'overdue']:
-                        stats['outstanding_amount'] += amount
-
-                except (ValueError, TypeError, KeyError):
-                    continue
+                    stats[status] += count
+                total_cents += cents
+                if status == 'paid':
+                    paid_cents += cents
+                elif status in ('sent', 'overdue'):
+                    outstanding_cents += cents
+
+            stats['total_amount'] = float(from_cents(total_cents))
+            stats['paid_amount'] = float(from_cents(paid_cents))
+            stats['outstanding_amount'] = float(from_cents(outstanding_cents))
 
             return jsonify({
                 'success': True,
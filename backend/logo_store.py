@@ -0,0 +1,230 @@
+# logo_store.py
+"""
+On-disk cache of invoice logos.
+
+Logos are stored content-addressed (`blobs/<sha256><ext>`) and looked up by
+URL through a small JSON index entry per URL that remembers the digest and
+the ETag / Last-Modified validators. The first use of a URL downloads it;
+after that renders get the cached file straight away and, once an entry is
+older than `max_age`, a background thread revalidates it with a conditional
+request. Blobs are evicted least-recently-used once `max_bytes` is exceeded.
+
+The directory can be shared by every gunicorn worker; all writes are
+atomic renames.
+"""
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import tempfile
+import threading
+import time
+from urllib.parse import urlparse
+
+import certifi
+import requests
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024  # 256 MB
+DEFAULT_MAX_AGE = 3600                  # revalidate after an hour
+FETCH_TIMEOUT = 10
+
+
+class LogoAsset:
+    """A cached logo file"""
+
+    def __init__(self, path, digest):
+        self.path = path
+        self.digest = digest
+
+    @property
+    def url(self):
+        return 'file://' + self.path
+
+
+class LogoStore:
+    """Content-addressed logo files keyed by source URL"""
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES, max_age=DEFAULT_MAX_AGE):
+        self.directory = os.path.abspath(directory)
+        self.blob_dir = os.path.join(self.directory, 'blobs')
+        self.index_dir = os.path.join(self.directory, 'index')
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._revalidating = set()
+        self._lock = threading.Lock()
+        os.makedirs(self.blob_dir, exist_ok=True)
+        os.makedirs(self.index_dir, exist_ok=True)
+
+    # ─── Files ───────────────────────────────────────────────────────────────
+
+    @staticmethod
+    def _write_atomic(path, data):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _index_path(self, url):
+        return os.path.join(self.index_dir, hashlib.sha256(url.encode('utf-8')).hexdigest() + '.json')
+
+    def _read_index(self, url):
+        try:
+            with open(self._index_path(url), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_index(self, url, entry):
+        self._write_atomic(self._index_path(url), json.dumps(entry).encode('utf-8'))
+
+    @staticmethod
+    def _extension(url, content_type=None):
+        ext = os.path.splitext(urlparse(url).path)[1].lower() if url else ''
+        if not ext and content_type:
+            ext = mimetypes.guess_extension(content_type.split(';')[0].strip()) or ''
+        return ext or '.png'
+
+    def _store_blob(self, data, ext):
+        digest = hashlib.sha256(data).hexdigest()
+        path = os.path.join(self.blob_dir, digest + ext)
+        if os.path.exists(path):
+            os.utime(path, None)
+        else:
+            self._write_atomic(path, data)
+            self._evict()
+        return LogoAsset(path, digest)
+
+    def _asset(self, entry):
+        path = os.path.join(self.blob_dir, entry['digest'] + entry['ext'])
+        try:
+            os.utime(path, None)  # bump recency for LRU eviction
+        except FileNotFoundError:
+            return None
+        return LogoAsset(path, entry['digest'])
+
+    def _evict(self):
+        entries = []
+        with os.scandir(self.blob_dir) as it:
+            for entry in it:
+                if entry.name.endswith('.tmp'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):  # oldest first
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+                total -= size
+            except FileNotFoundError:
+                pass
+
+    # ─── Fetching ────────────────────────────────────────────────────────────
+
+    @staticmethod
+    def _request(url, headers):
+        try:
+            return requests.get(url, headers=headers, timeout=FETCH_TIMEOUT)
+        except requests.exceptions.SSLError:
+            # Some hosts need certifi's bundle rather than the system store
+            return requests.get(url, headers=headers, timeout=FETCH_TIMEOUT, verify=certifi.where())
+
+    def _fetch(self, url, entry=None):
+        headers = {}
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        response = self._request(url, headers)
+        if response.status_code == 304 and entry:
+            entry['fetched_at'] = time.time()
+            self._write_index(url, entry)
+            return entry
+        response.raise_for_status()
+
+        ext = self._extension(url, response.headers.get('Content-Type'))
+        asset = self._store_blob(response.content, ext)
+        entry = {
+            'url': url,
+            'digest': asset.digest,
+            'ext': ext,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'fetched_at': time.time(),
+        }
+        self._write_index(url, entry)
+        return entry
+
+    def _revalidate(self, url, entry):
+        try:
+            self._fetch(url, entry)
+        except Exception as e:
+            logging.warning(f"Logo revalidation failed for {url}: {e}")
+        finally:
+            with self._lock:
+                self._revalidating.discard(url)
+
+    def _revalidate_in_background(self, url, entry):
+        with self._lock:
+            if url in self._revalidating:
+                return
+            self._revalidating.add(url)
+        threading.Thread(target=self._revalidate, args=(url, entry), daemon=True).start()
+
+    # ─── Public API ──────────────────────────────────────────────────────────
+
+    def get(self, url):
+        """
+        Cached logo for `url`, downloading it only if it was never seen or
+        its blob was evicted. Stale entries are served as-is and refreshed
+        in the background.
+        """
+        entry = self._read_index(url)
+        asset = self._asset(entry) if entry else None
+
+        if asset is None:
+            entry = self._fetch(url)
+            return self._asset(entry)
+
+        if time.time() - entry.get('fetched_at', 0) > self.max_age:
+            self._revalidate_in_background(url, entry)
+        return asset
+
+    def put(self, url, data, content_type=None):
+        """Store bytes we already have (e.g. a fresh upload) under their public URL"""
+        ext = self._extension(url, content_type)
+        asset = self._store_blob(data, ext)
+        self._write_index(url, {
+            'url': url,
+            'digest': asset.digest,
+            'ext': ext,
+            'etag': None,
+            'last_modified': None,
+            'fetched_at': time.time(),
+        })
+        return asset
+
+
+def logo_cache_dir():
+    return os.getenv('LOGO_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'envoyce-logo-cache'))
+
+
+def create_logo_store_from_env():
+    """
+    LOGO_CACHE_DIR        cache directory (default: <tmp>/envoyce-logo-cache)
+    LOGO_CACHE_MAX_BYTES  size bound for cached logo files
+    LOGO_CACHE_MAX_AGE    seconds before an entry is revalidated
+    """
+    return LogoStore(
+        logo_cache_dir(),
+        max_bytes=int(os.getenv('LOGO_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)),
+        max_age=int(os.getenv('LOGO_CACHE_MAX_AGE', DEFAULT_MAX_AGE)),
+    )
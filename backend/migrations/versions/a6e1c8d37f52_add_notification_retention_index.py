@@ -0,0 +1,28 @@
+"""Add notification retention index
+
+Revision ID: a6e1c8d37f52
+Revises: f3a9d26c8b14
+Create Date: 2026-10-18 18:42:37.204519
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6e1c8d37f52'
+down_revision = 'f3a9d26c8b14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # CONCURRENTLY so writes to notifications keep flowing during the build; that
+    # cannot run inside a transaction, hence the autocommit block
+    with op.get_context().autocommit_block():
+        op.create_index('ix_notifications_type_is_read_created_at', 'notifications', ['type', 'is_read', 'created_at'], unique=False,
+                        postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_notifications_type_is_read_created_at', table_name='notifications', postgresql_concurrently=True)
@@ -0,0 +1,28 @@
+"""Add (status, due_date) index to invoices
+
+Revision ID: d41a7c9e3b58
+Revises: b83e4f0c6a21
+Create Date: 2026-10-18 13:05:22.918730
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'd41a7c9e3b58'
+down_revision = 'b83e4f0c6a21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # CONCURRENTLY so writes to invoices keep flowing during the build; that
+    # cannot run inside a transaction, hence the autocommit block
+    with op.get_context().autocommit_block():
+        op.create_index('ix_invoices_status_due_date', 'invoices', ['status', 'due_date'], unique=False,
+                        postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_invoices_status_due_date', table_name='invoices', postgresql_concurrently=True)
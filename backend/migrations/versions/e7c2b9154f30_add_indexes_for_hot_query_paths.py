@@ -0,0 +1,49 @@
+"""Add indexes for hot query paths
+
+Revision ID: e7c2b9154f30
+Revises: d41a7c9e3b58
+Create Date: 2026-10-18 14:21:48.661072
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7c2b9154f30'
+down_revision = 'd41a7c9e3b58'
+branch_labels = None
+depends_on = None
+
+
+# (table, index name, columns, extra create_index options). Built CONCURRENTLY
+# so writes to these hot tables keep flowing during the build; that cannot
+# run inside a transaction, hence the autocommit block.
+INDEXES = [
+    ('billing_transactions', 'ix_billing_transactions_user_id_status_created_at',
+     ['user_id', 'status', 'created_at'], {}),
+    ('businesses', 'ix_businesses_paystack_subaccount_code', ['paystack_subaccount_code'], {}),
+    ('businesses', 'ix_businesses_user_id_created_at', ['user_id', 'created_at'], {}),
+    ('clients', 'ix_clients_user_id_created_at', ['user_id', 'created_at'], {}),
+    ('invoices', 'ix_invoices_business_id', ['business_id'], {}),
+    ('invoices', 'ix_invoices_client_id', ['client_id'], {}),
+    ('invoices', 'ix_invoices_user_id_created_at', ['user_id', 'created_at'], {}),
+    ('invoices', 'ix_invoices_user_id_invoice_number', ['user_id', 'invoice_number'], {}),
+    ('invoices', 'ix_invoices_user_id_status_created_at', ['user_id', 'status', 'created_at'], {}),
+    ('notifications', 'ix_notifications_user_id_created_at', ['user_id', 'created_at'], {}),
+    ('notifications', 'ix_notifications_user_id_unread_created_at', ['user_id', 'created_at'],
+     {'postgresql_where': sa.text('is_read = false')}),
+    ('user_subscriptions', 'ix_user_subscriptions_user_id_status', ['user_id', 'status'], {}),
+]
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        for table, name, columns, options in INDEXES:
+            op.create_index(name, table, columns, unique=False, postgresql_concurrently=True, **options)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for table, name, columns, options in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
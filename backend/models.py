@@ -27,6 +27,18 @@ class User(db.Model):
 
 class Client(db.Model):
     __tablename__ = 'clients'
+    __table_args__ = (
+        db.Index('ix_clients_user_id_created_at', 'user_id', 'created_at'),
+        # search.client_document(): full-text and trigram (ILIKE / word_similarity) search
+        db.Index('ix_clients_search_tsv',
+                 db.text("to_tsvector('simple'::regconfig, "
+                         "COALESCE(name, '') || ' ' || COALESCE(email, '') || ' ' || COALESCE(phone, ''))"),
+                 postgresql_using='gin').ddl_if(dialect='postgresql'),
+        db.Index('ix_clients_search_trgm',
+                 db.text("(COALESCE(name, '') || ' ' || COALESCE(email, '') || ' ' || COALESCE(phone, '')) "
+                         "gin_trgm_ops"),
+                 postgresql_using='gin').ddl_if(dialect='postgresql'),
+    )
     id = db.Column(db.UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     name = db.Column(db.String(255), nullable=False)
@@ -42,6 +54,10 @@ class Client(db.Model):
 
 class Business(db.Model):
     __tablename__ = 'businesses'
+    __table_args__ = (
+        db.Index('ix_businesses_user_id_created_at', 'user_id', 'created_at'),
+        db.Index('ix_businesses_paystack_subaccount_code', 'paystack_subaccount_code'),
+    )
     id = db.Column(db.UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     name = db.Column(db.String(255), nullable=False)
@@ -60,6 +76,24 @@ class Business(db.Model):
 
 class Invoice(db.Model):
     __tablename__ = 'invoices'
+    __table_args__ = (
+        db.Index('ix_invoices_user_id_created_at', 'user_id', 'created_at'),
+        db.Index('ix_invoices_user_id_status_created_at', 'user_id', 'status', 'created_at'),
+        db.Index('ix_invoices_user_id_invoice_number', 'user_id', 'invoice_number'),
+        db.Index('ix_invoices_client_id', 'client_id'),
+        db.Index('ix_invoices_business_id', 'business_id'),
+        # Overdue sweeper: status = 'sent' AND due_date < today
+        db.Index('ix_invoices_status_due_date', 'status', 'due_date'),
+        # search.invoice_document(): full-text and trigram (ILIKE / word_similarity) search
+        db.Index('ix_invoices_search_tsv',
+                 db.text("to_tsvector('simple'::regconfig, "
+                         "COALESCE(invoice_number, '') || ' ' || COALESCE(search_text, ''))"),
+                 postgresql_using='gin').ddl_if(dialect='postgresql'),
+        db.Index('ix_invoices_search_trgm',
+                 db.text("(COALESCE(invoice_number, '') || ' ' || COALESCE(search_text, '')) gin_trgm_ops"),
+                 postgresql_using='gin').ddl_if(dialect='postgresql'),
+    )
+
     id = db.Column(db.UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     client_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey('clients.id', ondelete='SET NULL'), nullable=True)
@@ -69,12 +103,59 @@ class Invoice(db.Model):
     due_date = db.Column(db.Date)
     status = db.Column(db.String(50), default='draft')
     currency = db.Column(db.String(10), default='USD')
+
+    # Denormalized from `data` by refresh_totals() so aggregates can run in SQL
+    invoice_number = db.Column(db.String(100), nullable=True)
+    subtotal = db.Column(db.Numeric(14, 2), nullable=True)
+    tax_amount = db.Column(db.Numeric(14, 2), nullable=True)
+    discount_amount = db.Column(db.Numeric(14, 2), nullable=True)
+    shipping_amount = db.Column(db.Numeric(14, 2), nullable=True)
+    total = db.Column(db.Numeric(14, 2), nullable=True)
+    # Recipient and line item names/descriptions, for search.py
+    search_text = db.Column(db.Text, nullable=True)
+
+    # Extracted from `data` in SQL by list queries that defer it (invoice_projection.py)
+    recipient = db.query_expression()
+    data_currency = db.query_expression()
+
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    def refresh_totals(self):
+        """Recompute the denormalized totals, invoice number and search text from `data`"""
+        from invoice_totals import compute_totals
+        from search import search_text
+
+        data = self.data if isinstance(self.data, dict) else {}
+        for field, value in compute_totals(data).as_dict().items():
+            setattr(self, field, value)
+        number = data.get('invoice_number')
+        self.invoice_number = str(number)[:100] if number else None
+        self.search_text = search_text(data)
+
+
+class UserDashboardRollup(db.Model):
+    """Invoice count and totals per (user, currency, status); see dashboard_rollups.py"""
+    __tablename__ = 'user_dashboard_rollups'
+    user_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    currency = db.Column(db.String(10), primary_key=True)
+    status = db.Column(db.String(50), primary_key=True)
+    invoice_count = db.Column(db.Integer, nullable=False, default=0)
+    total_amount = db.Column(db.Numeric(16, 2), nullable=False, default=0)
+    outstanding_amount = db.Column(db.Numeric(16, 2), nullable=False, default=0)
+    overdue_amount = db.Column(db.Numeric(16, 2), nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 
 class Notification(db.Model):
     __tablename__ = 'notifications'
+    __table_args__ = (
+        db.Index('ix_notifications_user_id_created_at', 'user_id', 'created_at'),
+        # Unread counts and unread-only listings
+        db.Index('ix_notifications_user_id_unread_created_at', 'user_id', 'created_at',
+                 postgresql_where=db.text('is_read = false')),
+        db.Index('ix_notifications_type_is_read_created_at', 'type', 'is_read', 'created_at'),
+    )
     id = db.Column(db.UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     title = db.Column(db.String(255), nullable=False)
@@ -102,6 +183,9 @@ class SubscriptionPlan(db.Model):
 
 class UserSubscription(db.Model):
     __tablename__ = 'user_subscriptions'
+    __table_args__ = (
+        db.Index('ix_user_subscriptions_user_id_status', 'user_id', 'status'),
+    )
     id = db.Column(db.UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     plan_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey('subscription_plans.id'), nullable=False)
@@ -120,6 +204,9 @@ class UserSubscription(db.Model):
 
 class BillingTransaction(db.Model):
     __tablename__ = 'billing_transactions'
+    __table_args__ = (
+        db.Index('ix_billing_transactions_user_id_status_created_at', 'user_id', 'status', 'created_at'),
+    )
     id = db.Column(db.UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     subscription_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey('user_subscriptions.id'), nullable=True)
@@ -133,4 +220,26 @@ class BillingTransaction(db.Model):
     
     # Relationships
     user = db.relationship('User', backref='billing_transactions')
-    subscription = db.relationship('UserSubscription', backref='transactions')
\ No newline at end of file
+    subscription = db.relationship('UserSubscription', backref='transactions')
+
+
+class EmailOutbox(db.Model):
+    __tablename__ = 'email_outbox'
+    __table_args__ = (
+        db.Index('ix_email_outbox_status_next_attempt_at', 'status', 'next_attempt_at'),
+        db.Index('ix_email_outbox_invoice_id_created_at', 'invoice_id', 'created_at'),
+    )
+    id = db.Column(db.UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey('users.id', ondelete='SET NULL'), nullable=True)
+    invoice_id = db.Column(db.UUID(as_uuid=True), nullable=True)  # no FK: unsaved invoices can be sent too
+    idempotency_key = db.Column(db.String(255), unique=True, nullable=False)
+    recipient = db.Column(db.String(255), nullable=False)
+    payload = db.Column(db.JSON, nullable=False)  # Brevo request body
+    status = db.Column(db.String(20), nullable=False, default='queued')  # 'queued' | 'sending' | 'sent' | 'failed'
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text, nullable=True)
+    provider_message_id = db.Column(db.String(255), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
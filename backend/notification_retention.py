@@ -0,0 +1,231 @@
+# notification_retention.py
+"""
+Notification retention and compaction.
+
+Retention deletes notifications older than their type's TTL. Read and
+unread ones have separate TTLs, so an unread warning outlives a read info:
+
+    type      read    unread   (days)
+    info       30      180
+    success    30      180
+    warning    90      365
+    error     180      365
+    other      30      180     any type not listed above
+
+Compaction folds runs of similar notifications into one digest row: at
+least COMPACT_MIN_COUNT notifications with the same user, type and title,
+created on the same day more than COMPACT_AFTER_DAYS ago, become one row
+such as "12 invoices sent". A digest is unread if any of its notifications
+was, keeps the newest created_at and has related_entity_type 'digest', so
+it is never compacted again.
+
+Both work one committed batch at a time, selecting their rows with
+FOR UPDATE SKIP LOCKED, so they only ever lock the rows being removed and
+never wait on rows a request is updating. Unread counters get the exact
+change of every batch from its RETURNING rows.
+
+    python prune_notifications.py     (see that script for options)
+"""
+import os
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, insert, not_, or_, select
+
+from db import db
+from models import Notification
+from unread_counters import add_unread
+
+RETENTION_DAYS = {
+    # type: (read, unread)
+    'info': (30, 180),
+    'success': (30, 180),
+    'warning': (90, 365),
+    'error': (180, 365),
+}
+DEFAULT_RETENTION_DAYS = (30, 180)
+
+RETENTION_BATCH_SIZE = int(os.getenv('NOTIFICATION_RETENTION_BATCH_SIZE', '1000'))
+COMPACT_AFTER_DAYS = int(os.getenv('NOTIFICATION_COMPACT_AFTER_DAYS', '7'))
+COMPACT_MIN_COUNT = int(os.getenv('NOTIFICATION_COMPACT_MIN_COUNT', '3'))
+COMPACT_GROUP_BATCH = 100  # digests written per transaction
+
+DIGEST = 'digest'
+
+notifications = Notification.__table__
+
+
+def _not_digest():
+    return Notification.related_entity_type.is_distinct_from(DIGEST)
+
+
+def retention_rules(now=None):
+    """(description, criteria) of every set of notifications past its TTL"""
+    now = now or datetime.utcnow()
+    rules = []
+    for type, days in RETENTION_DAYS.items():
+        for is_read, ttl in zip((True, False), days):
+            rules.append((
+                f"{'read' if is_read else 'unread'} {type} older than {ttl} days",
+                (Notification.type == type, Notification.is_read.is_(is_read),
+                 Notification.created_at < now - timedelta(days=ttl))
+            ))
+    # Anything else, including rows without a type
+    other = or_(Notification.type.is_(None), not_(Notification.type.in_(list(RETENTION_DAYS))))
+    for is_read, ttl in zip((True, False), DEFAULT_RETENTION_DAYS):
+        rules.append((
+            f"{'read' if is_read else 'unread'} other types older than {ttl} days",
+            (other, Notification.is_read.is_(is_read), Notification.created_at < now - timedelta(days=ttl))
+        ))
+    return rules
+
+
+def delete_batch(criteria, batch_size=RETENTION_BATCH_SIZE):
+    """Delete up to `batch_size` notifications matching `criteria`; returns the RETURNING rows"""
+    doomed = select(Notification.id).where(*criteria).limit(batch_size).with_for_update(skip_locked=True)
+    return db.session.execute(
+        delete(notifications)
+        .where(Notification.id.in_(doomed.scalar_subquery()))
+        .returning(Notification.user_id, Notification.is_read)
+    ).all()
+
+
+def prune(batch_size=RETENTION_BATCH_SIZE, pause=0.0, dry_run=False, now=None):
+    """Delete every notification past its TTL; returns {rule description: rows deleted}"""
+    deleted = {}
+    for description, criteria in retention_rules(now):
+        if dry_run:
+            deleted[description] = db.session.execute(
+                select(func.count()).select_from(notifications).where(*criteria)
+            ).scalar()
+            continue
+
+        total = 0
+        while True:
+            try:
+                rows = delete_batch(criteria, batch_size)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            deltas = Counter()
+            for row in rows:
+                if not row.is_read:
+                    deltas[row.user_id] -= 1
+            add_unread(deltas)
+
+            total += len(rows)
+            if len(rows) < batch_size:
+                break
+            if pause:
+                time.sleep(pause)
+        deleted[description] = total
+    return deleted
+
+
+# ─── Compaction ─────────────────────────────────────────────────────────────
+
+def digest_message(title, count):
+    """'Invoice Sent' x 12 -> '12 invoices sent'"""
+    words = (title or '').split()
+    if len(words) == 2:
+        return f"{count} {words[0].lower()}s {words[1].lower()}"
+    return f"{count} notifications: {title}"
+
+
+def _day(column):
+    if db.engine.dialect.name == 'postgresql':
+        return func.date_trunc('day', column)
+    return func.date(column)
+
+
+def _as_datetime(day):
+    # PostgreSQL returns a datetime, SQLite an ISO date string
+    if isinstance(day, datetime):
+        return day
+    return datetime.fromisoformat(str(day))
+
+
+def compactable_groups(cutoff, min_count=COMPACT_MIN_COUNT, limit=COMPACT_GROUP_BATCH):
+    """(user_id, type, title, day) runs of at least `min_count` notifications created before `cutoff`"""
+    day = _day(Notification.created_at)
+    return db.session.execute(
+        select(Notification.user_id, Notification.type, Notification.title, day.label('day'))
+        .where(Notification.created_at < cutoff, _not_digest())
+        .group_by(Notification.user_id, Notification.type, Notification.title, day)
+        .having(func.count() >= min_count)
+        .limit(limit)
+    ).all()
+
+
+def compact_group(group, cutoff):
+    """
+    Replace one group's notifications with a digest row, in the caller's
+    transaction. Returns (notifications removed, {user_id: unread delta}).
+    """
+    start = _as_datetime(group.day)
+    criteria = (
+        Notification.user_id == group.user_id,
+        Notification.type.is_(None) if group.type is None else Notification.type == group.type,
+        Notification.title == group.title,
+        Notification.created_at >= start,
+        Notification.created_at < min(start + timedelta(days=1), cutoff),
+        _not_digest(),
+    )
+    doomed = select(Notification.id).where(*criteria).with_for_update(skip_locked=True)
+    rows = db.session.execute(
+        delete(notifications)
+        .where(Notification.id.in_(doomed.scalar_subquery()))
+        .returning(Notification.is_read, Notification.created_at)
+    ).all()
+    if not rows:
+        return 0, {}
+
+    unread = sum(1 for row in rows if not row.is_read)
+    db.session.execute(insert(notifications).values(
+        id=uuid.uuid4(),
+        user_id=group.user_id,
+        title=group.title,
+        message=digest_message(group.title, len(rows)),
+        type=group.type,
+        is_read=unread == 0,
+        related_entity_type=DIGEST,
+        related_entity_id=None,
+        created_at=max(row.created_at for row in rows),
+    ))
+    return len(rows), {group.user_id: (1 if unread else 0) - unread}
+
+
+def compact(after_days=COMPACT_AFTER_DAYS, min_count=COMPACT_MIN_COUNT, dry_run=False, now=None):
+    """Fold similar old notifications into digests; returns (digests written, notifications removed)"""
+    cutoff = (now or datetime.utcnow()) - timedelta(days=after_days)
+    if dry_run:
+        groups = compactable_groups(cutoff, min_count, limit=None)
+        return len(groups), None
+
+    digests = removed = 0
+    skipped = set()
+    while True:
+        groups = [group for group in compactable_groups(cutoff, min_count, COMPACT_GROUP_BATCH + len(skipped))
+                  if tuple(group) not in skipped]
+        if not groups:
+            break
+        deltas = Counter()
+        try:
+            for group in groups[:COMPACT_GROUP_BATCH]:
+                count, changes = compact_group(group, cutoff)
+                if count:
+                    digests += 1
+                    removed += count
+                    deltas.update(changes)
+                else:
+                    # Every row locked by someone else; leave it for the next run
+                    skipped.add(tuple(group))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        add_unread(deltas)
+    return digests, removed
@@ -2,6 +2,8 @@
 from flask import current_app
 from db import db
 from models import Notification
+from notification_writer import notification_writer
+import unread_counters
 from datetime import datetime
 import uuid
 import logging
@@ -11,9 +13,13 @@ from typing import Optional
 def create_notification(user_id: str, title: str, message: str,
                         type: str = 'info',
                         related_entity_type: Optional[str] = None,
-                        related_entity_id: Optional[str] = None) -> Optional[Notification]:
+                        related_entity_id: Optional[str] = None) -> Optional[str]:
     """
-    Helper function to create notifications easily from anywhere in the app
+    Helper function to create notifications easily from anywhere in the app.
+
+    The notification is queued on notification_writer and written with the
+    next batch, so this neither waits for the insert nor commits the
+    caller's session.
 
     Args:
         user_id: The UUID of the user who should receive the notification
@@ -24,14 +30,13 @@ def create_notification(user_id: str, title: str, message: str,
         related_entity_id: UUID of the related entity
 
     Returns:
-        Notification object if successful, None if failed
+        Id of the queued notification, None if the input was invalid
     """
     try:
         # Validate UUID format
         try:
-            uuid.UUID(user_id)
-            if related_entity_id:
-                uuid.UUID(related_entity_id)
+            user_uuid = uuid.UUID(str(user_id))
+            related_uuid = uuid.UUID(str(related_entity_id)) if related_entity_id else None
         except ValueError:
             logging.error(
                 f"Invalid UUID format in create_notification: user_id={user_id}, related_entity_id={related_entity_id}")
@@ -43,31 +48,31 @@ def create_notification(user_id: str, title: str, message: str,
             logging.warning(f"Invalid notification type: {type}. Defaulting to 'info'")
             type = 'info'
 
-        # Create new notification
-        notification = Notification(
-            user_id=user_id,
-            title=title,
-            message=message,
-            type=type,
-            related_entity_type=related_entity_type,
-            related_entity_id=related_entity_id
-        )
-
-        db.session.add(notification)
-        db.session.commit()
-
-        logging.info(f"Notification created successfully: {notification.id} for user {user_id}")
-        return notification
+        # Queue the new notification
+        notification_id = uuid.uuid4()
+        notification_writer.enqueue({
+            'id': notification_id,
+            'user_id': user_uuid,
+            'title': title,
+            'message': message,
+            'type': type,
+            'is_read': False,
+            'related_entity_type': related_entity_type,
+            'related_entity_id': related_uuid,
+            'created_at': datetime.utcnow()
+        })
+
+        logging.info(f"Notification queued: {notification_id} for user {user_id}")
+        return str(notification_id)
 
     except Exception as e:
-        db.session.rollback()
         logging.error(f"Error creating notification: {str(e)}", exc_info=True)
         return None
 
 
 def create_invoice_notification(user_id: str, invoice_number: str, action: str,
                                 invoice_id: Optional[str] = None,
-                                is_success: bool = True) -> Optional[Notification]:
+                                is_success: bool = True) -> Optional[str]:
     """
     Helper specifically for invoice-related notifications
 
@@ -79,7 +84,7 @@ def create_invoice_notification(user_id: str, invoice_number: str, action: str,
         is_success: Whether the action was successful
 
     Returns:
-        Notification object if successful, None if failed
+        Id of the queued notification, None if the input was invalid
     """
     type = 'success' if is_success else 'error'
     title = f"Invoice {action.capitalize()}"
@@ -100,7 +105,7 @@ def create_invoice_notification(user_id: str, invoice_number: str, action: str,
 
 def create_client_notification(user_id: str, client_name: str, action: str,
                                client_id: Optional[str] = None,
-                               is_success: bool = True) -> Optional[Notification]:
+                               is_success: bool = True) -> Optional[str]:
     """
     Helper specifically for client-related notifications
 
@@ -112,7 +117,7 @@ def create_client_notification(user_id: str, client_name: str, action: str,
         is_success: Whether the action was successful
 
     Returns:
-        Notification object if successful, None if failed
+        Id of the queued notification, None if the input was invalid
     """
     type = 'success' if is_success else 'error'
     title = f"Client {action.capitalize()}"
@@ -133,7 +138,7 @@ def create_client_notification(user_id: str, client_name: str, action: str,
 
 def create_user_notification(user_id: str, action: str,
                              is_success: bool = True,
-                             additional_info: str = "") -> Optional[Notification]:
+                             additional_info: str = "") -> Optional[str]:
     """
     Helper specifically for user account-related notifications
 
@@ -144,7 +149,7 @@ def create_user_notification(user_id: str, action: str,
         additional_info: Additional context for the notification
 
     Returns:
-        Notification object if successful, None if failed
+        Id of the queued notification, None if the input was invalid
     """
     type = 'success' if is_success else 'error'
 
@@ -173,7 +178,7 @@ def create_user_notification(user_id: str, action: str,
 
 
 def create_system_notification(user_id: str, title: str, message: str,
-                               type: str = 'info') -> Optional[Notification]:
+                               type: str = 'info') -> Optional[str]:
     """
     Helper for system-level notifications (maintenance, updates, etc.)
 
@@ -184,7 +189,7 @@ def create_system_notification(user_id: str, title: str, message: str,
         type: Notification type ('info', 'warning')
 
     Returns:
-        Notification object if successful, None if failed
+        Id of the queued notification, None if the input was invalid
     """
     return create_notification(
         user_id=user_id,
@@ -197,7 +202,7 @@ def create_system_notification(user_id: str, title: str, message: str,
 def create_payment_notification(user_id: str, invoice_number: str, amount: float,
                                 currency: str = 'USD',
                                 invoice_id: Optional[str] = None,
-                                is_success: bool = True) -> Optional[Notification]:
+                                is_success: bool = True) -> Optional[str]:
     """
     Helper specifically for payment-related notifications
 
@@ -210,7 +215,7 @@ def create_payment_notification(user_id: str, invoice_number: str, amount: float
         is_success: Whether the payment was successful
 
     Returns:
-        Notification object if successful, None if failed
+        Id of the queued notification, None if the input was invalid
     """
     type = 'success' if is_success else 'error'
 
@@ -261,8 +266,11 @@ def mark_notification_as_read(notification_id: str, user_id: str) -> bool:
             logging.warning(f"Notification {notification_id} not found for user {user_id}")
             return False
 
+        was_unread = not notification.is_read
         notification.is_read = True
         db.session.commit()
+        if was_unread:
+            unread_counters.add_unread({notification.user_id: -1})
 
         logging.info(f"Notification {notification_id} marked as read for user {user_id}")
         return True
@@ -297,6 +305,7 @@ def mark_all_notifications_as_read(user_id: str) -> bool:
         ).update({'is_read': True})
 
         db.session.commit()
+        unread_counters.set_unread(user_id, 0)
 
         logging.info(f"Marked {updated_count} notifications as read for user {user_id}")
         return True
@@ -325,12 +334,7 @@ def get_unread_notification_count(user_id: str) -> int:
             logging.error(f"Invalid UUID format in get_unread_notification_count: user_id={user_id}")
             return -1
 
-        count = Notification.query.filter_by(
-            user_id=user_id,
-            is_read=False
-        ).count()
-
-        return count
+        return unread_counters.unread_count(user_id)
 
     except Exception as e:
         logging.error(f"Error getting unread notification count: {str(e)}", exc_info=True)
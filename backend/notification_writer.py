@@ -0,0 +1,149 @@
+# notification_writer.py
+"""
+Buffered notification writes.
+
+The notification_utils helpers build a row and enqueue() it here instead of
+adding and committing it on the request's session. A daemon thread per
+worker process writes the buffer as one multi-row INSERT on its own
+connection once NOTIFICATION_BATCH_SIZE rows are waiting (default 100) or
+the oldest has waited NOTIFICATION_FLUSH_INTERVAL seconds (default 1). The
+request never commits on the notification's behalf, so it neither pays
+for the write nor commits the caller's unrelated pending state.
+
+NOTIFICATION_WRITER_MODE=sync writes each notification immediately (still
+on its own connection), for tests and one-off scripts. Whatever is still
+buffered when the process exits is written by an atexit hook.
+
+Written rows update the unread counters and are published as
+`notification` events (event_stream.py).
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+from sqlalchemy import insert
+
+from db import db
+from models import Notification
+from unread_counters import add_unread
+from event_stream import notification_event, publish_events
+
+NOTIFICATION_BATCH_SIZE = int(os.getenv('NOTIFICATION_BATCH_SIZE', '100'))
+NOTIFICATION_FLUSH_INTERVAL = float(os.getenv('NOTIFICATION_FLUSH_INTERVAL', '1'))
+NOTIFICATION_WRITER_MODE = os.getenv('NOTIFICATION_WRITER_MODE', 'async')
+
+notifications = Notification.__table__
+
+
+class NotificationWriter:
+    """Per-process buffer of notification rows and the thread that writes it"""
+
+    def __init__(self, batch_size=NOTIFICATION_BATCH_SIZE, flush_interval=NOTIFICATION_FLUSH_INTERVAL,
+                 mode=NOTIFICATION_WRITER_MODE):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.mode = mode
+        self._engine = None
+        self._rows = []
+        self._oldest = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._write_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def enqueue(self, row):
+        """Queue one notification row (a dict of column values with its id set)"""
+        if self._engine is None:
+            self._engine = db.engine
+
+        if self.mode == 'sync':
+            self._write([row])
+            return
+
+        with self._lock:
+            self._ensure_thread()
+            self._rows.append(row)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            if len(self._rows) >= self.batch_size:
+                self._wakeup.notify()
+
+    def flush(self):
+        """Write everything buffered so far; returns how many rows were written"""
+        with self._lock:
+            rows, self._rows, self._oldest = self._rows, [], None
+        return self._write(rows) if rows else 0
+
+    def pending(self):
+        with self._lock:
+            return len(self._rows)
+
+    def _ensure_thread(self):
+        # Called with the lock held. A forked gunicorn worker inherits the
+        # parent's buffer but not its thread, so both are reset per process.
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._rows = []
+            self._oldest = None
+            self._thread = None
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='notification-writer', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while True:
+                    if len(self._rows) >= self.batch_size:
+                        break
+                    if self._oldest is not None:
+                        remaining = self._oldest + self.flush_interval - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._wakeup.wait(remaining)
+                    else:
+                        self._wakeup.wait()
+                rows, self._rows, self._oldest = self._rows[:self.batch_size], self._rows[self.batch_size:], None
+                if self._rows:
+                    self._oldest = time.monotonic()
+            self._write(rows)
+
+    def _write(self, rows):
+        """One INSERT for the batch; row by row if it fails, so one bad row only loses itself"""
+        with self._write_lock:
+            try:
+                with self._engine.begin() as connection:
+                    connection.execute(insert(notifications).values(rows))
+                written = rows
+            except Exception as e:
+                if len(rows) == 1:
+                    logging.error(f"Error writing notification for user {rows[0]['user_id']}: {str(e)}")
+                    return 0
+                logging.warning(f"Batched notification insert of {len(rows)} rows failed, retrying one by one: {str(e)}")
+                written = self._write_one_by_one(rows)
+
+        try:
+            add_unread(Counter(row['user_id'] for row in written))
+        except Exception as e:
+            logging.error(f"Error updating unread counters: {str(e)}")
+        publish_events([notification_event(row) for row in written], engine=self._engine)
+        return len(written)
+
+    def _write_one_by_one(self, rows):
+        written = []
+        for row in rows:
+            try:
+                with self._engine.begin() as connection:
+                    connection.execute(insert(notifications).values(row))
+                written.append(row)
+            except Exception as e:
+                logging.error(f"Error writing notification for user {row['user_id']}: {str(e)}")
+        return written
+
+
+notification_writer = NotificationWriter()
+atexit.register(notification_writer.flush)
@@ -4,6 +4,11 @@ from models import Notification
 from datetime import datetime
 import uuid
 import logging
+from collections import Counter
+from pagination import cursor_requested, keyset_page, cursor_pagination
+from bulk_operations import parse_ids, delete_rows
+import unread_counters
+from event_stream import notification_event, publish_events
 
 
 class Notifications:
@@ -85,6 +90,9 @@ class Notifications:
 
             db.session.add(notification)
             db.session.commit()
+            if not notification.is_read:
+                unread_counters.add_unread({notification.user_id: 1})
+            publish_events([notification_event(notification)])
 
             return jsonify({
                 'success': True,
@@ -126,21 +134,21 @@ class Notifications:
             # Order by created_at descending (newest first)
             query = query.order_by(Notification.created_at.desc())
 
-            # Paginate
-            paginated = query.paginate(
-                page=page,
-                per_page=per_page,
-                error_out=False
-            )
-
-            notifications = []
-            for notification in paginated.items:
-                notifications.append(Notifications.format_notification_response(notification))
-
-            return jsonify({
-                'success': True,
-                'notifications': notifications,
-                'pagination': {
+            if cursor_requested():
+                try:
+                    items, next_cursor = keyset_page(query, Notification, request.args.get('cursor'), per_page)
+                except ValueError as e:
+                    return jsonify({'success': False, 'error': str(e)}), 400
+                pagination = cursor_pagination(query, next_cursor, per_page)
+            else:
+                # Paginate
+                paginated = query.paginate(
+                    page=page,
+                    per_page=per_page,
+                    error_out=False
+                )
+                items = paginated.items
+                pagination = {
                     'page': page,
                     'per_page': per_page,
                     'total': paginated.total,
@@ -148,6 +156,15 @@ class Notifications:
                     'has_prev': paginated.has_prev,
                     'has_next': paginated.has_next
                 }
+
+            notifications = []
+            for notification in items:
+                notifications.append(Notifications.format_notification_response(notification))
+
+            return jsonify({
+                'success': True,
+                'notifications': notifications,
+                'pagination': pagination
             })
 
         except Exception as e:
@@ -165,10 +182,7 @@ class Notifications:
             if not Notifications.validate_uuid(user_id):
                 return jsonify({'success': False, 'error': 'Invalid user_id format'}), 400
 
-            count = Notification.query.filter_by(
-                user_id=user_id,
-                is_read=False
-            ).count()
+            count = unread_counters.unread_count(user_id)
 
             return jsonify({
                 'success': True,
@@ -179,6 +193,42 @@ class Notifications:
             logging.error(f"Error getting unread count: {str(e)}", exc_info=True)
             return jsonify({'success': False, 'error': 'Failed to get unread count'}), 500
 
+    @staticmethod
+    def wait_for_unread_count():
+        """
+        Long-poll for the unread count: answers once it differs from `count`
+        (the value the client already shows), or after `timeout` seconds
+        with changed=false. Without `count`, or when too many requests are
+        already waiting, it answers right away like get_unread_count.
+        """
+        try:
+            user_id = request.args.get('user_id')
+            if not user_id:
+                return jsonify({'success': False, 'error': 'user_id is required'}), 400
+
+            if not Notifications.validate_uuid(user_id):
+                return jsonify({'success': False, 'error': 'Invalid user_id format'}), 400
+
+            seen = request.args.get('count', type=int)
+            timeout = min(max(request.args.get('timeout', unread_counters.UNREAD_WAIT_TIMEOUT, type=float), 0),
+                          unread_counters.UNREAD_WAIT_TIMEOUT)
+
+            result = unread_counters.wait_for_change(user_id, seen, timeout) if seen is not None else None
+            if result is None:
+                count = unread_counters.unread_count(user_id)
+                return jsonify({'success': True, 'count': count, 'changed': count != seen})
+
+            count, changed = result
+            return jsonify({
+                'success': True,
+                'count': count,
+                'changed': changed
+            })
+
+        except Exception as e:
+            logging.error(f"Error waiting for unread count: {str(e)}", exc_info=True)
+            return jsonify({'success': False, 'error': 'Failed to get unread count'}), 500
+
     @staticmethod
     def mark_as_read(notification_id):
         """Mark a notification as read"""
@@ -190,8 +240,11 @@ class Notifications:
             if not notification:
                 return jsonify({'success': False, 'error': 'Notification not found'}), 404
 
+            was_unread = not notification.is_read
             notification.is_read = True
             db.session.commit()
+            if was_unread:
+                unread_counters.add_unread({notification.user_id: -1})
 
             return jsonify({
                 'success': True,
@@ -221,6 +274,7 @@ class Notifications:
             ).update({'is_read': True})
 
             db.session.commit()
+            unread_counters.set_unread(user_id, 0)
 
             return jsonify({
                 'success': True,
@@ -243,8 +297,11 @@ class Notifications:
             if not notification:
                 return jsonify({'success': False, 'error': 'Notification not found'}), 404
 
+            user_id, was_unread = notification.user_id, not notification.is_read
             db.session.delete(notification)
             db.session.commit()
+            if was_unread:
+                unread_counters.add_unread({user_id: -1})
 
             return jsonify({
                 'success': True,
@@ -264,22 +321,18 @@ class Notifications:
             if not data or 'notification_ids' not in data:
                 return jsonify({'success': False, 'error': 'notification_ids are required'}), 400
 
-            notification_ids = data['notification_ids']
-            if not isinstance(notification_ids, list) or not notification_ids:
-                return jsonify({'success': False, 'error': 'notification_ids must be a non-empty list'}), 400
-
-            # Validate all notification IDs
-            for notification_id in notification_ids:
-                if not Notifications.validate_uuid(notification_id):
-                    return jsonify(
-                        {'success': False, 'error': f'Invalid notification ID format: {notification_id}'}), 400
+            try:
+                notification_ids = parse_ids(data['notification_ids'], 'notification_ids', 'notification')
+            except ValueError as e:
+                return jsonify({'success': False, 'error': str(e)}), 400
 
             # Delete all notifications
-            deleted_count = Notification.query.filter(
-                Notification.id.in_(notification_ids)
-            ).delete(synchronize_session=False)
+            deleted = delete_rows(Notification, notification_ids,
+                                  returning=(Notification.user_id, Notification.is_read))
+            deleted_count = len(deleted)
 
             db.session.commit()
+            unread_counters.add_unread(Counter(row.user_id for row in deleted if not row.is_read))
 
             return jsonify({
                 'success': True,
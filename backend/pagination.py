@@ -0,0 +1,101 @@
+# pagination.py
+"""
+Keyset (cursor) pagination on (created_at, id).
+
+List endpoints keep their page/per_page mode; passing `?cursor=` (empty for
+the first page) switches them to cursor mode:
+
+    GET /api/clients?user_id=...&cursor=&per_page=20
+    -> {"clients": [...], "pagination": {"per_page": 20, "has_next": true,
+                                          "next_cursor": "eyJj..."}}
+    GET /api/clients?user_id=...&cursor=eyJj...&per_page=20
+
+Each page is one index range scan of per_page + 1 rows, however deep it
+is, and no COUNT(*) runs unless asked for with `count=exact` (a full
+count) or `count=estimate` (the planner's row estimate, constant time).
+"""
+import base64
+import json
+import uuid
+from datetime import datetime
+
+from flask import request
+from sqlalchemy import tuple_
+
+from db import db
+
+
+def cursor_requested():
+    """True when the request opted into cursor mode"""
+    return request.args.get('cursor') is not None
+
+
+def encode_cursor(created_at, row_id):
+    payload = json.dumps({'c': created_at.isoformat() if created_at else None, 'i': str(row_id)})
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(created_at, id) from a cursor string; raises ValueError if it is not one of ours"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        created_at = datetime.fromisoformat(payload['c']) if payload['c'] else None
+        return created_at, uuid.UUID(payload['i'])
+    except (ValueError, KeyError, TypeError):
+        raise ValueError('Invalid cursor')
+
+
+def estimate_count(query):
+    """Planner row estimate for a query, without running it"""
+    statement = query.order_by(None).statement
+    compiled = statement.compile(dialect=db.engine.dialect)
+    params = {key: str(value) if isinstance(value, uuid.UUID) else value
+              for key, value in compiled.params.items()}
+    plan = db.session.connection().exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", params).scalar()
+    plan = plan if isinstance(plan, list) else json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def keyset_page(query, model, cursor, per_page, descending=True):
+    """
+    One page of `query` ordered by (created_at, id), starting after `cursor`
+    ('' or None for the first page). Returns (items, next_cursor); the
+    query's own ordering is replaced.
+    """
+    created_at, row_id = model.created_at, model.id
+    query = query.order_by(None)
+
+    if cursor:
+        after_created, after_id = decode_cursor(cursor)
+        key = tuple_(created_at, row_id)
+        query = query.filter(key < (after_created, after_id) if descending else key > (after_created, after_id))
+
+    if descending:
+        query = query.order_by(created_at.desc(), row_id.desc())
+    else:
+        query = query.order_by(created_at.asc(), row_id.asc())
+
+    # One extra row says whether there is a next page
+    items = query.limit(per_page + 1).all()
+    if len(items) <= per_page:
+        return items, None
+    items = items[:per_page]
+    return items, encode_cursor(items[-1].created_at, items[-1].id)
+
+
+def cursor_pagination(query, next_cursor, per_page):
+    """The `pagination` block of a cursor-mode response"""
+    pagination = {
+        'per_page': per_page,
+        'has_next': next_cursor is not None,
+        'next_cursor': next_cursor,
+    }
+
+    count_mode = request.args.get('count', 'none')
+    if count_mode == 'exact':
+        pagination['total'] = query.order_by(None).count()
+    elif count_mode == 'estimate':
+        pagination['total'] = estimate_count(query)
+        pagination['total_is_estimate'] = True
+    return pagination
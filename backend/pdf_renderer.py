@@ -0,0 +1,147 @@
+# pdf_renderer.py
+"""
+WeasyPrint entry points used by the render pool.
+
+These functions run inside pool worker processes, so they take plain
+HTML strings and return bytes - no Flask app or request context needed.
+
+The invoice templates carry one static <style> block each. Workers parse
+those blocks into CSS objects (with a FontConfiguration per template) once
+at startup; a render whose HTML contains a known block has it stripped and
+gets the pre-parsed stylesheet instead. If a template changed since the
+worker started its block no longer matches and the render falls back to
+parsing the inline CSS.
+
+Passed as `stylesheets=`, the block becomes user-origin CSS instead of
+author-origin. In the cascade user normal declarations still beat the UA
+stylesheet and lose only to author ones; the templates have no other
+stylesheets and no !important, and their style="" attributes beat the
+block under either origin, so the result is the same. warm_up() checks
+this per template by rendering a sample both ways and comparing the PDF
+bytes; a template whose output differs is dropped from the cache and
+keeps being rendered from its inline CSS.
+"""
+import glob
+import logging
+import os
+import re
+import ssl
+
+import certifi
+
+from url_fetcher import get_url_fetcher
+
+BASE_URL = os.path.dirname(os.path.abspath(__file__))
+TEMPLATES_DIR = os.path.join(BASE_URL, 'templates')
+TEMPLATE_PATTERN = 'invoice_template*.html'
+
+_STYLE_RE = re.compile(r'<style[^>]*>(.*?)</style>', re.S | re.I)
+
+
+class TemplateStyles:
+    """Pre-parsed stylesheet and font configuration of one template"""
+
+    def __init__(self, name, block, stylesheets, font_config):
+        self.name = name
+        self.block = block              # the literal <style>...</style> text
+        self.stylesheets = stylesheets
+        self.font_config = font_config
+
+
+_template_styles = {}  # template file name -> TemplateStyles
+_warmed_up = False
+
+
+def load_template_styles(path, base_url=BASE_URL):
+    """Parse the static <style> block of a template, or None if it has none"""
+    from weasyprint import CSS
+    from weasyprint.text.fonts import FontConfiguration
+
+    with open(path, encoding='utf-8') as f:
+        source = f.read()
+
+    match = _STYLE_RE.search(source)
+    if not match or '{{' in match.group(0) or '{%' in match.group(0):
+        return None  # templated CSS has to be parsed per render
+
+    font_config = FontConfiguration()
+    css = CSS(string=match.group(1), base_url=base_url, font_config=font_config, url_fetcher=get_url_fetcher())
+    return TemplateStyles(os.path.basename(path), match.group(0), [css], font_config)
+
+
+def preload_templates(templates_dir=TEMPLATES_DIR):
+    """Parse the CSS of every invoice template into the per-process cache"""
+    for path in sorted(glob.glob(os.path.join(templates_dir, TEMPLATE_PATTERN))):
+        try:
+            styles = load_template_styles(path)
+        except Exception as e:
+            logging.warning(f"Could not preload CSS for {path}: {e}")
+            continue
+        if styles is not None:
+            _template_styles[styles.name] = styles
+    return list(_template_styles)
+
+
+def prepare_document(html, base_url=BASE_URL):
+    """
+    HTML document plus the render options to use with it - the cached
+    stylesheet and font configuration when the template is a known one.
+    """
+    from weasyprint import HTML
+
+    options = {}
+    for styles in _template_styles.values():
+        if styles.block in html:
+            html = html.replace(styles.block, '', 1)
+            options = {'stylesheets': styles.stylesheets, 'font_config': styles.font_config}
+            break
+    return HTML(string=html, base_url=base_url, url_fetcher=get_url_fetcher()), options
+
+
+def render_pdf(html, base_url=BASE_URL):
+    """Render an HTML document to PDF bytes"""
+    ssl_context = ssl.create_default_context(cafile=certifi.where())
+    document, options = prepare_document(html, base_url)
+    return document.write_pdf(ssl_context=ssl_context, **options)
+
+
+def render_merged_pdf(htmls, base_url=BASE_URL):
+    """Render several HTML documents into one PDF, in order"""
+    ssl_context = ssl.create_default_context(cafile=certifi.where())
+    documents = []
+    for html in htmls:
+        document, options = prepare_document(html, base_url)
+        documents.append(document.render(ssl_context=ssl_context, **options))
+    pages = [page for document in documents for page in document.pages]
+    return documents[0].copy(pages).write_pdf()
+
+
+def warm_up():
+    """
+    Pool worker initializer: preload template CSS, then lay out a small
+    document per template, with the cached stylesheet and with the inline
+    block, so fontconfig/Pango are initialised before the first real
+    request and templates whose two outputs differ are not cached. Never
+    raises - a failed warm-up must not break the pool.
+    """
+    global _warmed_up
+    if _warmed_up:
+        return
+    _warmed_up = True
+
+    try:
+        from weasyprint import HTML
+
+        preload_templates()
+        for name, styles in list(_template_styles.items()):
+            sample = (f"<html><head>{styles.block}</head>"
+                      "<body><h1>Invoice</h1><p>Warm-up 0123456789 $€£₦</p></body></html>")
+            cached = render_pdf(sample)
+            inline = HTML(string=sample, base_url=BASE_URL, url_fetcher=get_url_fetcher()).write_pdf(
+                ssl_context=ssl.create_default_context(cafile=certifi.where()))
+            if cached != inline:
+                del _template_styles[name]
+                logging.warning(f"Pre-parsed CSS of {name} renders differently; using its inline CSS")
+        logging.info(f"Render worker {os.getpid()} warmed up: {', '.join(_template_styles) or 'no templates'}")
+    except Exception as e:
+        logging.warning(f"Render worker warm-up failed: {e}")
@@ -0,0 +1,126 @@
+# preview_benchmark.py
+"""
+Compare the old and new invoice preview paths on the bundled templates.
+
+    old: the baseline /preview-invoice path - plain HTML(...).write_pdf() with
+         no shared url_fetcher, pre-parsed CSS or font config, then
+         convert_from_path() of every page, keeping page 1
+    new: preview_engine.render_preview_png() - first page only, one pdftoppm call
+
+Usage:
+    python preview_benchmark.py [--runs 5] [--items 40] [--dpi 150]
+"""
+import argparse
+import glob
+import os
+import ssl
+import statistics
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+import certifi
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from jinja2 import Environment, FileSystemLoader
+
+import pdf_renderer
+import preview_engine
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+
+
+def sample_template_data(item_count):
+    """Template context shaped like parse_invoice_data() output"""
+    items = [
+        {
+            'name': f"Item {i + 1}",
+            'description': f"Consulting work item {i + 1}",
+            'quantity': 2,
+            'unit_cost': 150.0,
+            'subtotal': 300.0,
+        }
+        for i in range(item_count)
+    ]
+    subtotal = sum(item['subtotal'] for item in items)
+    return {
+        'invoice_number': 'INV-BENCH-001',
+        'from': 'Envoyce Ltd\n1 Example Street\nLagos',
+        'to': 'Acme Corp\n42 Client Road\nLondon',
+        'date': '2026-01-01',
+        'issued_date': '2026-01-01',
+        'due_date': '2026-01-31',
+        'payment_terms': 'Net 30',
+        'currency': 'USD',
+        'currency_symbol': '$',
+        'items': items,
+        'subtotal': subtotal,
+        'tax_percent': 7.5,
+        'tax_amount': subtotal * 0.075,
+        'show_tax': True,
+        'discount_percent': 0,
+        'discount_amount': 0,
+        'show_discount': False,
+        'shipping_amount': 0,
+        'show_shipping': False,
+        'total': subtotal * 1.075,
+        'amount_paid': 0,
+        'balance_due': subtotal * 1.075,
+        'notes': 'Thank you for your business.',
+        'terms': 'Payment due within 30 days.',
+        'payment_details': 'Bank: Example Bank\nAccount: 0123456789',
+        'logo_url': None,
+    }
+
+
+def old_preview_png(html, dpi):
+    """The baseline preview path: uncached WeasyPrint, then rasterize every page"""
+    from pdf2image import convert_from_path
+    from weasyprint import HTML
+
+    ssl_context = ssl.create_default_context(cafile=certifi.where())
+    with tempfile.NamedTemporaryFile(suffix='.pdf') as pdf:
+        HTML(string=html, base_url=pdf_renderer.BASE_URL).write_pdf(pdf, ssl_context=ssl_context)
+        pdf.flush()
+        images = convert_from_path(pdf.name, dpi=dpi)
+    img_io = BytesIO()
+    images[0].save(img_io, format="PNG")
+    return img_io.getvalue()
+
+
+def time_runs(fn, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark invoice preview rendering")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--items', type=int, default=40, help="line items per invoice (controls page count)")
+    parser.add_argument('--dpi', type=int, default=preview_engine.PREVIEW_DPI)
+    args = parser.parse_args()
+
+    env = Environment(loader=FileSystemLoader(TEMPLATES_DIR))
+    pdf_renderer.warm_up()  # the new path runs in warmed-up pool workers
+    data = sample_template_data(args.items)
+
+    print(f"{'template':<28}{'old (s)':>10}{'new (s)':>10}{'speedup':>10}")
+    for path in sorted(glob.glob(os.path.join(TEMPLATES_DIR, 'invoice_template*.html'))):
+        name = os.path.basename(path)
+        try:
+            html = env.get_template(name).render(**data)
+            old = time_runs(lambda: old_preview_png(html, args.dpi), args.runs)
+            new = time_runs(lambda: preview_engine.render_preview_png(html, dpi=args.dpi), args.runs)
+            print(f"{name:<28}{old:>10.3f}{new:>10.3f}{old / new:>9.1f}x")
+        except Exception as e:
+            print(f"{name:<28} failed: {e}")
+
+
+if __name__ == '__main__':
+    main()
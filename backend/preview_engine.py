@@ -0,0 +1,63 @@
+# preview_engine.py
+"""
+Invoice preview rendering.
+
+The editor only ever shows the first page, so previews:
+    1. lay the document out once and serialize only page 1 to PDF,
+    2. rasterize that single page with one pdftoppm call (first_page/last_page),
+       with the poppler location resolved once per process,
+    3. can skip PDF entirely and return the rendered HTML, which the
+       frontend shows while the PNG is computed.
+"""
+import os
+import shutil
+from functools import lru_cache
+from io import BytesIO
+
+import pdf_renderer
+
+PREVIEW_DPI = int(os.getenv('PREVIEW_DPI', 150))
+
+
+@lru_cache(maxsize=1)
+def poppler_path():
+    """Directory containing pdftoppm (POPPLER_PATH overrides PATH lookup)"""
+    configured = os.getenv('POPPLER_PATH')
+    if configured:
+        return configured
+    binary = shutil.which('pdftoppm')
+    return os.path.dirname(binary) if binary else None
+
+
+def render_first_page_pdf(html, base_url=pdf_renderer.BASE_URL):
+    """Lay the document out and write a PDF containing only its first page"""
+    import ssl
+    import certifi
+
+    ssl_context = ssl.create_default_context(cafile=certifi.where())
+    html, options = pdf_renderer.prepare_document(html, base_url)
+    document = html.render(ssl_context=ssl_context, **options)
+    return document.copy(document.pages[:1]).write_pdf()
+
+
+def rasterize_first_page(pdf, dpi=PREVIEW_DPI):
+    """Rasterize page 1 of a PDF to PNG bytes with a single pdftoppm run"""
+    from pdf2image import convert_from_bytes
+
+    images = convert_from_bytes(
+        pdf,
+        dpi=dpi,
+        first_page=1,
+        last_page=1,
+        single_file=True,
+        fmt='png',
+        poppler_path=poppler_path(),
+    )
+    img_io = BytesIO()
+    images[0].save(img_io, format="PNG")
+    return img_io.getvalue()
+
+
+def render_preview_png(html, base_url=pdf_renderer.BASE_URL, dpi=PREVIEW_DPI):
+    """HTML -> first-page PDF -> PNG; runs inside render pool workers"""
+    return rasterize_first_page(render_first_page_pdf(html, base_url), dpi=dpi)
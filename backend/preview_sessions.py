@@ -0,0 +1,252 @@
+# preview_sessions.py
+"""
+Session-scoped state for the live invoice preview.
+
+The editor opens a preview session and then sends small patches instead of
+the whole invoice on every keystroke. Per session we keep the current
+invoice JSON and the last rendered PNG, so:
+
+    - an unchanged invoice is answered from the session without rendering,
+    - bursts of edits are coalesced: every request waits out the debounce
+      window and only the one carrying the latest revision renders, the
+      others return immediately as superseded.
+
+Sessions live in the worker process. Clients number their edits
+(`revision`) and say which revision a patch applies to (`base_revision`);
+a request that lands on a worker without that base gets a resync error and
+the client resends the full invoice.
+"""
+import copy
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from render_cache import canonical_json
+
+PREVIEW_DEBOUNCE = float(os.getenv('PREVIEW_DEBOUNCE_MS', 300)) / 1000
+PREVIEW_MAX_SESSIONS = int(os.getenv('PREVIEW_MAX_SESSIONS', 200))
+PREVIEW_SESSION_TTL = int(os.getenv('PREVIEW_SESSION_TTL', 30 * 60))
+
+
+class PatchError(ValueError):
+    """Invalid or inapplicable patch document"""
+
+
+class ResyncRequired(Exception):
+    """The session does not hold the revision a patch was made against"""
+
+
+# ─── Patching ────────────────────────────────────────────────────────────────
+
+def apply_merge_patch(target, patch):
+    """RFC 7396 JSON Merge Patch"""
+    if not isinstance(patch, dict):
+        return copy.deepcopy(patch)
+    result = dict(target) if isinstance(target, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = apply_merge_patch(result.get(key), value)
+    return result
+
+
+def _split_pointer(pointer):
+    if pointer == '':
+        return []
+    if not pointer.startswith('/'):
+        raise PatchError(f"Invalid JSON pointer: {pointer!r}")
+    return [part.replace('~1', '/').replace('~0', '~') for part in pointer[1:].split('/')]
+
+
+def _list_index(parent, key, pointer, appending=False):
+    """
+    A list index from a pointer token: digits only, without leading zeros,
+    and inside the list (one past the end, or '-', when `appending`)
+    """
+    if appending and key == '-':
+        return len(parent)
+    if not key.isdigit() or (len(key) > 1 and key[0] == '0'):
+        raise PatchError(f"Invalid list index in {pointer}")
+    index = int(key)
+    if index > len(parent) or (index == len(parent) and not appending):
+        raise PatchError(f"Index out of range: {pointer}")
+    return index
+
+
+def _resolve_parent(document, pointer):
+    parts = _split_pointer(pointer)
+    if not parts:
+        raise PatchError("Operation on the document root is not supported")
+    parent = document
+    for part in parts[:-1]:
+        try:
+            parent = parent[_list_index(parent, part, pointer)] if isinstance(parent, list) else parent[part]
+        except (KeyError, TypeError):
+            raise PatchError(f"Path not found: {pointer}")
+    return parent, parts[-1]
+
+
+def _get(document, pointer):
+    parent, key = _resolve_parent(document, pointer)
+    try:
+        return parent[_list_index(parent, key, pointer)] if isinstance(parent, list) else parent[key]
+    except (KeyError, TypeError):
+        raise PatchError(f"Path not found: {pointer}")
+
+
+def _add(document, pointer, value):
+    parent, key = _resolve_parent(document, pointer)
+    if isinstance(parent, list):
+        parent.insert(_list_index(parent, key, pointer, appending=True), value)
+    elif isinstance(parent, dict):
+        parent[key] = value
+    else:
+        raise PatchError(f"Cannot add to {pointer}")
+
+
+def _remove(document, pointer):
+    parent, key = _resolve_parent(document, pointer)
+    try:
+        if isinstance(parent, list):
+            return parent.pop(_list_index(parent, key, pointer))
+        return parent.pop(key)
+    except (KeyError, TypeError, AttributeError):
+        raise PatchError(f"Path not found: {pointer}")
+
+
+def apply_json_patch(document, operations):
+    """RFC 6902 JSON Patch (add, remove, replace, move, copy, test)"""
+    document = copy.deepcopy(document)
+    for operation in operations:
+        if not isinstance(operation, dict) or 'op' not in operation or 'path' not in operation:
+            raise PatchError("Each patch operation needs 'op' and 'path'")
+        op, path = operation['op'], operation['path']
+
+        if op == 'add':
+            _add(document, path, copy.deepcopy(operation.get('value')))
+        elif op == 'remove':
+            _remove(document, path)
+        elif op == 'replace':
+            _remove(document, path)
+            _add(document, path, copy.deepcopy(operation.get('value')))
+        elif op == 'move':
+            _add(document, path, _remove(document, operation['from']))
+        elif op == 'copy':
+            _add(document, path, copy.deepcopy(_get(document, operation['from'])))
+        elif op == 'test':
+            if _get(document, path) != operation.get('value'):
+                raise PatchError(f"Test failed at {path}")
+        else:
+            raise PatchError(f"Unsupported patch operation: {op}")
+    return document
+
+
+def apply_patch(document, patch):
+    """A list is an RFC 6902 patch, an object an RFC 7396 merge patch"""
+    if isinstance(patch, list):
+        return apply_json_patch(document, patch)
+    if isinstance(patch, dict):
+        return apply_merge_patch(document, patch)
+    raise PatchError("Patch must be a JSON array (RFC 6902) or object (RFC 7396)")
+
+
+# ─── Sessions ────────────────────────────────────────────────────────────────
+
+class PreviewSession:
+    """Editor state for one preview session"""
+
+    def __init__(self, session_id):
+        self.id = session_id
+        self.data = {}
+        self.revision = None
+        self.generation = 0           # bumped on every accepted update
+        self.rendered_hash = None     # hash of `data` the PNG was rendered from
+        self.png = None
+        self.job_id = None            # render pool job of the latest render
+        self.updated_at = time.monotonic()
+        self.last_access = time.time()
+
+    @property
+    def data_hash(self):
+        return hashlib.sha256(canonical_json(self.data).encode('utf-8')).hexdigest()
+
+
+class PreviewSessionStore:
+    """Bounded, LRU-evicted registry of preview sessions"""
+
+    def __init__(self, max_sessions=PREVIEW_MAX_SESSIONS, ttl=PREVIEW_SESSION_TTL):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict()
+        self._cond = threading.Condition()
+
+    def _evict(self):
+        now = time.time()
+        for session_id in [sid for sid, s in self._sessions.items() if now - s.last_access > self.ttl]:
+            del self._sessions[session_id]
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    def get(self, session_id):
+        with self._cond:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.last_access = time.time()
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def update(self, session_id, data=None, patch=None, revision=None, base_revision=None):
+        """
+        Replace (`data`) or patch (`patch` against `base_revision`) the
+        session's invoice. Returns (session, generation) for debouncing.
+        """
+        with self._cond:
+            session = self._sessions.get(session_id)
+
+            if data is not None:
+                if not isinstance(data, dict):
+                    raise PatchError("'data' must be a JSON object")
+                if session is None:
+                    session = PreviewSession(session_id)
+                    self._sessions[session_id] = session
+                session.data = copy.deepcopy(data)
+            else:
+                if session is None or base_revision is None or session.revision != base_revision:
+                    raise ResyncRequired()
+                session.data = apply_patch(session.data, patch)
+
+            session.revision = revision
+            session.generation += 1
+            session.updated_at = time.monotonic()
+            session.last_access = time.time()
+            self._sessions.move_to_end(session_id)
+            self._evict()
+
+            self._cond.notify_all()  # wake superseded waiters right away
+            return session, session.generation
+
+    def wait_until_quiet(self, session, generation, window=PREVIEW_DEBOUNCE):
+        """
+        Block until `window` seconds pass without another update. Returns
+        False as soon as a newer update supersedes `generation`.
+        """
+        with self._cond:
+            while session.generation == generation:
+                remaining = session.updated_at + window - time.monotonic()
+                if remaining <= 0:
+                    return True
+                self._cond.wait(remaining)
+            return False
+
+    def is_current(self, session, generation):
+        return session.generation == generation
+
+    def discard(self, session_id):
+        with self._cond:
+            return self._sessions.pop(session_id, None) is not None
+
+    def __len__(self):
+        return len(self._sessions)
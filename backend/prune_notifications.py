@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+"""
+Apply notification retention and compaction (see notification_retention.py).
+
+Old notifications are first folded into digests, then everything past its
+type's TTL is deleted, in committed batches that only lock the rows they
+remove.
+
+    python prune_notifications.py                       # one pass (cron)
+    python prune_notifications.py --dry-run             # report what would go
+    python prune_notifications.py --interval 3600       # keep running hourly
+    python prune_notifications.py --no-compact --batch-size 5000 --pause 0.5
+"""
+import argparse
+import sys
+import os
+import time
+
+# Add the current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from notification_retention import (RETENTION_BATCH_SIZE, COMPACT_AFTER_DAYS, COMPACT_MIN_COUNT,
+                                    compact, prune)
+
+# Import your app instance directly
+from app import app
+
+
+def prune_notifications(batch_size=RETENTION_BATCH_SIZE, pause=0.0, compact_after=COMPACT_AFTER_DAYS,
+                        compact_min=COMPACT_MIN_COUNT, skip_compaction=False, dry_run=False):
+    """One retention pass; returns the number of notifications removed"""
+
+    with app.app_context():
+        removed = 0
+        try:
+            if not skip_compaction:
+                digests, folded = compact(after_days=compact_after, min_count=compact_min, dry_run=dry_run)
+                if dry_run:
+                    print(f"   would write {digests} digests")
+                else:
+                    removed += folded
+                    print(f"✅ Folded {folded} notifications into {digests} digests")
+
+            for description, count in prune(batch_size=batch_size, pause=pause, dry_run=dry_run).items():
+                if count:
+                    print(f"   {'would delete' if dry_run else 'deleted'} {count}: {description}")
+                    removed += count
+        except Exception as e:
+            print(f"❌ Error pruning notifications: {str(e)}")
+            return removed
+
+        print(f"✅ {'Would remove' if dry_run else 'Removed'} {removed} notifications")
+        return removed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Delete expired notifications and compact old ones into digests")
+    parser.add_argument('--batch-size', type=int, default=RETENTION_BATCH_SIZE)
+    parser.add_argument('--pause', type=float, default=0.0, help="seconds to sleep between delete batches")
+    parser.add_argument('--compact-after', type=int, default=COMPACT_AFTER_DAYS,
+                        help="compact notifications older than this many days")
+    parser.add_argument('--compact-min', type=int, default=COMPACT_MIN_COUNT,
+                        help="smallest run of similar notifications worth a digest")
+    parser.add_argument('--no-compact', action='store_true', help="only delete expired notifications")
+    parser.add_argument('--dry-run', action='store_true', help="count, do not delete")
+    parser.add_argument('--interval', type=int, default=0, help="seconds between passes; 0 runs once")
+    args = parser.parse_args()
+
+    while True:
+        prune_notifications(batch_size=args.batch_size, pause=args.pause, compact_after=args.compact_after,
+                            compact_min=args.compact_min, skip_compaction=args.no_compact, dry_run=args.dry_run)
+        if not args.interval:
+            break
+        time.sleep(args.interval)
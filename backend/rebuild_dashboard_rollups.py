@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""
+Rebuild user_dashboard_rollups from the invoices table.
+
+Incremental maintenance keeps the rollups current; run this periodically
+(e.g. nightly cron) to reconcile any drift, and once after deploying the
+table so existing users do not pay for the first build on page load.
+
+    python rebuild_dashboard_rollups.py                  # every user with invoices or rollups
+    python rebuild_dashboard_rollups.py --user <uuid>    # one user
+"""
+import argparse
+import sys
+import os
+
+# Add the current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import select, union
+
+from db import db
+from models import Invoice, UserDashboardRollup
+from dashboard_rollups import rebuild_user_rollups
+
+# Import your app instance directly
+from app import app
+
+
+def rebuild_dashboard_rollups(user_id=None):
+    """Rebuild one user's rollups, or everyone's - one committed transaction per user"""
+
+    with app.app_context():
+        if user_id:
+            user_ids = [user_id]
+        else:
+            # Users who lost all their invoices still have rows to clear
+            user_ids = db.session.execute(union(
+                select(Invoice.user_id),
+                select(UserDashboardRollup.user_id)
+            )).scalars().all()
+
+        rebuilt = failed = 0
+        for uid in user_ids:
+            try:
+                rebuild_user_rollups(uid)
+                db.session.commit()
+                rebuilt += 1
+            except Exception as e:
+                db.session.rollback()
+                failed += 1
+                print(f"❌ Error rebuilding rollups for user {uid}: {str(e)}")
+
+            if rebuilt and rebuilt % 500 == 0:
+                print(f"   ... {rebuilt} users rebuilt")
+
+        print(f"✅ Rebuilt dashboard rollups for {rebuilt} users" + (f", {failed} failed" if failed else ""))
+        return rebuilt
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Rebuild per-user dashboard rollups")
+    parser.add_argument('--user', help="only rebuild this user id")
+    args = parser.parse_args()
+    rebuild_dashboard_rollups(user_id=args.user)
@@ -0,0 +1,416 @@
+# render_cache.py
+"""
+Content-addressed cache for rendered invoice PDFs.
+
+A cache key is a SHA-256 over the parsed template data, the template file
+fingerprint and the logo digest, so any change to what ends up on the page
+produces a new key and stale entries simply age out of the LRU.
+
+Backends:
+    MemoryBackend - per-process OrderedDict, bounded by total bytes
+    DiskBackend   - directory shared by all gunicorn workers, bounded by total bytes
+    RedisBackend  - any redis-py compatible client (FakeRedis for local/dev)
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:  # optional dependency, only needed for RENDER_CACHE_BACKEND=redis
+    redis = None
+
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024  # 64 MB
+
+
+class MemoryBackend:
+    """In-process LRU store bounded by the total size of the cached values"""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._items[key] = value
+            self._size += len(value)
+            while self._size > self.max_bytes and self._items:
+                _, evicted = self._items.popitem(last=False)
+                self._size -= len(evicted)
+
+    def delete(self, key):
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._size = 0
+
+    def size(self):
+        return self._size
+
+    def __len__(self):
+        return len(self._items)
+
+
+class DiskBackend:
+    """
+    Directory-backed LRU store. Recency is tracked through file mtimes so
+    several processes can share one directory safely.
+    """
+
+    SUFFIX = '.bin'
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self._size = self._scan_size()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}{self.SUFFIX}")
+
+    @staticmethod
+    def _file_size(path):
+        try:
+            return os.stat(path).st_size
+        except FileNotFoundError:
+            return 0
+
+    def _entries(self):
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.name.endswith(self.SUFFIX):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _scan_size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = f.read()
+            os.utime(path, None)  # bump recency
+            return value
+        except FileNotFoundError:
+            return None
+
+    def set(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        path = self._path(key)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(value)
+
+        with self._lock:
+            replaced = self._file_size(path)  # an overwrite only adds the difference
+            os.replace(tmp_path, path)  # atomic across workers
+            self._size += len(value) - replaced
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        entries = sorted(self._entries())  # oldest mtime first
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+                total -= size
+            except FileNotFoundError:
+                pass
+        self._size = total
+
+    def delete(self, key):
+        path = self._path(key)
+        with self._lock:
+            size = self._file_size(path)
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                return
+            self._size -= size
+
+    def clear(self):
+        for _, _, path in self._entries():
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+        self._size = 0
+
+    def size(self):
+        return self._size
+
+    def __len__(self):
+        return len(self._entries())
+
+
+class FakeRedis:
+    """
+    Minimal in-process stand-in for a redis-py client (get/set/delete/
+    flushdb/dbsize) used for local development. Like a server configured
+    with maxmemory-policy=allkeys-lru it evicts least recently used keys
+    once `maxmemory` bytes are exceeded.
+    """
+
+    def __init__(self, maxmemory=DEFAULT_MAX_BYTES):
+        self.maxmemory = maxmemory
+        self._data = OrderedDict()  # key -> (value, expires_at)
+        self._used = 0
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        with self._lock:
+            entry = self._data.get(name)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                self._drop(name)
+                return None
+            self._data.move_to_end(name)
+            return value
+
+    def set(self, name, value, ex=None):
+        if isinstance(value, str):
+            value = value.encode('utf-8')
+        with self._lock:
+            self._drop(name)
+            self._data[name] = (value, time.time() + ex if ex else None)
+            self._used += len(value)
+            while self.maxmemory and self._used > self.maxmemory and self._data:
+                oldest = next(iter(self._data))
+                self._drop(oldest)
+        return True
+
+    def delete(self, *names):
+        with self._lock:
+            removed = 0
+            for name in names:
+                if name in self._data:
+                    self._drop(name)
+                    removed += 1
+            return removed
+
+    def flushdb(self):
+        with self._lock:
+            self._data.clear()
+            self._used = 0
+        return True
+
+    def dbsize(self):
+        return len(self._data)
+
+    def _drop(self, name):
+        entry = self._data.pop(name, None)
+        if entry is not None:
+            self._used -= len(entry[0])
+
+
+class RedisBackend:
+    """
+    Store backed by a redis-py compatible client. Size bounding and LRU
+    eviction are delegated to the server (maxmemory + allkeys-lru); entries
+    also carry a TTL so a misconfigured server cannot grow without bound.
+    """
+
+    def __init__(self, client, prefix='envoyce:render:', ttl=7 * 24 * 3600):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def get(self, key):
+        return self.client.get(self.prefix + key)
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, value, ex=self.ttl)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def clear(self):
+        # Only safe for the fake / a dedicated database
+        self.client.flushdb()
+
+    def size(self):
+        return None
+
+    def __len__(self):
+        return self.client.dbsize()
+
+
+class RenderCache:
+    """Front for a cache backend that keeps hit/miss counters"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            logging.warning(f"Render cache read failed for {key}: {e}")
+            value = None
+
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def peek(self, key):
+        """Like get(), but not counted as a hit or miss (for status checks)"""
+        try:
+            return self.backend.get(key)
+        except Exception as e:
+            logging.warning(f"Render cache read failed for {key}: {e}")
+            return None
+
+    def set(self, key, value):
+        try:
+            self.backend.set(key, value)
+        except Exception as e:
+            logging.warning(f"Render cache write failed for {key}: {e}")
+
+    def get_or_render(self, key, render):
+        """Return (value, hit) - calls render() and stores the result on a miss"""
+        value = self.get(key)
+        if value is not None:
+            return value, True
+        value = render()
+        self.set(key, value)
+        return value, False
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'backend': type(self.backend).__name__,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'entries': len(self.backend),
+            'size_bytes': self.backend.size(),
+        }
+
+
+# ─── Key construction ────────────────────────────────────────────────────────
+
+_template_fingerprints = {}
+_fingerprint_lock = threading.Lock()
+
+
+def fingerprint_template(template_path):
+    """
+    SHA-256 of a template file, recomputed only when its mtime or size
+    changes so the hot path costs a single stat() call.
+    """
+    stat = os.stat(template_path)
+    marker = (stat.st_mtime_ns, stat.st_size)
+
+    with _fingerprint_lock:
+        cached = _template_fingerprints.get(template_path)
+        if cached and cached[0] == marker:
+            return cached[1]
+
+    with open(template_path, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+
+    with _fingerprint_lock:
+        _template_fingerprints[template_path] = (marker, digest)
+    return digest
+
+
+def canonical_json(value):
+    """Stable serialization: sorted keys, no whitespace, non-JSON types via str()"""
+    return json.dumps(value, sort_keys=True, separators=(',', ':'), default=str)
+
+
+def make_render_key(template_data, template_path, logo_digest=None):
+    """
+    Content address for a rendered invoice. `logo_url` is left out of the
+    data hash on purpose - it points at a local cache file - and the
+    logo's content digest is hashed instead.
+    """
+    data = {k: v for k, v in template_data.items() if k != 'logo_url'}
+
+    h = hashlib.sha256()
+    h.update(canonical_json(data).encode('utf-8'))
+    h.update(b'\0')
+    h.update(os.path.basename(template_path).encode('utf-8'))
+    h.update(fingerprint_template(template_path).encode('ascii'))
+    h.update(b'\0')
+    if logo_digest:
+        h.update(logo_digest.encode('ascii'))
+    elif template_data.get('logo_url'):
+        # Logo could not be fetched; the original URL is what gets rendered
+        h.update(str(template_data['logo_url']).encode('utf-8'))
+    return h.hexdigest()
+
+
+def create_render_cache_from_env():
+    """
+    Build the cache from environment settings:
+        RENDER_CACHE_BACKEND    memory (default) | disk | redis | fakeredis
+        RENDER_CACHE_MAX_BYTES  size bound for memory/disk/fakeredis
+        RENDER_CACHE_DIR        directory for the disk backend
+        REDIS_URL               server for the redis backend
+    """
+    kind = os.getenv('RENDER_CACHE_BACKEND', 'memory').lower()
+    max_bytes = int(os.getenv('RENDER_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES))
+
+    if kind == 'disk':
+        directory = os.getenv(
+            'RENDER_CACHE_DIR',
+            os.path.join(tempfile.gettempdir(), 'envoyce-render-cache')
+        )
+        backend = DiskBackend(directory, max_bytes=max_bytes)
+    elif kind == 'redis':
+        if redis is None:
+            raise RuntimeError("RENDER_CACHE_BACKEND=redis requires the 'redis' package")
+        backend = RedisBackend(redis.Redis.from_url(os.environ['REDIS_URL']))
+    elif kind == 'fakeredis':
+        backend = RedisBackend(FakeRedis(maxmemory=max_bytes))
+    else:
+        backend = MemoryBackend(max_bytes=max_bytes)
+
+    logging.info(f"Render cache using {type(backend).__name__}")
+    return RenderCache(backend)
@@ -0,0 +1,192 @@
+# render_pool.py
+"""
+Off-request PDF rendering.
+
+WeasyPrint layout is CPU-bound and would otherwise block a sync gunicorn
+worker for the whole render. Jobs are submitted to a ProcessPoolExecutor
+and tracked here by id; the synchronous endpoints just wait on the job
+with a timeout.
+
+Job ids are render cache keys, so a finished job is also served from the
+(possibly shared) render cache to any worker that did not submit it.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pdf_renderer
+
+DEFAULT_TIMEOUT = float(os.getenv('RENDER_TIMEOUT', 60))
+
+
+class RenderJob:
+    """A render submitted to the pool"""
+
+    def __init__(self, job_id, future, filename=None, cleanup=None):
+        self.id = job_id
+        self.future = future
+        self.filename = filename
+        self.cleanup = cleanup or []
+        self.created_at = time.time()
+
+    @property
+    def status(self):
+        if self.future.cancelled():
+            return 'cancelled'
+        if not self.future.done():
+            return 'running' if self.future.running() else 'queued'
+        return 'failed' if self.future.exception() else 'done'
+
+    def to_dict(self):
+        error = None
+        if self.future.done() and not self.future.cancelled() and self.future.exception():
+            error = str(self.future.exception())
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'filename': self.filename,
+            'created_at': self.created_at,
+            'error': error,
+        }
+
+
+class RenderPool:
+    """Process pool plus a bounded registry of submitted jobs"""
+
+    def __init__(self, render_cache=None, max_workers=None, max_jobs=500):
+        self.render_cache = render_cache
+        self.max_workers = max_workers or int(os.getenv('RENDER_POOL_WORKERS', os.cpu_count() or 1))
+        self.max_jobs = max_jobs
+        self._executor = None
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # Created lazily so the pool is spawned after gunicorn forks, not in the master
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=pdf_renderer.warm_up,
+            )
+        return self._executor
+
+    def _submit_locked(self, fn, *args):
+        # Caller holds self._lock
+        try:
+            return self._get_executor().submit(fn, *args)
+        except BrokenProcessPool:
+            logging.warning("Render pool broken, restarting it")
+            self._executor = None
+            return self._get_executor().submit(fn, *args)
+
+    def _submit(self, fn, *args):
+        with self._lock:
+            return self._submit_locked(fn, *args)
+
+    def submit(self, job_id, html, filename=None, cleanup=None, render=pdf_renderer.render_pdf):
+        """Queue a render; returns the existing job if the same id is already in flight"""
+        # Check, submit and register under one lock, so concurrent requests
+        # for the same id cannot both miss the registry and render twice
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job.status in ('queued', 'running', 'done'):
+                # Identical render already in flight; this request's temp files are unused
+                self._remove_files(cleanup or [])
+                return job
+
+            future = self._submit_locked(render, html)
+            job = RenderJob(job_id, future, filename=filename, cleanup=cleanup)
+            self._jobs[job_id] = job
+            self._jobs.move_to_end(job_id)
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+
+        # Outside the lock: the callback runs right here if the future is already done
+        future.add_done_callback(lambda f, job=job: self._on_done(job, f))
+        return job
+
+    @staticmethod
+    def _remove_files(paths):
+        for path in paths:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+    def _on_done(self, job, future):
+        self._remove_files(job.cleanup)
+
+        if future.cancelled() or future.exception():
+            if not future.cancelled():
+                logging.error(f"Render job {job.id} failed: {future.exception()}")
+            return
+        if self.render_cache is not None:
+            self.render_cache.set(job.id, future.result())
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def status(self, job_id):
+        """Job status dict, falling back to the render cache for jobs from other workers"""
+        job = self.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        if self.render_cache is not None and self.render_cache.peek(job_id) is not None:
+            return {'job_id': job_id, 'status': 'done', 'filename': None, 'created_at': None, 'error': None}
+        return None
+
+    def result(self, job_id):
+        """Rendered bytes for a finished job, or None if not (yet) available"""
+        job = self.get(job_id)
+        if job is not None and job.status == 'done':
+            return job.future.result()
+        if self.render_cache is not None:
+            return self.render_cache.get(job_id)
+        return None
+
+    def render(self, job_id, html, timeout=DEFAULT_TIMEOUT, cleanup=None, render=pdf_renderer.render_pdf):
+        """
+        Submit and wait. Raises concurrent.futures.TimeoutError if the render
+        does not finish in time; the job keeps running and can be polled.
+        """
+        job = self.submit(job_id, html, cleanup=cleanup, render=render)
+        return job.future.result(timeout=timeout)
+
+    def warm_up(self):
+        """Start the worker processes now instead of on the first render"""
+        for _ in range(self.max_workers):
+            self._submit(pdf_renderer.warm_up)
+
+    def execute(self, fn, *args):
+        """Run fn(*args) in a pool worker without registering a job; returns the future"""
+        return self._submit(fn, *args)
+
+    def call(self, fn, *args, timeout=5):
+        """Run a small function in one pool worker (e.g. to read its stats)"""
+        return self.execute(fn, *args).result(timeout=timeout)
+
+    def cancel(self, job_id):
+        """
+        Cancel a job that has not started yet. Running renders cannot be
+        interrupted in a process pool; their result still lands in the cache.
+        """
+        job = self.get(job_id)
+        if job is None or not job.future.cancel():
+            return False
+        with self._lock:
+            self._jobs.pop(job_id, None)
+        return True
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
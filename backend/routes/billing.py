@@ -1,7 +1,8 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from db import db
-from models import User, UserSubscription, SubscriptionPlan, BillingTransaction
+from models import UserSubscription, SubscriptionPlan, BillingTransaction
+from user_loader import load_user
 from datetime import datetime, timedelta
 import uuid
 import logging
@@ -68,7 +69,7 @@ def get_current_subscription():
         if current_user_id != user_id:
             return jsonify({'error': 'Unauthorized access'}), 403
         
-        user = User.query.get(user_id)
+        user = load_user(user_id)
         subscription = UserSubscription.query.filter_by(user_id=user_id, status='active').first()
         
         subscription_data = {
@@ -1,164 +1,142 @@
 # routes/dashboard.py
 from flask import Blueprint, request, jsonify
 from datetime import datetime
+from sqlalchemy import func, case, and_
+from db import db
+from invoice_totals import invoice_total
+from user_loader import load_user
+from dashboard_rollups import UNPAID_STATUSES, normalize_currency, invoice_currency_expr, user_groups
 
 dashboard_bp = Blueprint('dashboard', __name__)
 
 
-def normalize_currency(currency):
-    """Normalize currency codes"""
-    if not currency:
-        return 'USD'
+FEED_MAX_PER_PAGE = 100
 
-    currency = str(currency).upper().strip()
 
-    # Common currency symbols to codes
-    currency_map = {
-        '$': 'USD', 'US$': 'USD', 'USD$': 'USD',
-        '€': 'EUR', 'EURO': 'EUR',
-        '£': 'GBP', 'GB£': 'GBP',
-        '¥': 'JPY', 'JP¥': 'JPY',
-        '₦': 'NGN', 'NG₦': 'NGN',
-        'CAD$': 'CAD', 'CA$': 'CAD',
-        'AUD$': 'AUD', 'AU$': 'AUD'
+def _empty_currency_metrics():
+    return {
+        'total_revenue': 0,
+        'total_outstanding': 0,
+        'total_invoices': 0,
+        'paid_invoices': 0,
+        'unpaid_invoices': 0,
+        'draft_invoices': 0,
+        'overdue_invoices': 0
     }
 
-    return currency_map.get(currency, currency)
 
+def _add_to_metrics(metrics, currency, status, count, cents):
+    """Fold one (currency, status) group into the per-currency metrics; amounts in cents"""
+    entry = metrics.setdefault(normalize_currency(currency), _empty_currency_metrics())
+    entry['total_invoices'] += count
 
-def calculate_invoice_total(invoice_data):
-    """Calculate total amount from invoice data"""
-    if not isinstance(invoice_data, dict):
-        return 0.0
+    if status == 'paid':
+        entry['total_revenue'] += cents
+        entry['paid_invoices'] += count
+    elif status in UNPAID_STATUSES:
+        entry['total_outstanding'] += cents
+        entry['unpaid_invoices'] += count
+    elif status == 'draft':
+        entry['draft_invoices'] += count
 
-    try:
-        # First try to get the total directly
-        total = invoice_data.get('total')
-        if total is not None:
-            try:
-                total_float = float(total)
-                if total_float > 0:
-                    return total_float
-            except (ValueError, TypeError):
-                pass
-
-        # Calculate from items if total is not available or invalid
-        items = invoice_data.get('items', [])
-        if not isinstance(items, list):
-            return 0.0
-
-        subtotal = 0.0
-        for item in items:
-            if not isinstance(item, dict):
-                continue
-
-            try:
-                quantity = float(item.get('quantity', 0)) or 0
-                unit_cost = float(item.get('unit_cost', 0)) or 0
-                subtotal += quantity * unit_cost
-            except (ValueError, TypeError):
-                continue
-
-        # Apply tax if enabled
-        if invoice_data.get('show_tax', False):
-            try:
-                tax_percent = float(invoice_data.get('tax_percent', 0)) or 0
-                tax_type = invoice_data.get('tax_type', 'percent')
-                if tax_type == 'percent':
-                    tax_amount = subtotal * (tax_percent / 100)
-                else:
-                    tax_amount = tax_percent
-                subtotal += tax_amount
-            except (ValueError, TypeError):
-                pass
-
-        # Apply discount if enabled
-        if invoice_data.get('show_discount', False):
-            try:
-                discount_percent = float(invoice_data.get('discount_percent', 0)) or 0
-                discount_type = invoice_data.get('discount_type', 'percent')
-                if discount_type == 'percent':
-                    discount_amount = subtotal * (discount_percent / 100)
-                else:
-                    discount_amount = discount_percent
-                subtotal -= discount_amount
-            except (ValueError, TypeError):
-                pass
-
-        # Apply shipping if enabled
-        if invoice_data.get('show_shipping', False):
-            try:
-                shipping_amount = float(invoice_data.get('shipping_amount', 0)) or 0
-                subtotal += shipping_amount
-            except (ValueError, TypeError):
-                pass
-
-        return max(0.0, round(subtotal, 2))
-
-    except (ValueError, TypeError) as e:
-        print(f"Error calculating invoice total: {e}")
-        return 0.0
-
-
-def calculate_currency_metrics(invoices):
+    if status == 'overdue':
+        entry['overdue_invoices'] += count
+
+
+def summarize_invoices(user_id):
     """
-    Calculate metrics grouped by currency
-    Returns a dictionary with currency-specific metrics
+    Per-currency metrics and overall status counts for a user, from the
+    rollup rows (one per currency and status) or, for users without
+    rollups yet, one GROUP BY (currency, status) query.
     """
-    currency_data = {}
-
-    for invoice in invoices:
-        # Get invoice data
-        if hasattr(invoice, 'data'):
-            invoice_data = invoice.data
-        else:
-            invoice_data = invoice.get('data', {})
-
-        # Get currency and amount
-        currency = normalize_currency(invoice_data.get('currency', 'USD') if isinstance(invoice_data, dict) else 'USD')
-        amount = calculate_invoice_total(invoice_data)
-
-        # Initialize currency data if not exists
-        if currency not in currency_data:
-            currency_data[currency] = {
-                'total_revenue': 0.0,
-                'total_outstanding': 0.0,
-                'total_invoices': 0,
-                'paid_invoices': 0,
-                'unpaid_invoices': 0,
-                'draft_invoices': 0,
-                'overdue_invoices': 0
-            }
+    metrics = {}
+    for (currency, status), (count, cents) in user_groups(user_id).items():
+        _add_to_metrics(metrics, currency, status, count, cents)
 
-        # Update metrics based on status
-        currency_data[currency]['total_invoices'] += 1
+    # Cents back to currency units
+    for entry in metrics.values():
+        entry['total_revenue'] = round(entry['total_revenue'] / 100, 2)
+        entry['total_outstanding'] = round(entry['total_outstanding'] / 100, 2)
 
-        status = invoice.status if hasattr(invoice, 'status') else invoice.get('status', '')
+    return metrics
 
-        if status == 'paid':
-            currency_data[currency]['total_revenue'] += amount
-            currency_data[currency]['paid_invoices'] += 1
-        elif status in ['sent', 'in progress', 'overdue']:
-            currency_data[currency]['total_outstanding'] += amount
-            currency_data[currency]['unpaid_invoices'] += 1
-        elif status == 'draft':
-            currency_data[currency]['draft_invoices'] += 1
 
-        if status == 'overdue':
-            currency_data[currency]['overdue_invoices'] += 1
+def count_unique_clients(user_id):
+    """Distinct linked clients plus distinct free-text recipients, in one query"""
+    from models import Invoice
 
-    # Round all currency totals
-    for currency in currency_data:
-        currency_data[currency]['total_revenue'] = round(currency_data[currency]['total_revenue'], 2)
-        currency_data[currency]['total_outstanding'] = round(currency_data[currency]['total_outstanding'], 2)
+    recipient = Invoice.data['to'].as_string()
+    unlinked_recipient = case(
+        (and_(Invoice.client_id.is_(None), func.trim(recipient) != '', recipient != 'None'), recipient),
+        else_=None
+    )
+    linked, unlinked = db.session.query(
+        func.count(func.distinct(Invoice.client_id)),
+        func.count(func.distinct(unlinked_recipient))
+    ).filter(Invoice.user_id == user_id).one()
+    return (linked or 0) + (unlinked or 0)
 
-    return currency_data
+
+def invoice_feed(user_id, page=1, per_page=20, status=None):
+    """
+    One page of a user's invoices, newest first, with only the fields the
+    dashboard lists - the `data` blob is not loaded. Returns (rows, has_next).
+    """
+    from models import Invoice
+
+    query = db.session.query(
+        Invoice.id,
+        Invoice.client_id,
+        Invoice.status,
+        Invoice.issued_date,
+        Invoice.due_date,
+        Invoice.created_at,
+        func.coalesce(Invoice.invoice_number, Invoice.data['invoice_number'].as_string()).label('invoice_number'),
+        Invoice.data['to'].as_string().label('recipient'),
+        Invoice.total,
+        invoice_currency_expr().label('currency')
+    ).filter(Invoice.user_id == user_id)
+
+    if status:
+        query = query.filter(Invoice.status == status)
+
+    # One extra row tells us whether there is a next page without a COUNT(*)
+    rows = query.order_by(Invoice.created_at.desc(), Invoice.id.desc()) \
+        .offset((page - 1) * per_page).limit(per_page + 1).all()
+    has_next = len(rows) > per_page
+    rows = rows[:per_page]
+
+    # Totals not backfilled yet: compute just those rows from their data
+    missing = [row.id for row in rows if row.total is None]
+    computed = {}
+    if missing:
+        for invoice_id, data in db.session.query(Invoice.id, Invoice.data).filter(Invoice.id.in_(missing)):
+            computed[invoice_id] = float(invoice_total(data))
+
+    feed = []
+    for row in rows:
+        recipient = row.recipient or ''
+        feed.append({
+            'id': str(row.id),
+            'client_id': str(row.client_id) if row.client_id else None,
+            'invoice_number': row.invoice_number,
+            'client_name': recipient.split('\n')[0] if recipient else None,
+            'status': row.status,
+            'issued_date': row.issued_date.isoformat() if row.issued_date else None,
+            'due_date': row.due_date.isoformat() if row.due_date else None,
+            'created_at': row.created_at.isoformat() if row.created_at else None,
+            'total_amount': float(row.total) if row.total is not None else computed.get(row.id, 0.0),
+            'currency': normalize_currency(row.currency)
+        })
+    return feed, has_next
 
 
 @dashboard_bp.route('/api/dashboard/summary', methods=['GET'])
 def get_dashboard_summary():
     """
-    Combined endpoint for all dashboard metrics
+    Combined endpoint for all dashboard metrics.
+    Aggregates run in SQL; the invoice list itself is paginated separately
+    via /api/dashboard/invoices, only the latest few are included here.
     """
     try:
         user_id = request.args.get('user_id')
@@ -166,77 +144,62 @@ def get_dashboard_summary():
         if not user_id:
             return jsonify({'success': False, 'error': 'User ID is required'}), 400
 
-        # Import here to avoid circular imports
-        from models import Invoice, User
-
         # Check if user exists
-        user = User.query.filter_by(id=user_id).first()
-        if not user:
+        if not load_user(user_id):
             return jsonify({'success': False, 'error': 'User not found'}), 404
 
-        # Get all invoices for the user
-        invoices = Invoice.query.filter_by(user_id=user_id).all()
-
-        # Calculate overall metrics
-        paid_invoices = [inv for inv in invoices if inv.status == 'paid']
-        unpaid_invoices = [inv for inv in invoices if inv.status in ['sent', 'in progress', 'overdue']]
-        draft_invoices = [inv for inv in invoices if inv.status == 'draft']
-        overdue_invoices = [inv for inv in invoices if inv.status == 'overdue']
-
-        # Calculate currency-specific metrics
-        currency_metrics = calculate_currency_metrics(invoices)
-
-        # Get unique clients
-        unique_clients = set()
-        for invoice in invoices:
-            if invoice.client_id:
-                unique_clients.add(str(invoice.client_id))
-            elif isinstance(invoice.data, dict):
-                client_name = invoice.data.get('to', '')
-                if client_name and client_name != 'None' and client_name.strip():
-                    unique_clients.add(client_name)
-
-        # Prepare invoice data for frontend
-        invoices_data = []
-        for inv in invoices:
-            try:
-                # Calculate total for each invoice
-                invoice_total = calculate_invoice_total(inv.data) if inv.data else 0.0
-
-                # Get currency from invoice data
-                invoice_currency = 'USD'
-                if isinstance(inv.data, dict):
-                    invoice_currency = normalize_currency(inv.data.get('currency', 'USD'))
-
-                invoice_data = {
-                    'id': str(inv.id),
-                    'user_id': str(inv.user_id),
-                    'client_id': str(inv.client_id) if inv.client_id else None,
-                    'data': inv.data,
-                    'status': inv.status,
-                    'issued_date': inv.issued_date.isoformat() if inv.issued_date else None,
-                    'due_date': inv.due_date.isoformat() if inv.due_date else None,
-                    'created_at': inv.created_at.isoformat() if inv.created_at else None,
-                    'total_amount': invoice_total,
-                    'currency': invoice_currency
-                }
-                invoices_data.append(invoice_data)
-            except Exception as e:
-                print(f"Error processing invoice {inv.id}: {e}")
-                continue
+        currency_metrics = summarize_invoices(user_id)
+
+        def total_of(key):
+            return sum(entry[key] for entry in currency_metrics.values())
+
+        recent_invoices, _ = invoice_feed(user_id, page=1, per_page=5)
 
         return jsonify({
             'success': True,
-            'total_invoices': len(invoices),
-            'paid_invoices': len(paid_invoices),
-            'unpaid_invoices': len(unpaid_invoices),
-            'draft_invoices': len(draft_invoices),
-            'overdue_invoices': len(overdue_invoices),
-            'unique_clients': len(unique_clients),
+            'total_invoices': total_of('total_invoices'),
+            'paid_invoices': total_of('paid_invoices'),
+            'unpaid_invoices': total_of('unpaid_invoices'),
+            'draft_invoices': total_of('draft_invoices'),
+            'overdue_invoices': total_of('overdue_invoices'),
+            'unique_clients': count_unique_clients(user_id),
             'currency_metrics': currency_metrics,
-            'invoices': invoices_data
+            'recent_invoices': recent_invoices
         })
 
     except Exception as e:
         print(f"Error in dashboard summary: {e}")
-        return jsonify({'success': False, 'error': str(e)}), 500
\ No newline at end of file
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@dashboard_bp.route('/api/dashboard/invoices', methods=['GET'])
+def get_dashboard_invoices():
+    """
+    GET /api/dashboard/invoices?user_id=<uuid>&page=<int>&per_page=<int>&status=<status>
+    Lightweight, paginated invoice list for the dashboard
+    """
+    try:
+        user_id = request.args.get('user_id')
+        page = max(request.args.get('page', 1, type=int), 1)
+        per_page = min(max(request.args.get('per_page', 20, type=int), 1), FEED_MAX_PER_PAGE)
+        status = request.args.get('status')
+
+        if not user_id:
+            return jsonify({'success': False, 'error': 'User ID is required'}), 400
+
+        invoices, has_next = invoice_feed(user_id, page=page, per_page=per_page, status=status)
+
+        return jsonify({
+            'success': True,
+            'invoices': invoices,
+            'pagination': {
+                'page': page,
+                'per_page': per_page,
+                'has_prev': page > 1,
+                'has_next': has_next
+            }
+        })
+
+    except Exception as e:
+        print(f"Error in dashboard invoices: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
@@ -0,0 +1,55 @@
+# routes/emails.py
+import logging
+import uuid
+
+from flask import Blueprint, jsonify, request
+
+from models import EmailOutbox
+from email_outbox import format_outbox_response, invoice_email_status
+
+emails_bp = Blueprint('emails', __name__)
+
+
+def _owner_id():
+    """(user_id, None) from the required ?user_id=, or (None, error response)"""
+    user_id = request.args.get('user_id')
+    if not user_id:
+        return None, (jsonify({'success': False, 'error': 'user_id is required'}), 400)
+    try:
+        return uuid.UUID(user_id), None
+    except ValueError:
+        return None, (jsonify({'success': False, 'error': 'Invalid user ID format'}), 400)
+
+
+@emails_bp.route('/api/emails/<uuid:message_id>', methods=['GET'])
+def get_email_status(message_id):
+    """GET /api/emails/<uuid>?user_id=<uuid> - delivery status of one of the user's queued emails"""
+    user_id, error = _owner_id()
+    if error:
+        return error
+    message = EmailOutbox.query.filter_by(id=message_id, user_id=user_id).first()
+    if message is None:
+        return jsonify({'success': False, 'error': 'Email not found'}), 404
+    return jsonify({'success': True, 'email': format_outbox_response(message)})
+
+
+@emails_bp.route('/api/invoices/<uuid:invoice_id>/emails', methods=['GET'])
+def get_invoice_email_status(invoice_id):
+    """
+    GET /api/invoices/<uuid>/emails?user_id=<uuid>
+    The user's sends of the invoice, newest first; `status` is the latest one's
+    """
+    user_id, error = _owner_id()
+    if error:
+        return error
+    try:
+        emails = [format_outbox_response(message) for message in invoice_email_status(invoice_id, user_id)]
+        return jsonify({
+            'success': True,
+            'invoice_id': str(invoice_id),
+            'status': emails[0]['status'] if emails else None,
+            'emails': emails
+        })
+    except Exception as e:
+        logging.error(f"Error fetching invoice email status: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
@@ -0,0 +1,43 @@
+# routes/events.py
+import uuid
+
+from flask import Blueprint, Response, request, jsonify
+
+import event_stream
+
+events_bp = Blueprint('events', __name__)
+
+
+@events_bp.route('/api/events/stream', methods=['GET'])
+def stream_events():
+    """
+    GET /api/events/stream?user_id=<uuid>
+    Server-sent events for the user: notification, invoice.status, resync
+    """
+    user_id = request.args.get('user_id')
+    if not user_id:
+        return jsonify({'success': False, 'error': 'User ID is required'}), 400
+    try:
+        user_id = uuid.UUID(user_id)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid user ID format'}), 400
+
+    if not event_stream.acquire_stream_slot():
+        response = jsonify({'success': False, 'error': 'Too many open event streams, retry shortly'})
+        response.headers['Retry-After'] = str(int(event_stream.EVENTS_HEARTBEAT))
+        return response, 503
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+
+    event_stream.ensure_listening()
+    response = Response(
+        event_stream.stream(user_id, last_event_id),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',  # keep proxies from buffering the stream
+        }
+    )
+    # Runs when the client goes away, whether or not the stream ever started
+    response.call_on_close(event_stream.release_stream_slot)
+    return response
@@ -8,7 +8,10 @@ from functools import wraps
 from sqlalchemy.orm.attributes import flag_modified
 from db import db
 from datetime import datetime, timedelta
-from models import User, Invoice, Business, SubscriptionPlan, UserSubscription, BillingTransaction
+from models import Invoice, Business, SubscriptionPlan, UserSubscription, BillingTransaction
+from user_loader import load_user
+from decimal import ROUND_HALF_UP
+from invoice_totals import invoice_total
 
 
 paystack_bp = Blueprint('paystack', __name__)
@@ -169,7 +172,7 @@ def _send_payment_notification(
 
 
 def _notify_from_invoice(invoice, tx_amount_smallest: int, payer_email: str, currency: str = 'NGN'):
-    from models import User, Business
+    from models import Business
 
     inv_data       = invoice.data or {}
     currency_sym   = inv_data.get('currency_symbol', '₦')
@@ -190,7 +193,7 @@ def _notify_from_invoice(invoice, tx_amount_smallest: int, payer_email: str, cur
             to_name  = biz.name or business_name
 
     if not to_email:
-        owner = db.session.query(User).filter_by(id=invoice.user_id).first()
+        owner = load_user(invoice.user_id)
         if owner and owner.email:
             to_email = owner.email
             to_name  = (
@@ -261,7 +264,7 @@ def get_banks():
 
 @paystack_bp.route('/api/paystack/create-subaccount', methods=['POST'])
 def create_subaccount():
-    from models import User, Business
+    from models import Business
     data = request.get_json()
 
     user_id        = data.get('user_id')
@@ -274,7 +277,7 @@ def create_subaccount():
     if not all([user_id, business_name, account_number, bank_code]):
         return jsonify({'success': False, 'error': 'Missing required fields'}), 400
 
-    user = User.query.filter_by(id=user_id).first()
+    user = load_user(user_id)
     if not user:
         return jsonify({'success': False, 'error': 'User not found'}), 404
 
@@ -350,12 +353,12 @@ def create_subaccount():
 
 @paystack_bp.route('/api/paystack/subaccount-status', methods=['GET'])
 def subaccount_status():
-    from models import User, Business
+    from models import Business
     user_id = request.args.get('user_id')
     if not user_id:
         return jsonify({'success': False, 'error': 'user_id required'}), 400
 
-    user = User.query.filter_by(id=user_id).first()
+    user = load_user(user_id)
     if not user:
         return jsonify({'success': False, 'error': 'User not found'}), 404
 
@@ -490,7 +493,7 @@ def subaccount_status():
 
 @paystack_bp.route('/api/paystack/initialize', methods=['POST']) 
 def initialize_payment():
-    from models import Invoice, User
+    from models import Invoice
     data = request.get_json()
 
     invoice_id  = data.get('invoice_id')
@@ -505,7 +508,7 @@ def initialize_payment():
     if invoice.status == 'paid':
         return jsonify({'success': False, 'error': 'Invoice already paid'}), 400
 
-    owner = User.query.filter_by(id=invoice.user_id).first()
+    owner = load_user(invoice.user_id)
     if not owner:
         return jsonify({'success': False, 'error': 'Invoice owner not found'}), 404
 
@@ -517,32 +520,17 @@ def initialize_payment():
     )
 
     invoice_data = invoice.data or {}
-    items        = invoice_data.get('items', [])
-    subtotal     = sum(i.get('quantity', 0) * i.get('unit_cost', 0) for i in items)
-
-    discount = 0
-    if invoice_data.get('show_discount') and invoice_data.get('discount_percent'):
-        if invoice_data.get('discount_type') == 'percent':
-            discount = (subtotal * invoice_data['discount_percent']) / 100
-        else:
-            discount = invoice_data['discount_percent']
-
-    tax = 0
-    if invoice_data.get('show_tax') and invoice_data.get('tax_percent'):
-        base = subtotal - discount
-        if invoice_data.get('tax_type') == 'percent':
-            tax = (base * invoice_data['tax_percent']) / 100
-        else:
-            tax = invoice_data['tax_percent']
-
-    shipping    = invoice_data.get('shipping_amount', 0) if invoice_data.get('show_shipping') else 0
-    total_amount = max(0, subtotal - discount + tax + shipping)
+    # Charge exactly what the invoice PDF shows
+    total_amount = invoice_total(invoice_data)
 
     # Determine currency (prefer invoice.currency column, fallback to invoice.data)
     currency_code = (invoice.currency or invoice_data.get('currency') or 'NGN').upper()
     # Paystack expects amount in smallest unit (kobo/cents); JPY has no subunit
     divisor = 1 if currency_code == 'JPY' else 100
-    amount_smallest = int(round(total_amount * divisor))
+    amount_smallest = int((total_amount * divisor).to_integral_value(rounding=ROUND_HALF_UP))
+    if amount_smallest <= 0:
+        # Totals are not clamped, so a large discount can leave nothing (or less) to charge
+        return jsonify({'success': False, 'error': 'Invoice total must be greater than zero'}), 400
 
     invoice_number = invoice_data.get('invoice_number', str(invoice_id)[:8])
     business_name  = invoice_data.get('from', '').split('\n')[0] or 'Business'
@@ -581,7 +569,7 @@ def initialize_payment():
         'authorization_url': result['data']['authorization_url'],
         'reference':         result['data']['reference'],
         'access_code':       result['data']['access_code'],
-        'amount':            total_amount,
+        'amount':            float(total_amount),
         'currency':          currency_code,
         'has_split':         bool(subaccount_code),
     })
@@ -641,6 +629,7 @@ def verify_payment(reference):
         inv_data['payer_email']        = payer_email
         invoice.data = inv_data
         flag_modified(invoice, 'data')
+        invoice.refresh_totals()
         db.session.commit()
         current_app.logger.info(f"[verify] Committed status=paid for invoice {invoice_id}")
     else:
@@ -685,7 +674,7 @@ def webhook():
         # Check if this is a subscription payment
         if metadata.get('type') == 'subscription':
             user_id = metadata.get('user_id')
-            user = User.query.get(user_id)
+            user = load_user(user_id)
             
             if user and user.plan != 'pro':
                 # Activate pro plan if not already active
@@ -759,6 +748,7 @@ def webhook():
                             inv_data['payer_email'] = payer_email
                             invoice.data = inv_data
                             flag_modified(invoice, 'data')
+                            invoice.refresh_totals()
                             db.session.commit()
                             current_app.logger.info(f"[webhook] Marked invoice {invoice_id} as paid (webhook)")
                         else:
@@ -801,7 +791,7 @@ def webhook():
                         # Fallback to invoice owner user data
                         owner = None
                         if not account_number or not bank_code:
-                            owner = User.query.filter_by(id=invoice.user_id).first()
+                            owner = load_user(invoice.user_id)
                             if owner:
                                 owner_data = owner.data or {}
                                 account_number = account_number or owner_data.get('paystack_account_number')
@@ -962,7 +952,7 @@ def webhook():
 
 @paystack_bp.route('/api/paystack/remove-subaccount', methods=['POST'])
 def remove_subaccount():
-    from models import User, Business
+    from models import Business
     data            = request.get_json()
     user_id         = data.get('user_id')
     subaccount_code = data.get('subaccount_code')
@@ -970,7 +960,7 @@ def remove_subaccount():
     if not user_id or not subaccount_code:
         return jsonify({'success': False, 'error': 'user_id and subaccount_code required'}), 400
 
-    user = User.query.filter_by(id=user_id).first()
+    user = load_user(user_id)
     if not user:
         return jsonify({'success': False, 'error': 'User not found'}), 404
 
@@ -1025,9 +1015,8 @@ def remove_subaccount():
 
 @paystack_bp.route('/api/paystack/debug-user', methods=['GET'])
 def debug_user():
-    from models import User
     user_id = request.args.get('user_id')
-    user    = User.query.filter_by(id=user_id).first()
+    user    = load_user(user_id)
     if not user:
         return jsonify({'error': 'User not found'}), 404
     return jsonify({
@@ -1049,7 +1038,7 @@ def initialize_subscription():
         if str(current_user_id) != str(user_id):
             return jsonify({'error': 'Unauthorized'}), 403
         
-        user = User.query.get(user_id)
+        user = load_user(user_id)
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
@@ -1137,7 +1126,7 @@ def verify_subscription(reference):
             return jsonify({'error': 'Invalid transaction type'}), 400
         
         user_id = metadata.get('user_id')
-        user = User.query.get(user_id)
+        user = load_user(user_id)
         
         if not user:
             return jsonify({'error': 'User not found'}), 404
@@ -1209,7 +1198,7 @@ def cancel_subscription():
         if str(current_user_id) != str(user_id):
             return jsonify({'error': 'Unauthorized'}), 403
         
-        user = User.query.get(user_id)
+        user = load_user(user_id)
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
@@ -1249,7 +1238,7 @@ def get_subscription_status():
         if str(current_user_id) != str(user_id):
             return jsonify({'error': 'Unauthorized'}), 403
         
-        user = User.query.get(user_id)
+        user = load_user(user_id)
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
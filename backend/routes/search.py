@@ -0,0 +1,51 @@
+# routes/search.py
+import uuid
+
+from flask import Blueprint, request, jsonify
+
+from search import SEARCH_TYPES, MAX_PER_PAGE, search
+
+search_bp = Blueprint('search', __name__)
+
+
+@search_bp.route('/api/search', methods=['GET'])
+def search_records():
+    """
+    GET /api/search?user_id=<uuid>&q=<text>&type=<all|clients|invoices>&page=<int>&per_page=<int>
+    Ranked search over the user's clients and invoices
+    """
+    try:
+        user_id = request.args.get('user_id')
+        term = (request.args.get('q') or '').strip()
+        search_type = request.args.get('type', 'all')
+        page = max(request.args.get('page', 1, type=int), 1)
+        per_page = min(max(request.args.get('per_page', 20, type=int), 1), MAX_PER_PAGE)
+
+        if not user_id:
+            return jsonify({'success': False, 'error': 'User ID is required'}), 400
+        try:
+            user_id = uuid.UUID(user_id)
+        except ValueError:
+            return jsonify({'success': False, 'error': 'Invalid user ID format'}), 400
+        if not term:
+            return jsonify({'success': False, 'error': 'Search query (q) is required'}), 400
+        if search_type not in SEARCH_TYPES:
+            return jsonify({'success': False, 'error': f"type must be one of: {', '.join(SEARCH_TYPES)}"}), 400
+
+        results, has_next = search(user_id, term, search_type=search_type, page=page, per_page=per_page)
+
+        return jsonify({
+            'success': True,
+            'query': term,
+            'results': results,
+            'pagination': {
+                'page': page,
+                'per_page': per_page,
+                'has_prev': page > 1,
+                'has_next': has_next
+            }
+        })
+
+    except Exception as e:
+        print(f"Error in search: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
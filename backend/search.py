@@ -0,0 +1,194 @@
+# search.py
+"""
+Search over a user's clients and invoices.
+
+On PostgreSQL every searchable row has one text "document":
+    clients   name, email, phone
+    invoices  invoice number, then search_text (recipient and line item
+              names/descriptions, denormalized by Invoice.refresh_totals())
+Each document has two GIN indexes (see models.py): to_tsvector('simple', ...)
+for whole-word matches, ranked by ts_rank, and gin_trgm_ops for substring
+(ILIKE) and typo-tolerant (word_similarity) matches. A row matches on any of
+the three and is ranked by ts_rank + word_similarity.
+
+Other databases (SQLite test runs) get the same results shape from an
+in-process scan of the user's rows.
+
+    GET /api/search?user_id=...&q=acme&type=all|clients|invoices&page=1&per_page=20
+"""
+from datetime import datetime
+
+from sqlalchemy import func, or_, select, literal, literal_column, null, union_all
+from sqlalchemy.sql.elements import Grouping
+
+from db import db
+from models import Client, Invoice
+
+SEARCH_TYPES = ('all', 'clients', 'invoices')
+MAX_PER_PAGE = 50
+
+# Must match the index definitions in models.py for the planner to use them
+SIMPLE = literal_column("'simple'::regconfig")
+
+
+def search_text(data):
+    """Recipient and line item names/descriptions of an invoice's data, for searching"""
+    if not isinstance(data, dict):
+        return None
+    parts = [data.get('to')]
+    items = data.get('items')
+    if isinstance(items, list):
+        for item in items:
+            if isinstance(item, dict):
+                parts.extend((item.get('name'), item.get('description')))
+    text = ' '.join(str(part).strip() for part in parts if part and str(part).strip())
+    return text or None
+
+
+def client_document():
+    return (func.coalesce(Client.name, '') + ' ' + func.coalesce(Client.email, '') + ' '
+            + func.coalesce(Client.phone, ''))
+
+
+def invoice_document():
+    return func.coalesce(Invoice.invoice_number, '') + ' ' + func.coalesce(Invoice.search_text, '')
+
+
+def contains_pattern(term):
+    """ILIKE pattern matching `term` anywhere, with LIKE wildcards escaped"""
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escaped}%"
+
+
+def _recipient(value):
+    return value.split('\n')[0] if value else None
+
+
+# ─── PostgreSQL ─────────────────────────────────────────────────────────────
+
+def _ranked(kind, model, document, title, subtitle, status, user_id, term):
+    query = func.websearch_to_tsquery(SIMPLE, term)
+    vector = func.to_tsvector(SIMPLE, document)
+    score = func.ts_rank(vector, query) + func.word_similarity(term, document)
+    return select(
+        literal(kind).label('type'),
+        model.id.label('id'),
+        title.label('title'),
+        subtitle.label('subtitle'),
+        status.label('status'),
+        model.created_at.label('created_at'),
+        score.label('score')
+    ).where(
+        model.user_id == user_id,
+        or_(
+            vector.op('@@')(query),
+            # `<%` binds as loosely as `||`, so the document needs its own parentheses
+            literal(term).op('<%')(Grouping(document)),
+            document.ilike(contains_pattern(term), escape='\\')
+        )
+    )
+
+
+def _search_postgres(user_id, term, search_type, page, per_page):
+    selects = []
+    if search_type in ('all', 'clients'):
+        selects.append(_ranked('client', Client, client_document(), Client.name, Client.email,
+                               null(), user_id, term))
+    if search_type in ('all', 'invoices'):
+        selects.append(_ranked('invoice', Invoice, invoice_document(), Invoice.invoice_number,
+                               Invoice.data['to'].as_string(), Invoice.status, user_id, term))
+
+    results = (union_all(*selects) if len(selects) > 1 else selects[0]).subquery()
+    rows = db.session.execute(
+        select(results)
+        .order_by(results.c.score.desc(), results.c.created_at.desc(), results.c.id)
+        .offset((page - 1) * per_page)
+        .limit(per_page + 1)
+    ).all()
+    return [
+        {
+            'type': row.type,
+            'id': row.id,
+            'title': row.title,
+            'subtitle': _recipient(row.subtitle) if row.type == 'invoice' else row.subtitle,
+            'status': row.status,
+            'created_at': row.created_at,
+            'score': float(row.score or 0),
+        }
+        for row in rows
+    ]
+
+
+# ─── In-process fallback ────────────────────────────────────────────────────
+
+def _score(document, term, words):
+    """Share of query words found in the document, whole words counting double"""
+    document = document.lower()
+    if term in document:
+        return 2.0
+    tokens = set(document.split())
+    score = 0.0
+    for word in words:
+        if word in tokens:
+            score += 2
+        elif word in document:
+            score += 1
+        else:
+            return 0.0
+    return score / len(words)
+
+
+def _search_in_process(user_id, term, search_type, page, per_page):
+    term = term.lower()
+    words = term.split()
+    candidates = []
+    if search_type in ('all', 'clients'):
+        for row in db.session.query(Client.id, Client.name, Client.email, Client.phone,
+                                    Client.created_at).filter(Client.user_id == user_id):
+            document = ' '.join(part or '' for part in (row.name, row.email, row.phone))
+            candidates.append((document, {
+                'type': 'client', 'id': row.id, 'title': row.name, 'subtitle': row.email,
+                'status': None, 'created_at': row.created_at,
+            }))
+    if search_type in ('all', 'invoices'):
+        for row in db.session.query(Invoice.id, Invoice.invoice_number, Invoice.search_text, Invoice.status,
+                                    Invoice.created_at, Invoice.data).filter(Invoice.user_id == user_id):
+            data = row.data if isinstance(row.data, dict) else {}
+            number = row.invoice_number or data.get('invoice_number')
+            text = row.search_text if row.search_text is not None else search_text(data)
+            document = f"{number or ''} {text or ''}"
+            candidates.append((document, {
+                'type': 'invoice', 'id': row.id, 'title': number, 'subtitle': _recipient(data.get('to')),
+                'status': row.status, 'created_at': row.created_at,
+            }))
+
+    results = []
+    for document, result in candidates:
+        score = _score(document, term, words)
+        if score:
+            result['score'] = score
+            results.append(result)
+    # Best score first, newest first within a score
+    results.sort(key=lambda result: result['created_at'] or datetime.min, reverse=True)
+    results.sort(key=lambda result: result['score'], reverse=True)
+    start = (page - 1) * per_page
+    return results[start:start + per_page + 1]
+
+
+def search(user_id, term, search_type='all', page=1, per_page=20):
+    """
+    One page of ranked results for `term`, best first. Returns
+    (results, has_next); results are dicts with type, id, title, subtitle,
+    status, created_at and score.
+    """
+    if db.engine.dialect.name == 'postgresql':
+        results = _search_postgres(user_id, term, search_type, page, per_page)
+    else:
+        results = _search_in_process(user_id, term, search_type, page, per_page)
+
+    has_next = len(results) > per_page
+    results = results[:per_page]
+    for result in results:
+        result['id'] = str(result['id'])
+        result['created_at'] = result['created_at'].isoformat() if result['created_at'] else None
+    return results, has_next
@@ -1,6 +1,6 @@
 from flask import Blueprint, request, jsonify, g
 from message import send_email
-from models import User  # adjust import to where your User model lives\
+from user_loader import load_user
 
 support_bp = Blueprint("support", __name__)
 
@@ -17,7 +17,7 @@ def support_request():
             return jsonify({"success": False, "error": "Missing required fields"}), 400
 
         # Get user (adjust depending on your auth system)
-        user = User.query.filter_by(id=user_id).first() if user_id else None
+        user = load_user(user_id) if user_id else None
         if not user:
             return jsonify({"success": False, "error": "User not found"}), 404
 
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+"""
+Mark sent invoices past their due date as overdue.
+
+Each batch is one UPDATE ... WHERE id IN (SELECT ... LIMIT n FOR UPDATE
+SKIP LOCKED) RETURNING over ix_invoices_status_due_date - no ORM objects
+are loaded - followed by one multi-row notification insert and the
+matching dashboard rollup deltas, all in the batch's transaction. After
+each commit the changes are published as events (event_stream.py); they
+reach open streams only with EVENTS_BACKEND=postgres, since this runs in
+its own process.
+
+    python sweep_overdue_invoices.py                    # one pass (cron)
+    python sweep_overdue_invoices.py --interval 300     # keep sweeping every 5 minutes
+    python sweep_overdue_invoices.py --batch-size 5000
+"""
+import argparse
+import sys
+import os
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+
+# Add the current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import func, select, update, insert
+
+from db import db
+from models import Invoice, Notification
+from dashboard_rollups import invoice_currency_expr, record_rollup_changes
+from bulk_operations import invoice_rollup_changes
+from unread_counters import add_unread
+from event_stream import invoice_status_event, notification_event, publish_events
+
+# Import your app instance directly
+from app import app
+
+NOTIFICATION_PREVIEW = 3  # invoice numbers listed in a grouped notification
+
+
+def overdue_notifications(rows):
+    """One notification per user for the invoices that just went overdue"""
+    by_user = {}
+    for row in rows:
+        by_user.setdefault(row.user_id, []).append(row)
+
+    notifications = []
+    for user_id, invoices in by_user.items():
+        if len(invoices) == 1:
+            invoice = invoices[0]
+            notifications.append({
+                'id': uuid.uuid4(),
+                'user_id': user_id,
+                'title': 'Invoice Overdue',
+                'message': f"Invoice {invoice.invoice_number or invoice.id} is now overdue",
+                'type': 'warning',
+                'related_entity_type': 'invoice',
+                'related_entity_id': invoice.id,
+            })
+            continue
+
+        numbers = [str(invoice.invoice_number or invoice.id) for invoice in invoices[:NOTIFICATION_PREVIEW]]
+        listed = ', '.join(numbers)
+        if len(invoices) > NOTIFICATION_PREVIEW:
+            listed += f" and {len(invoices) - NOTIFICATION_PREVIEW} more"
+        notifications.append({
+            'id': uuid.uuid4(),
+            'user_id': user_id,
+            'title': 'Invoices Overdue',
+            'message': f"{len(invoices)} invoices are now overdue: {listed}",
+            'type': 'warning',
+            'related_entity_type': None,
+            'related_entity_id': None,
+        })
+    return notifications
+
+
+def sweep_batch(today, batch_size):
+    """Flip one batch of overdue invoices; returns (RETURNING rows, notifications inserted)"""
+    due = select(Invoice.id).where(
+        Invoice.status == 'sent',
+        Invoice.due_date < today
+    ).order_by(Invoice.due_date).limit(batch_size).with_for_update(skip_locked=True)
+
+    rows = db.session.execute(
+        update(Invoice.__table__)
+        .where(Invoice.id.in_(due.scalar_subquery()), Invoice.status == 'sent')
+        .values(status='overdue', updated_at=datetime.utcnow())
+        .returning(
+            Invoice.id,
+            Invoice.user_id,
+            func.coalesce(Invoice.invoice_number, Invoice.data['invoice_number'].as_string()).label('invoice_number'),
+            invoice_currency_expr().label('currency'),
+            Invoice.total
+        )
+    ).all()
+    if not rows:
+        return [], []
+
+    notifications = overdue_notifications(rows)
+    db.session.execute(insert(Notification), notifications)
+    deltas, rebuild = invoice_rollup_changes(rows, 'overdue', old_status='sent')
+    record_rollup_changes(deltas, rebuild)
+    return rows, notifications
+
+
+def sweep_overdue_invoices(batch_size=1000):
+    """One pass over every sent invoice past due, one committed batch at a time"""
+
+    with app.app_context():
+        today = datetime.utcnow().date()
+        swept = 0
+
+        while True:
+            try:
+                rows, notifications = sweep_batch(today, batch_size)
+                db.session.commit()
+                add_unread(Counter(notification['user_id'] for notification in notifications))
+                publish_events(
+                    [invoice_status_event(row.user_id, row.id, row.invoice_number, 'sent', 'overdue') for row in rows]
+                    + [notification_event(notification) for notification in notifications]
+                )
+            except Exception as e:
+                db.session.rollback()
+                print(f"❌ Error sweeping overdue invoices: {str(e)}")
+                return swept
+
+            swept += len(rows)
+            if len(rows) < batch_size:
+                break
+            print(f"   ... {swept} invoices marked overdue")
+
+        print(f"✅ Marked {swept} invoices overdue")
+        return swept
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Mark sent invoices past their due date as overdue")
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--interval', type=int, default=0, help="seconds between sweeps; 0 runs once")
+    args = parser.parse_args()
+
+    while True:
+        sweep_overdue_invoices(batch_size=args.batch_size)
+        if not args.interval:
+            break
+        time.sleep(args.interval)
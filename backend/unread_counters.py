@@ -0,0 +1,206 @@
+# unread_counters.py
+"""
+Cached per-user unread notification counts.
+
+unread_count(user_id) answers from the counter store and only runs the
+COUNT query when the user has no counter yet (or it expired). Every
+committed change adjusts the stored counter instead of dropping it:
+    notification written         add_unread({user: +n})
+    marked read / deleted        add_unread({user: -n}) for the unread ones
+    all marked read              set_unread(user, 0)
+Deltas for a user without a counter are skipped; the next read counts.
+
+Stores (UNREAD_COUNTER_BACKEND):
+    memory (default)  per process. Changes made by other processes (the
+                      overdue sweeper, other gunicorn workers) show up when
+                      the entry expires after UNREAD_COUNT_TTL seconds.
+    redis             shared by every process through REDIS_URL.
+
+wait_for_change() backs the long-poll endpoint: it sleeps on an in-process
+condition that every change in this process wakes, re-reading the store
+every UNREAD_WAIT_RECHECK seconds to catch changes made elsewhere, and
+returns as soon as the count differs from what the client already has.
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+
+from db import db
+from models import Notification
+
+try:
+    import redis
+except ImportError:  # optional dependency, only needed for UNREAD_COUNTER_BACKEND=redis
+    redis = None
+
+UNREAD_COUNT_TTL = float(os.getenv('UNREAD_COUNT_TTL', '60'))
+UNREAD_WAIT_RECHECK = float(os.getenv('UNREAD_WAIT_RECHECK', '5'))
+UNREAD_WAIT_TIMEOUT = float(os.getenv('UNREAD_WAIT_TIMEOUT', '25'))
+# Each waiting long-poll holds a gthread worker thread; keep some for normal requests
+UNREAD_MAX_WAITERS = int(os.getenv('UNREAD_MAX_WAITERS', '2'))
+
+
+class MemoryCounterStore:
+    """In-process counters with a TTL"""
+
+    def __init__(self, ttl=UNREAD_COUNT_TTL):
+        self.ttl = ttl
+        self._counts = {}  # user_id -> (count, expires_at)
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._counts.get(user_id)
+            if entry is None:
+                return None
+            if entry[1] < time.monotonic():
+                del self._counts[user_id]
+                return None
+            return entry[0]
+
+    def set(self, user_id, count):
+        with self._lock:
+            self._counts[user_id] = (max(count, 0), time.monotonic() + self.ttl)
+
+    def add(self, user_id, delta):
+        with self._lock:
+            entry = self._counts.get(user_id)
+            if entry is not None:
+                self._counts[user_id] = (max(entry[0] + delta, 0), entry[1])
+
+    def delete(self, user_id):
+        with self._lock:
+            self._counts.pop(user_id, None)
+
+
+class RedisCounterStore:
+    """Counters shared by every process through a redis-py client"""
+
+    # INCRBY only when the key exists, never below zero
+    ADD_SCRIPT = """
+        if redis.call('EXISTS', KEYS[1]) == 1 then
+            local count = redis.call('INCRBY', KEYS[1], ARGV[1])
+            if count < 0 then redis.call('SET', KEYS[1], 0, 'KEEPTTL') end
+        end
+    """
+
+    def __init__(self, client, prefix='envoyce:unread:', ttl=24 * 3600):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def get(self, user_id):
+        value = self.client.get(self.prefix + user_id)
+        return int(value) if value is not None else None
+
+    def set(self, user_id, count):
+        self.client.set(self.prefix + user_id, max(count, 0), ex=self.ttl)
+
+    def add(self, user_id, delta):
+        self.client.eval(self.ADD_SCRIPT, 1, self.prefix + user_id, delta)
+
+    def delete(self, user_id):
+        self.client.delete(self.prefix + user_id)
+
+
+def create_counter_store():
+    """
+    Build the store from the environment:
+        UNREAD_COUNTER_BACKEND  memory (default) | redis
+        REDIS_URL               server for the redis backend
+    """
+    kind = os.getenv('UNREAD_COUNTER_BACKEND', 'memory').lower()
+    if kind == 'redis':
+        if redis is None:
+            raise RuntimeError("UNREAD_COUNTER_BACKEND=redis requires the 'redis' package")
+        store = RedisCounterStore(redis.Redis.from_url(os.environ['REDIS_URL']))
+    else:
+        store = MemoryCounterStore()
+    logging.info(f"Unread counters using {type(store).__name__}")
+    return store
+
+
+store = create_counter_store()
+
+_changed = threading.Condition()
+_version = 0  # bumped on every change in this process, under _changed
+_waiters = threading.BoundedSemaphore(UNREAD_MAX_WAITERS) if UNREAD_MAX_WAITERS > 0 else None
+
+
+def _key(user_id):
+    return str(uuid.UUID(str(user_id)))
+
+
+def _notify_waiters():
+    global _version
+    with _changed:
+        _version += 1
+        _changed.notify_all()
+
+
+def count_unread(user_id):
+    """The COUNT query, bypassing the store"""
+    return Notification.query.filter_by(user_id=uuid.UUID(str(user_id)), is_read=False).count()
+
+
+def unread_count(user_id):
+    """Unread notifications of a user, from the store when it has them"""
+    key = _key(user_id)
+    count = store.get(key)
+    if count is None:
+        count = count_unread(key)
+        store.set(key, count)
+    return count
+
+
+def add_unread(deltas):
+    """Apply committed {user_id: delta} changes to the stored counters"""
+    changed = False
+    for user_id, delta in deltas.items():
+        if delta:
+            store.add(_key(user_id), delta)
+            changed = True
+    if changed:
+        _notify_waiters()
+
+
+def set_unread(user_id, count):
+    """Store a known, committed count"""
+    store.set(_key(user_id), count)
+    _notify_waiters()
+
+
+def forget_unread(user_id):
+    """Drop a counter whose change is not known exactly; the next read counts"""
+    store.delete(_key(user_id))
+    _notify_waiters()
+
+
+def wait_for_change(user_id, seen, timeout=UNREAD_WAIT_TIMEOUT):
+    """
+    Block until the unread count differs from `seen` or `timeout` passes.
+    Returns (count, changed), or None when too many requests are already
+    waiting and the caller should answer right away instead.
+    """
+    if _waiters is None or not _waiters.acquire(blocking=False):
+        return None
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            with _changed:
+                version = _version
+            count = unread_count(user_id)
+            # Do not keep a pooled connection checked out while this thread sleeps
+            db.session.remove()
+            if count != seen:
+                return count, True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return count, False
+            with _changed:
+                if _version == version:
+                    _changed.wait(min(remaining, UNREAD_WAIT_RECHECK))
+    finally:
+        _waiters.release()
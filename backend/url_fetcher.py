@@ -0,0 +1,176 @@
+# url_fetcher.py
+"""
+Caching url_fetcher for WeasyPrint.
+
+WeasyPrint resolves every stylesheet, font and image a template references
+through its url_fetcher on every render. This wraps the default fetcher
+with a byte-bounded in-memory LRU so repeated renders in the same process
+read those resources from memory. Entries expire per category:
+
+    template  files under backend/templates
+    static    files under backend/static
+    logo      logo cache files and Supabase storage URLs
+    remote    any other http(s) resource
+    file      any other local file
+
+data: URLs are passed straight through. One fetcher is shared by every
+render in a process (pool workers each get their own).
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATES_DIR = os.path.join(BACKEND_DIR, 'templates')
+STATIC_DIR = os.path.join(BACKEND_DIR, 'static')
+
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024  # 32 MB
+DEFAULT_TTLS = {
+    'template': 60,
+    'static': 3600,
+    'logo': 24 * 3600,   # logo cache files are content-addressed
+    'remote': 600,
+    'file': 60,
+}
+
+
+def _file_path(url):
+    from urllib.parse import unquote, urlparse
+
+    return os.path.abspath(unquote(urlparse(url).path))
+
+
+class CachingURLFetcher:
+    """Callable url_fetcher with a bounded, TTL-aware resource cache"""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, ttls=None, ssl_context=None, timeout=10):
+        from logo_store import logo_cache_dir
+
+        self.max_bytes = max_bytes
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.ssl_context = ssl_context
+        self.timeout = timeout
+        self.logo_dir = os.path.abspath(logo_cache_dir())
+        self.supabase_storage = (os.getenv('SUPABASE_URL') or '').rstrip('/') + '/storage/v1/object/'
+
+        self._items = OrderedDict()  # url -> (result, expires_at, size, category)
+        self._size = 0
+        self._lock = threading.Lock()
+        self._metrics = {category: {'hits': 0, 'misses': 0, 'expired': 0, 'bytes_fetched': 0}
+                         for category in self.ttls}
+
+    def category(self, url):
+        if url.startswith('file:'):
+            path = _file_path(url)
+            for category, directory in (('template', TEMPLATES_DIR), ('static', STATIC_DIR), ('logo', self.logo_dir)):
+                if path.startswith(directory + os.sep):
+                    return category
+            return 'file'
+        if self.supabase_storage != '/storage/v1/object/' and url.startswith(self.supabase_storage):
+            return 'logo'
+        return 'remote'
+
+    def _lookup(self, url, category):
+        with self._lock:
+            entry = self._items.get(url)
+            if entry is None:
+                self._metrics[category]['misses'] += 1
+                return None
+            result, expires_at, size, _ = entry
+            if expires_at <= time.monotonic():
+                del self._items[url]
+                self._size -= size
+                self._metrics[category]['expired'] += 1
+                self._metrics[category]['misses'] += 1
+                return None
+            self._items.move_to_end(url)
+            self._metrics[category]['hits'] += 1
+            return result
+
+    def _store(self, url, category, result):
+        size = len(result['string'])
+        with self._lock:
+            self._metrics[category]['bytes_fetched'] += size
+            if size > self.max_bytes:
+                return
+            old = self._items.pop(url, None)
+            if old is not None:
+                self._size -= old[2]
+            self._items[url] = (result, time.monotonic() + self.ttls[category], size, category)
+            self._size += size
+            while self._size > self.max_bytes and self._items:
+                _, evicted = self._items.popitem(last=False)
+                self._size -= evicted[2]
+
+    def fetch(self, url):
+        from weasyprint import default_url_fetcher
+
+        return default_url_fetcher(url, timeout=self.timeout, ssl_context=self.ssl_context)
+
+    def __call__(self, url):
+        if url.startswith('data:'):
+            return self.fetch(url)
+
+        category = self.category(url)
+        cached = self._lookup(url, category)
+        if cached is not None:
+            return dict(cached)
+
+        result = self.fetch(url)
+        if 'file_obj' in result:
+            # Buffer the body so it can be handed out again
+            file_obj = result.pop('file_obj')
+            try:
+                result['string'] = file_obj.read()
+            finally:
+                file_obj.close()
+        self._store(url, category, result)
+        return dict(result)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'entries': len(self._items),
+                'size_bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'categories': {category: dict(metrics, ttl=self.ttls[category])
+                               for category, metrics in self._metrics.items()},
+            }
+
+
+_fetcher = None
+_fetcher_lock = threading.Lock()
+
+
+def get_url_fetcher():
+    """
+    The process-wide fetcher, built on first use:
+        RESOURCE_CACHE_MAX_BYTES   size bound of the cache
+        RESOURCE_TTL_<CATEGORY>    per-category TTL in seconds
+    """
+    global _fetcher
+    with _fetcher_lock:
+        if _fetcher is None:
+            import ssl
+            import certifi
+
+            ttls = {category: int(os.getenv(f'RESOURCE_TTL_{category.upper()}', ttl))
+                    for category, ttl in DEFAULT_TTLS.items()}
+            _fetcher = CachingURLFetcher(
+                max_bytes=int(os.getenv('RESOURCE_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)),
+                ttls=ttls,
+                ssl_context=ssl.create_default_context(cafile=certifi.where()),
+            )
+        return _fetcher
+
+
+def resource_cache_stats():
+    """Stats of this process's fetcher; submitted to pool workers by the stats endpoint"""
+    return get_url_fetcher().stats()
@@ -0,0 +1,174 @@
+# user_loader.py
+"""
+One way to get a User by id: load_user(user_id).
+
+Two layers sit in front of the primary-key query:
+    - a per-request map on flask.g, so every lookup in a request returns
+      the same session-attached instance without another query
+    - a per-process cache of the user's column values, kept for
+      USER_CACHE_TTL seconds (default 30, 0 disables it). A hit is
+      rebuilt into a User and merged into the session with load=False,
+      which attaches it without a SELECT.
+
+Cached entries are dropped when a User is updated or deleted through the
+session (profile, plan and Paystack subaccount changes all go through
+user.<attr> = ...): an after_flush hook notes the ids and an after_commit
+hook evicts them. Writes that bypass the ORM must call invalidate_user().
+Each gunicorn worker has its own cache, so another worker can serve a
+stale user for at most the TTL. Columns that must never be stale, because
+they gate what the user may do (plan, email_verified), are left out of
+the cached copy; the first access on a cache hit loads them with one
+narrow SELECT.
+"""
+import copy
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from flask import g, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from db import db
+from models import User
+
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', '30'))
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '10000'))
+
+# Changed by billing and verification flows in whichever worker handles them
+_UNCACHED = ('plan', 'email_verified')
+_COLUMNS = tuple(column.key for column in User.__table__.columns if column.key not in _UNCACHED)
+
+
+class UserCache:
+    """In-process LRU of user column values with a TTL"""
+
+    def __init__(self, ttl=USER_CACHE_TTL, max_size=USER_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._items.get(user_id)
+            if entry is None:
+                return None
+            expires, values = entry
+            if expires < time.monotonic():
+                del self._items[user_id]
+                return None
+            self._items.move_to_end(user_id)
+            return values
+
+    def set(self, user_id, values):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._items[user_id] = (time.monotonic() + self.ttl, values)
+            self._items.move_to_end(user_id)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def delete(self, user_id):
+        with self._lock:
+            self._items.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+user_cache = UserCache()
+
+
+def _as_uuid(user_id):
+    if isinstance(user_id, uuid.UUID):
+        return user_id
+    try:
+        return uuid.UUID(str(user_id))
+    except ValueError:
+        return None
+
+
+def _request_users():
+    if not has_app_context():
+        return None
+    if '_loaded_users' not in g:
+        g._loaded_users = {}
+    return g._loaded_users
+
+
+def _from_cache(values):
+    """A session-attached User built from cached column values, without a query"""
+    user = User(**copy.deepcopy(values))  # deep copy: callers mutate user.data in place
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+
+def load_user(user_id):
+    """The User with this id, or None if there is none (or the id is not a UUID)"""
+    user_id = _as_uuid(user_id)
+    if user_id is None:
+        return None
+
+    loaded = _request_users()
+    if loaded is not None and user_id in loaded:
+        return loaded[user_id]
+
+    values = user_cache.get(user_id)
+    if values is not None:
+        user = _from_cache(values)
+    else:
+        user = db.session.get(User, user_id)
+        if user is not None:
+            user_cache.set(user_id, copy.deepcopy({key: getattr(user, key) for key in _COLUMNS}))
+
+    if loaded is not None:
+        loaded[user_id] = user
+    return user
+
+
+def invalidate_user(user_id):
+    """Forget a user in this request and in the process cache"""
+    user_id = _as_uuid(user_id)
+    if user_id is None:
+        return
+    user_cache.delete(user_id)
+    loaded = _request_users()
+    if loaded is not None:
+        loaded.pop(user_id, None)
+
+
+# ─── Invalidation on write ──────────────────────────────────────────────────
+
+def _note_user_changes(session, flush_context):
+    changed = session.info.setdefault('changed_user_ids', set())
+    for obj in session.dirty:
+        if isinstance(obj, User):
+            changed.add(obj.id)
+    for obj in session.deleted:
+        if isinstance(obj, User):
+            changed.add(obj.id)
+            loaded = _request_users()
+            if loaded is not None:
+                loaded.pop(obj.id, None)
+
+
+def _evict_changed_users(session):
+    for user_id in session.info.pop('changed_user_ids', ()):
+        user_cache.delete(user_id)
+
+
+def _forget_changed_users(session, previous_transaction):
+    session.info.pop('changed_user_ids', None)
+
+
+def register_user_cache_invalidation():
+    """Install the session hooks that evict users changed through the ORM"""
+    if not event.contains(Session, 'after_flush', _note_user_changes):
+        event.listen(Session, 'after_flush', _note_user_changes)
+        event.listen(Session, 'after_commit', _evict_changed_users)
+        event.listen(Session, 'after_soft_rollback', _forget_changed_users)
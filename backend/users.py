@@ -1,7 +1,7 @@
 # users.py
 from flask import request, jsonify
 from db import db
-from models import User
+from user_loader import load_user
 from datetime import datetime
 import uuid
 import logging
@@ -71,7 +71,7 @@ class Users:
             if not Users.validate_uuid(user_id):
                 return jsonify({'success': False, 'error': 'Invalid user ID format'}), 400
 
-            user = User.query.get(user_id)
+            user = load_user(user_id)
             if not user:
                 return jsonify({'success': False, 'error': 'User not found'}), 404
 
@@ -101,7 +101,7 @@ class Users:
             if not Users.validate_uuid(user_id):
                 return jsonify({'success': False, 'error': 'Invalid user ID format'}), 400
 
-            user = User.query.get(user_id)
+            user = load_user(user_id)
             if not user:
                 return jsonify({'success': False, 'error': 'User not found'}), 404
 
@@ -137,7 +137,7 @@ class Users:
             if not Users.validate_uuid(user_id):
                 return jsonify({'success': False, 'error': 'Invalid user ID format'}), 400
 
-            user = User.query.get(user_id)
+            user = load_user(user_id)
             if not user:
                 return jsonify({'success': False, 'error': 'User not found'}), 404
 
@@ -172,7 +172,7 @@ class Users:
             if not Users.validate_uuid(user_id):
                 return jsonify({'success': False, 'error': 'Invalid user ID format'}), 400
 
-            user = User.query.get(user_id)
+            user = load_user(user_id)
             if not user:
                 return jsonify({'success': False, 'error': 'User not found'}), 404
 
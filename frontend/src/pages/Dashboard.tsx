@@ -18,6 +18,7 @@ import Navbar from "../components/Navbar";
 
 // ─── Helpers ──────────────────────────────────────────────────────────────────
 const calculateInvoiceTotal = (invoice: any): number => {
+  if (typeof invoice.total_amount === "number") return invoice.total_amount;
   const data = invoice.data || {};
   const items = data.items || [];
   let subtotal = items.reduce(
@@ -197,7 +198,10 @@ const RecentInvoices = ({
         {invoices.length > 0 ? (
           invoices.map((invoice: any) => {
             const statusConfig = getStatusConfig(invoice.status);
-            const customerName = invoice.data?.to?.split("\n")[0] || "Unknown";
+            const customerName =
+              invoice.client_name ||
+              invoice.data?.to?.split("\n")[0] ||
+              "Unknown";
             const initials = getInitials(customerName);
             const total = calculateInvoiceTotal(invoice);
             const sym = getCurrencySymbol(invoice, currencyOptions);
@@ -218,7 +222,7 @@ const RecentInvoices = ({
                       {customerName}
                     </p>
                     <p className="text-sm text-gray-400">
-                      #{invoice.data?.invoice_number || "—"} ·{" "}
+                      #{invoice.invoice_number || invoice.data?.invoice_number || "—"} ·{" "}
                       {formatDate(invoice.issued_date || invoice.created_at)}
                     </p>
                   </div>
@@ -578,34 +582,40 @@ const Dashboard = () => {
 
     const invoices: any[] = dashboardData.invoices || [];
 
+    // The summary endpoint aggregates server-side; older responses only
+    // carried the raw invoice list, so fall back to computing from it.
     const currencyMetrics: Record<
       string,
       { total_revenue: number; total_outstanding: number }
-    > = {};
+    > = { ...(dashboardData.currency_metrics || {}) };
+
+    if (!dashboardData.currency_metrics) {
+      invoices.forEach((invoice) => {
+        const code = getCurrencyCode(invoice);
+        if (!currencyMetrics[code]) {
+          currencyMetrics[code] = { total_revenue: 0, total_outstanding: 0 };
+        }
+        const total = calculateInvoiceTotal(invoice);
+        const status = (invoice.status || "").toLowerCase();
+        if (status === "paid") {
+          currencyMetrics[code].total_revenue += total;
+        } else if (
+          ["sent", "overdue", "in progress", "unpaid"].includes(status)
+        ) {
+          currencyMetrics[code].total_outstanding += total;
+        }
+      });
+    }
 
-    invoices.forEach((invoice) => {
-      const code = getCurrencyCode(invoice);
-      if (!currencyMetrics[code]) {
-        currencyMetrics[code] = { total_revenue: 0, total_outstanding: 0 };
-      }
-      const total = calculateInvoiceTotal(invoice);
-      const status = (invoice.status || "").toLowerCase();
-      if (status === "paid") {
-        currencyMetrics[code].total_revenue += total;
-      } else if (
-        ["sent", "overdue", "in progress", "unpaid"].includes(status)
-      ) {
-        currencyMetrics[code].total_outstanding += total;
-      }
-    });
-
-    const recentInvoices = [...invoices]
-      .sort(
-        (a, b) =>
-          new Date(b.created_at || b.issued_date || 0).getTime() -
-          new Date(a.created_at || a.issued_date || 0).getTime(),
-      )
-      .slice(0, 5);
+    const recentInvoices =
+      dashboardData.recent_invoices ||
+      [...invoices]
+        .sort(
+          (a, b) =>
+            new Date(b.created_at || b.issued_date || 0).getTime() -
+            new Date(a.created_at || a.issued_date || 0).getTime(),
+        )
+        .slice(0, 5);
 
     return {
       totalInvoices: dashboardData.total_invoices ?? invoices.length,